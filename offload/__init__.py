@@ -15,6 +15,7 @@ else:
     APP_DATA_PATH = Path(__file__).parent
 REPORTS_PATH = APP_DATA_PATH / "reports"
 LOGS_PATH = APP_DATA_PATH / "logs"
+CATALOG_PATH = APP_DATA_PATH / "catalog.db"
 VERSION = "0.1.4"  # x-release-please-version
 EXCLUDE_FILES = [
     "MEDIAPRO.XML",
@@ -113,6 +114,7 @@ EXCLUDE_FILES = [
     "store_generation.",
     "store_generation.\r",
     ".Spotlight-V100",
+    ".fseventsd",
 ]
 
 _script_data = Path(os.getcwd()) / "data"
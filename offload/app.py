@@ -6,21 +6,388 @@ This script is used for transferring files and verifying them using a checksum.
 """
 
 import argparse
+import collections
+import concurrent.futures
 import csv
+import errno
+import html
+import itertools
+import json
 import logging
 import os
+import queue
+import threading
 import time
 from datetime import datetime
 from pathlib import Path
 
 from PyQt5.QtCore import QThread, pyqtSignal
 
-from offload import APP_DATA_PATH, EXCLUDE_FILES, REPORTS_PATH, utils
+from offload import APP_DATA_PATH, CATALOG_PATH, EXCLUDE_FILES, REPORTS_PATH, catalog, utils
+from offload.progress import ProgressReporter
 from offload.utils import File, FileList, Settings
 
+# Result of transferring a file: the status and (source, destination) checksums for the main
+# destination and a status for each backup destination
+TransferResult = collections.namedtuple(
+    "TransferResult", "status checksums backups", defaults=(None, ())
+)
+
+# Compiled folder structure, prefix and filename templates, and the exif fields they use
+NamingTemplates = collections.namedtuple("NamingTemplates", "structure prefix filename exif")
+
+
+class PlannedTransfer(
+    collections.namedtuple(
+        "PlannedTransfer",
+        "source destination action backups checksum origin",
+        defaults=((), None, None),
+    )
+):
+    """What to do with a source file
+
+    The action is transfer, link (to origin, an identical file in the library), backup (the
+    file only needs to be written to some backups) or skip. Backups are (File, status) pairs
+    as returned by Offloader._resolve_backups and checksum is the checksum of the source if it
+    is already known.
+    """
+
+    __slots__ = ()
+
+    @property
+    def targets(self):
+        """Return the Files that will be written"""
+        if self.action == "skip":
+            return []
+        targets = [] if self.action == "backup" else [self.destination]
+        targets.extend(f for f, status in self.backups if status is None)
+        return targets
+
+    def to_dict(self):
+        """Return the transfer as a dict that can be written to JSON"""
+        return {
+            "source": str(self.source.path),
+            "size": self.source.size,
+            "mtime_ns": self.source.mtime_ns,
+            "destination": str(self.destination.path),
+            "action": self.action,
+            "backups": [[str(f.path) if f else None, status] for f, status in self.backups],
+            "checksum": self.checksum,
+            "origin": str(self.origin) if self.origin else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a transfer from a dict returned by to_dict
+
+        A source file that has changed since the transfer was planned gets no destination, so
+        it's planned again when the transfer is run.
+        """
+        source = File(data["source"])
+        if source.size != data["size"] or source.mtime_ns != data["mtime_ns"]:
+            logging.warning(f"{source.path} has changed since it was planned")
+            return cls(source, None, "transfer")
+        return cls(
+            source,
+            File(data["destination"], lazy=True),
+            data["action"],
+            [(File(p, lazy=True) if p else None, status) for p, status in data["backups"]],
+            data["checksum"],
+            data["origin"],
+        )
+
+
+class TransferPlan:
+    def __init__(self, source, destination, transfers=()):
+        """The planned transfers of an offload, in the order they will be transferred
+
+        Args:
+            source: the source folder
+            destination: the destination folder
+            transfers: PlannedTransfers
+        """
+        self.source = Path(source)
+        self.destination = Path(destination)
+        self.transfers = list(transfers)
+
+    def __iter__(self):
+        return iter(self.transfers)
+
+    def __len__(self):
+        return len(self.transfers)
+
+    @property
+    def count(self) -> int:
+        """Return the number of files in the plan"""
+        return len(self.transfers)
+
+    @property
+    def size(self) -> int:
+        """Return the number of bytes that will be written"""
+        return sum(t.source.size * len(t.targets) for t in self.transfers if t.action != "link")
+
+    def save(self, path):
+        """Write the plan to a JSON file
+
+        Args:
+            path: path to the JSON file
+
+        Returns:
+            Path: the path of the JSON file
+        """
+        path = Path(path)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        data = {
+            "source": str(self.source),
+            "destination": str(self.destination),
+            "count": self.count,
+            "size": self.size,
+            "transfers": [t.to_dict() for t in self.transfers],
+        }
+        with path.open("w") as f:
+            json.dump(data, f, indent=2)
+        logging.info(f"Plan saved to {path}")
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Read a plan from a JSON file
+
+        Source files that have changed since the plan was saved get no destination, so they're
+        planned again when the plan is run.
+
+        Args:
+            path: path to the JSON file
+
+        Returns:
+            TransferPlan: the plan
+        """
+        with Path(path).open() as f:
+            data = json.load(f)
+        transfers = [PlannedTransfer.from_dict(t) for t in data["transfers"]]
+        return cls(data["source"], data["destination"], transfers)
+
+
+# An offload read back from a session journal: the plan to run, the offsets that partial copies
+# can be continued from and the sources that are already recorded as finished
+ResumedSession = collections.namedtuple("ResumedSession", "path plan offsets finished")
+
+
+class SessionJournal:
+    """Append-only journal of an offload, used to resume it after a crash
+
+    Every line is a JSON record: the session, a planned transfer, a checkpoint of a partial copy
+    or the result of a file. Lines are flushed as they're written and synced to disk at most once
+    per sync interval, so a crash loses at most the last few records and a cut off last line is
+    ignored when the journal is read. Every offload gets a journal of its own, see create().
+    """
+
+    def __init__(self, path: Path, sync_interval=1.0):
+        """
+        Args:
+            path: path to the journal file, records are appended if it exists
+            sync_interval: minimum number of seconds between syncs to disk
+        """
+        self.path = Path(path)
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._synced = time.monotonic()
+
+    @classmethod
+    def create(cls, folder: Path, sync_interval=1.0):
+        """Start a new journal in a folder
+
+        The journal is named after the current time and created exclusively, so offloads that
+        start at the same time never write to the same journal.
+
+        Args:
+            folder: the folder to create the journal in
+            sync_interval: minimum number of seconds between syncs to disk
+
+        Returns:
+            SessionJournal: the new, empty journal
+        """
+        folder = Path(folder)
+        folder.mkdir(exist_ok=True, parents=True)
+        stem = datetime.now().strftime("%y%m%d%H%M%S")
+        for n in itertools.count():
+            path = folder / (f"{stem}_journal.jsonl" if n == 0 else f"{stem}_{n}_journal.jsonl")
+            try:
+                file = path.open("x")
+            except FileExistsError:
+                continue
+            journal = cls(path, sync_interval)
+            journal._file = file
+            return journal
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write(self, record, sync=False):
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(exist_ok=True, parents=True)
+                cut_off = False
+                if self.path.is_file() and self.path.stat().st_size:
+                    with self.path.open("rb") as f:
+                        f.seek(-1, os.SEEK_END)
+                        cut_off = f.read(1) != b"\n"
+                self._file = self.path.open("a")
+                if cut_off:
+                    # Keep a record cut off by a crash from running into the next one
+                    self._file.write("\n")
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+            now = time.monotonic()
+            if sync or now - self._synced >= self.sync_interval:
+                os.fsync(self._file.fileno())
+                self._synced = now
+
+    def session(self, source, destination):
+        """Record the source and destination of the offload"""
+        self._write(
+            {"event": "session", "source": str(source), "destination": str(destination)},
+            sync=True,
+        )
+
+    def planned(self, planned: PlannedTransfer):
+        """Record a planned transfer"""
+        self._write({"event": "planned", **planned.to_dict()})
+
+    def copied(self, source_file: File, dest_file: File, offset):
+        """Record that a copy is written and synced to disk up to an offset"""
+        self._write(
+            {
+                "event": "copied",
+                "source": str(source_file.path),
+                "destination": str(dest_file.path),
+                "offset": offset,
+            },
+            sync=True,
+        )
+
+    def finished(self, source_file: File, dest_file: File, result):
+        """Record the result of a file along with the size and modification time of the copy
+
+        Args:
+            source_file: the transferred file
+            dest_file: the destination file
+            result: the TransferResult of the file
+        """
+        st = utils.regular_file_stat(dest_file.path)
+        self._write(
+            {
+                "event": "finished",
+                "source": str(source_file.path),
+                "destination": str(dest_file.path),
+                "status": result.status,
+                "checksums": list(result.checksums) if result.checksums else None,
+                "backups": list(result.backups),
+                "size": st.st_size if st else None,
+                "mtime_ns": st.st_mtime_ns if st else None,
+            }
+        )
+
+    def close(self):
+        """Sync the journal to disk and close it"""
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    @staticmethod
+    def latest():
+        """Return the path of the most recent journal in the reports folder, or None"""
+        journals = list(REPORTS_PATH.glob("*_journal.jsonl"))
+        return max(journals, key=lambda p: p.stat().st_mtime_ns) if journals else None
+
+    @classmethod
+    def load(cls, path):
+        """Read a journal back to resume its offload
+
+        Files that finished successfully are planned as skipped with the checksums from the
+        journal, as long as the copy still has the size and modification time it had when it
+        was finished, so they're neither compared nor hashed again. All other files are planned
+        as they were, or planned again if the source has changed since.
+
+        Args:
+            path: path to the journal file
+
+        Returns:
+            ResumedSession: the plan, the offsets and the finished sources
+        """
+        path = Path(path)
+        session = None
+        planned = {}
+        offsets = {}
+        finished = {}
+        with path.open() as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(f"Ignoring a cut off record in {path}")
+                    continue
+                event = record["event"]
+                if event == "session":
+                    session = record
+                elif event == "planned":
+                    planned[record["source"]] = record
+                elif event == "copied":
+                    offsets[record["source"]] = (record["destination"], record["offset"])
+                elif event == "finished":
+                    finished[record["source"]] = record
+                    offsets.pop(record["source"], None)
+        if session is None:
+            raise ValueError(f"{path} is not a session journal")
+
+        transfers = []
+        done = set()
+        for source, record in planned.items():
+            result = finished.get(source)
+            if result is None or not cls._completed(result):
+                transfers.append(PlannedTransfer.from_dict(record))
+                continue
+            done.add(source)
+            source_file = File(source)
+            if source_file.refresh() is None:
+                # Moved to the destination
+                continue
+            checksums = result["checksums"]
+            transfers.append(
+                PlannedTransfer(
+                    source_file,
+                    File(result["destination"], lazy=True),
+                    "skip",
+                    [(None, status) for status in result["backups"]],
+                    checksums[0] if checksums else None,
+                )
+            )
+        logging.info(f"Resuming {path}, {len(done)} of {len(planned)} files are already finished")
+        plan = TransferPlan(session["source"], session["destination"], transfers)
+        return ResumedSession(path, plan, offsets, done)
+
+    @staticmethod
+    def _completed(result):
+        """Return True if a finished record is successful and its copy is unchanged"""
+        if result["status"] not in ("Successful", "Skipped"):
+            return False
+        if not all(status in ("Successful", "Skipped") for status in result["backups"]):
+            return False
+        st = utils.regular_file_stat(result["destination"])
+        return st is not None and (st.st_size, st.st_mtime_ns) == (
+            result["size"],
+            result["mtime_ns"],
+        )
+
 
 class Offloader(QThread):
-    _progress_signal = pyqtSignal(dict)
+    _progress_signal = pyqtSignal(object)
 
     def __init__(
         self,
@@ -32,7 +399,63 @@ class Offloader(QThread):
         prefix=None,
         dryrun=False,
         log_level="info",
+        sort=True,
+        pipeline=False,
+        queue_size=256,
+        workers=1,
+        small_file_size=64 * 1024**2,
+        clone=False,
+        backups=None,
+        skip_policy="size_mtime",
+        preserve_permissions=False,
+        preserve_xattrs=False,
+        catalog=None,
+        dedupe=None,
+        library=None,
+        plan=None,
+        log_summary=False,
+        progress_interval=0.1,
+        source_files=None,
+        resume=None,
     ):
+        """Offload files from a source folder to a destination folder
+
+        Args:
+            source: the folder to offload files from
+            dest: the folder to offload files to
+            mode: copy or move
+            structure: folder structure preset
+            filename: filename preset
+            prefix: filename prefix preset or a custom prefix
+            dryrun: run without changing any files
+            log_level: debug, info or error
+            sort: process files in order of modification date, not used in pipeline mode
+            pipeline: start transferring while the source is still being scanned
+            queue_size: max number of files waiting between the pipeline stages
+            workers: number of files to transfer at the same time
+            small_file_size: files of this size or larger are transferred one at a time
+            clone: clone files, or rename them in move mode, when source and destination are on
+                the same filesystem instead of copying the data
+            backups: list of backup folders, each file is also written to the same path in every
+                backup folder while the source is only read once
+            skip_policy: how to decide that a file already in the destination is the same as
+                the source, see utils.compare_files
+            preserve_permissions: copy permission bits along with the timestamps
+            preserve_xattrs: copy extended attributes along with the timestamps
+            catalog: path to an ingest catalog, files that it lists as offloaded from the same
+                volume to the same destination are skipped without looking at the destination
+            dedupe: skip or hardlink files that already exist anywhere in the destination, None
+                to only look for existing files at the planned path
+            library: path to the library index used for dedupe, defaults to the catalog path
+            plan: a TransferPlan, or the path to a saved plan, to run instead of scanning and
+                planning the source
+            log_summary: log one line per file instead of every step, whatever the log level
+            progress_interval: minimum number of seconds between progress signals
+            source_files: a FileList of the source that is already scanned, the source isn't
+                scanned again
+            resume: a ResumedSession, or the path to a session journal, to continue an offload
+                that was interrupted, the source and destination are taken from the journal
+        """
         super().__init__()
         self.settings = Settings()
         self._logger = utils.setup_logger(log_level)
@@ -58,17 +481,76 @@ class Offloader(QThread):
         self._mode = mode
         self._dryrun = dryrun
         self._exclude = EXCLUDE_FILES
-        self._signal = {"percentage": 0, "action": "", "time": "", "is_finished": False}
+        self._progress_interval = progress_interval
         self._running = True
+        self._control = utils.TransferControl()
+        self._sort = sort
+        self._pipeline = pipeline
+        self._queue_size = queue_size
+        self._workers = max(1, workers)
+        self._small_file_size = small_file_size
+        self._clone = clone
+        self._backups = [Path(p) for p in backups or []]
+        if skip_policy not in utils.SKIP_POLICIES:
+            raise ValueError(f"Unknown skip policy {skip_policy}")
+        self._skip_policy = skip_policy
+        # Invalid templates are reported before the source is scanned
+        self.compile_templates()
+        self._preserve_permissions = preserve_permissions
+        self._preserve_xattrs = preserve_xattrs
+        self._log_summary = log_summary
+        self._catalog_path = Path(catalog) if catalog else None
+        self._catalog = None
+        self._volume = None
+        self._volume_root = None
+        self._ingested = {}
+        self._index = utils.DirectoryIndex()
+        if dedupe not in (None, "skip", "hardlink"):
+            raise ValueError(f"Unknown dedupe mode {dedupe}")
+        self._dedupe = dedupe
+        self._library_path = Path(library or catalog or CATALOG_PATH)
+        self._library = None
+        self._library_update = None
+        self._library_sizes = None
+        self._library_rows = []
+        self._duplicates = {}
+        self._sequence = 0
+        self._templates = None
+
+        # Session journal, written while offloading, a new one is created unless resuming
+        self._journal = None
+        self.journal_path = None
+        self._resume = None
+        self._offsets = {}
 
         # Properties
-        logging.info("Getting list of files")
-        self.source_files = FileList(self._source, exclude=self._exclude)
-        self.source_files.sort()
+        self._plan = None
+        if resume is not None:
+            self._resume = (
+                resume if isinstance(resume, ResumedSession) else SessionJournal.load(resume)
+            )
+            self.journal_path = self._resume.path
+            self._offsets = dict(self._resume.offsets)
+            self._source = self._resume.plan.source
+            self._destination = self._resume.plan.destination
+            self.use_plan(self._add_unplanned(self._resume.plan))
+        elif plan is not None:
+            self.use_plan(plan if isinstance(plan, TransferPlan) else TransferPlan.load(plan))
+        elif source_files is not None:
+            self.use_source_files(source_files)
+        elif self._pipeline:
+            # Files are added while offloading
+            self.source_files = FileList(self._source, exclude=self._exclude, scan=False)
+        else:
+            logging.info("Getting list of files")
+            self.source_files = FileList(self._source, exclude=self._exclude)
+            if self._sort:
+                self.source_files.sort()
 
         # Offload attributes
         self.ol_time_started = 0
         self.ol_bytes_transferred = 0
+        self._progress = ProgressReporter(interval=self._progress_interval)
 
         # Set some variables
         self.destination_folders = []
@@ -77,7 +559,75 @@ class Offloader(QThread):
         self.errored_files = []
 
         # Report
-        self.report = Report()
+        self.report = Report(backups=len(self._backups))
+
+    def use_plan(self, plan):
+        """Run a plan instead of planning the files in the source
+
+        Args:
+            plan: a TransferPlan
+        """
+        self._plan = plan
+        self.source_files = FileList(self._source, exclude=self._exclude, scan=False)
+        for planned in plan:
+            self.source_files.append(planned.source)
+
+    def _add_unplanned(self, plan):
+        """Add the files in the source that a resumed plan doesn't have yet, like the files that
+        weren't scanned yet in pipeline mode, to be planned while offloading
+
+        Args:
+            plan: a TransferPlan
+
+        Returns:
+            TransferPlan: the same plan
+        """
+        planned = {str(t.source.path) for t in plan}
+        files = FileList(self._source, exclude=self._exclude)
+        if self._sort:
+            files.sort()
+        for source_file in files.files:
+            if str(source_file.path) not in planned:
+                plan.transfers.append(PlannedTransfer(source_file, None, "transfer"))
+        return plan
+
+    def use_source_files(self, source_files: FileList):
+        """Offload a list of files that is already scanned instead of scanning the source
+
+        The source is set to the folder the list was scanned from. The whole list is known, so
+        it's not scanned again in pipeline mode either.
+
+        Args:
+            source_files: a FileList
+        """
+        self._source = source_files.path
+        self._pipeline = False
+        self.source_files = source_files
+        if self._sort:
+            self.source_files.sort()
+
+    @property
+    def paused(self):
+        """Return True if the offload is paused"""
+        return self._control.paused
+
+    def pause(self):
+        """Pause the offload, files being transferred stop at the next chunk and are resumed
+        where they stopped"""
+        self._control.pause()
+        logging.info("Offload paused")
+        self._progress.set_action("Paused", force=True)
+
+    def resume(self):
+        """Resume a paused offload"""
+        logging.info("Offload resumed")
+        self._control.resume()
+
+    def cancel(self):
+        """Cancel the offload, files being transferred stop at the next chunk and their partial
+        copies are removed"""
+        self._running = False
+        self._control.cancel()
 
     def update_from_settings(self):
         """Update structure, filename and prefix from settings"""
@@ -126,6 +676,8 @@ class Offloader(QThread):
 
     @property
     def ol_percentage(self):
+        if not self.source_files.size:
+            return 0
         return round((self.ol_bytes_transferred / self.source_files.size) * 100, 2)
 
     @property
@@ -138,180 +690,971 @@ class Offloader(QThread):
 
     @property
     def ol_time_remaining(self):
-        return self.ol_bytes_remaining / self.ol_speed if self.ol_speed else 0
+        """Estimated seconds remaining, see progress.ThroughputEstimator"""
+        return self._progress.snapshot().time_remaining
 
     @property
     def ol_speed(self):
-        return self.ol_bytes_transferred / self.ol_time_elapsed
-
-    def offload(self):
-        """Offload files"""
-        # Offload start time
-        self.ol_time_started = time.time()
-
-        # Get list of files in source folder
-        logging.info(f"Total file size: {self.source_files.hsize}")
-        logging.info(f"Average file size: {utils.convert_size(self.source_files.avg_file_size)}")
-        logging.info("---\n")
-
-        # Iterate over all the files
-        for file_id, source_file in enumerate(self.source_files.files):
-            skip = False
-
-            # Display how far along the transfer we are
-            logging.info(
-                f"Processing file {file_id + 1}/{len(self.source_files.files)} "
-                f"(~{self.ol_percentage}%) | {source_file.filename}"
+        """Smoothed copy rate in bytes per second"""
+        return self._progress.estimator.rate("copy") or 0.0
+
+    def plan_file(self, source_file: File) -> File:
+        """Create the destination File for a source file
+
+        Args:
+            source_file: the file to offload
+
+        Returns:
+            File: the destination file with folder, name and prefix set
+        """
+        record = self.ingested_record(source_file)
+        if record is not None:
+            # The catalog vouches for the destination, so it isn't looked at
+            return File(record[0], stat_result=source_file.stat)
+
+        date = source_file.mdate
+        self._sequence += 1
+        # Only read the exif data if a template uses it
+        values = source_file.template_values(self._templates.exif, self._sequence)
+
+        # Create File object for destination file
+        dest_folder = self._destination / self._templates.structure.format(date=date, **values)
+        prefix = self._templates.prefix.format(date=date, **values) or None
+        dest_file = File(dest_folder / source_file.filename, prefix=prefix, lazy=True)
+
+        # Change filename
+        if self._templates.filename is not None:
+            new_name = self._templates.filename.format(date=date, **values)
+            logging.debug(f"New filename is {new_name}")
+            dest_file.name = new_name
+
+        return dest_file
+
+    def compile_templates(self):
+        """Compile the folder structure, prefix and filename templates for planning"""
+        self._sequence = 0
+        structure = utils.structure_template(self._structure)
+        prefix = utils.PREFIX_TEMPLATES.get(self._prefix, self._prefix)
+        filename = utils.FILENAME_TEMPLATES.get(self._filename, self._filename)
+        if filename and "{" not in filename:
+            # Unknown filename presets
+            filename = "unknown"
+        templates = [
+            utils.Template(structure, today=self._today),
+            utils.Template(prefix, today=self._today),
+            utils.Template(filename, today=self._today) if filename else None,
+        ]
+        fields = set().union(*(t.fields for t in templates if t is not None))
+        self._templates = NamingTemplates(
+            *templates, tuple(fields & utils.TEMPLATE_EXIF_TAGS.keys())
+        )
+        logging.debug(f"Naming templates: {self._templates}")
+
+    def ingested_record(self, source_file: File):
+        """Look up a source file in the ingest catalog
+
+        Args:
+            source_file: the file to offload
+
+        Returns:
+            tuple: (destination path, checksum) or None if the file hasn't been offloaded
+        """
+        if not self._ingested:
+            return None
+        key = (
+            os.path.relpath(source_file.path, self._volume_root),
+            source_file.size,
+            source_file.mtime_ns,
+        )
+        return self._ingested.get(key)
+
+    def open_catalog(self):
+        """Open the ingest catalog and load the files offloaded from the source volume"""
+        self._catalog = catalog.Catalog(self._catalog_path)
+        self._volume, self._volume_root = catalog.volume_fingerprint(self._source)
+        self._ingested = self._catalog.ingested(self._volume, self._destination)
+        for backup in self._backups:
+            # Only skip files that are in every destination
+            ingested = self._catalog.ingested(self._volume, backup)
+            self._ingested = {k: v for k, v in self._ingested.items() if k in ingested}
+        logging.info(f"{len(self._ingested)} files from {self._volume} in the catalog")
+
+    def catalog_file(self, source_file: File, dest_file: File, checksum=None):
+        """Record an offloaded file in the ingest catalog for every destination"""
+        if self.ingested_record(source_file) is not None:
+            return
+        path = os.path.relpath(source_file.path, self._volume_root)
+        relative_path = os.path.relpath(dest_file.path, self._destination)
+        for root in [self._destination, *self._backups]:
+            self._catalog.add(
+                self._volume,
+                path,
+                source_file.size,
+                source_file.mtime_ns,
+                root,
+                root / relative_path,
+                checksum,
             )
 
-            # Send signal to GUI
-            self._signal["percentage"] = int(self.ol_percentage)
-            self._signal["action"] = f"Processing file {file_id + 1}/{len(self.source_files.files)}"
-            self._signal["time"] = self.ol_time_remaining
-            self._progress_signal.emit(self._signal)
+    def open_library(self):
+        """Start updating the library index of the destination in a background thread"""
+        self._library = catalog.LibraryIndex(self._library_path, self._destination)
+        self._library_sizes = None
+        self._library_rows = []
+        self._duplicates = {}
+        self._library_update = concurrent.futures.Future()
 
-            # Create File object for destination file
-            dest_folder = self._destination / utils.destination_folder(
-                source_file.mdate, preset=self._structure
+        def update():
+            try:
+                self._library.update(exclude=self._exclude)
+                self._library_update.set_result(None)
+            except Exception as e:
+                self._library_update.set_exception(e)
+
+        logging.info(f"Updating library index of {self._destination}")
+        threading.Thread(target=update, name="offload-library", daemon=True).start()
+
+    def find_duplicates(self, files):
+        """Look up files in the library index and store the ones that are already in it
+
+        Only files with the same size as a file in the library are hashed.
+
+        Args:
+            files: list of source Files
+        """
+        if self._library_sizes is None:
+            # Wait for the library index to be up to date
+            self._library_update.result()
+            self._library_sizes = self._library.sizes()
+
+        candidates = collections.defaultdict(list)
+        for source_file in files:
+            if source_file.size in self._library_sizes and not self.ingested_record(source_file):
+                candidates[source_file.size, source_file.checksum].append(source_file)
+        for content, path in self._library.find(candidates).items():
+            for source_file in candidates[content]:
+                self._duplicates[source_file] = path
+        logging.debug(f"{len(self._duplicates)} duplicates in the library")
+
+    def link_file(self, source_file: File, dest_file: File, library_path):
+        """Hardlink a file that is already in the library instead of copying it
+
+        Args:
+            source_file: the file to transfer
+            dest_file: the destination file
+            library_path: path to the same file in the library
+
+        Returns:
+            TransferResult: the status and checksums, or None if the file needs to be copied
+        """
+        if self._dryrun:
+            return None
+        dest_file.path.parent.mkdir(exist_ok=True, parents=True)
+        try:
+            os.link(library_path, dest_file.path)
+        except OSError as e:
+            logging.warning(f"Could not link {library_path} to {dest_file.path}: {e}")
+            return None
+
+        dest_file.refresh()
+        self._index.add(dest_file)
+        checksum = source_file.checksum
+        if dest_file.is_file and dest_file.size == source_file.size:
+            logging.info(f"Linked {source_file.filename} to {library_path}")
+            dest_file.set_checksum(checksum)
+            return TransferResult("Successful", (checksum, checksum))
+
+        logging.error(f"File {dest_file.filename} NOT linked successfully, mismatching size")
+        return TransferResult("Failed", (checksum, None))
+
+    def planned_files(self):
+        """Yield (source, destination) pairs for all files in the source
+
+        In pipeline mode the source is scanned and planned in background threads, connected by
+        bounded queues, so the first file can be transferred before the scan has finished. Both
+        threads wait while the offload is paused, so the source isn't used.
+        """
+        if not self._pipeline:
+            if self._library is not None:
+                self.find_duplicates(self.source_files.files)
+            for source_file in self.source_files.files:
+                yield source_file, self.plan_file(source_file)
+            return
+
+        scanned = queue.Queue(maxsize=self._queue_size)
+        planned = queue.Queue(maxsize=self._queue_size)
+        errors = []
+
+        def scan():
+            try:
+                self._control.wait()
+                for source_file in self.source_files.scan():
+                    scanned.put(source_file)
+                    self._control.wait()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                scanned.put(None)
+
+        def plan():
+            done = False
+            try:
+                while not done:
+                    # The files that are already scanned are planned as a batch, so the library
+                    # is queried once per batch instead of once per file
+                    batch = []
+                    source_file = scanned.get()
+                    while source_file is not None:
+                        batch.append(source_file)
+                        if len(batch) >= self._queue_size:
+                            break
+                        try:
+                            source_file = scanned.get_nowait()
+                        except queue.Empty:
+                            break
+                    done = source_file is None
+                    self._control.wait()
+                    if batch and self._library is not None:
+                        self.find_duplicates(batch)
+                    for source_file in batch:
+                        self._control.wait()
+                        planned.put((source_file, self.plan_file(source_file)))
+            except Exception as e:
+                errors.append(e)
+                # Drain the scanner so it isn't blocked on a full queue
+                while not done and scanned.get() is not None:
+                    pass
+            finally:
+                planned.put(None)
+
+        logging.info("Scanning and offloading files")
+        threading.Thread(target=scan, name="offload-scan", daemon=True).start()
+        threading.Thread(target=plan, name="offload-plan", daemon=True).start()
+
+        while (item := planned.get()) is not None:
+            yield item
+
+        if errors:
+            raise errors[0]
+
+    def plan_transfer(self, source_file: File, dest_file: File) -> PlannedTransfer:
+        """Decide what to do with a source file and resolve its destinations
+
+        The paths that will be written are reserved in the destination index, so files planned
+        later never get the same destination.
+
+        Args:
+            source_file: the file to offload
+            dest_file: the planned destination file
+
+        Returns:
+            PlannedTransfer: the resolved transfer
+        """
+        skipped = [(None, "Skipped")] * len(self._backups)
+        record = self.ingested_record(source_file)
+        if record is not None:
+            # Offloaded by an earlier run according to the catalog
+            logging.info(f"{source_file.filename} is in the catalog, skipping")
+            return PlannedTransfer(source_file, dest_file, "skip", skipped, record[1])
+
+        duplicate = self._duplicates.pop(source_file, None)
+        if duplicate is not None and self._dedupe == "skip":
+            # Already somewhere else in the library, the backups mirror where it is
+            logging.info(f"{source_file.filename} is a duplicate of {duplicate}, skipping")
+            library_file = File(duplicate, lazy=True)
+            backups = self._resolve_backups(source_file, library_file)
+            if all(status is not None for _, status in backups):
+                return PlannedTransfer(
+                    source_file, library_file, "skip", backups, source_file.checksum
+                )
+            for backup_file, status in backups:
+                if status is None:
+                    self._index.reserve(backup_file.path, source_file)
+            return PlannedTransfer(source_file, library_file, "backup", backups)
+
+        # Check for existing files and update filename
+        skip = self._resolve_destination(source_file, dest_file)
+        backups = self._resolve_backups(source_file, dest_file)
+        if skip and all(status is not None for _, status in backups):
+            # The checksum is already known if the files were compared by hashing them
+            checksum = dest_file.checksum if self._skip_policy == "full_hash" else None
+            return PlannedTransfer(source_file, dest_file, "skip", backups, checksum)
+
+        if skip:
+            action = "backup"
+        elif duplicate is not None and not self._backups:
+            # Backups need real copies
+            action = "link"
+        else:
+            action = "transfer"
+
+        targets = [] if skip else [dest_file]
+        targets.extend(f for f, status in backups if status is None)
+        for target in targets:
+            self._index.reserve(target.path, source_file)
+        return PlannedTransfer(source_file, dest_file, action, backups, None, duplicate)
+
+    def planned_transfers(self):
+        """Yield a PlannedTransfer for every file in the source, in the order of planned_files"""
+        for source_file, dest_file in self.planned_files():
+            yield self.plan_transfer(source_file, dest_file)
+
+    def plan(self):
+        """Plan the offload of every file in the source without transferring anything
+
+        Returns:
+            TransferPlan: the plan, which can be saved and passed to offload() later
+        """
+        self._start()
+        try:
+            return TransferPlan(self._source, self._destination, self.planned_transfers())
+        finally:
+            self._stop()
+
+    def _start(self):
+        """Set up the templates, destination index, catalog and library before planning"""
+        self.compile_templates()
+        # Destination folders are listed again for every offload
+        self._index = utils.DirectoryIndex()
+        if self._catalog_path is not None:
+            self.open_catalog()
+        if self._dedupe is not None:
+            self.open_library()
+
+    def _stop(self):
+        """Write and close the catalog and library"""
+        if self._catalog is not None:
+            self._catalog.close()
+            self._catalog = None
+        if self._library is not None:
+            self._library.add(self._library_rows)
+            self._library = None
+
+    def transfer_file(
+        self, source_file: File, dest_file: File, action=None, backups=(), skip=False
+    ):
+        """Copy a file to its destinations and verify the copies
+
+        Args:
+            source_file: the file to transfer
+            dest_file: the destination file
+            action: progress text to send to the GUI, None to not send any progress
+            backups: (File, status) pairs for the backup destinations, where status is None if
+                the file needs to be written
+            skip: the file already exists in the main destination
+
+        Returns:
+            TransferResult: the statuses and checksums, or None if nothing was transferred
+        """
+        if source_file.refresh() is None:
+            return None
+
+        if self._dryrun:
+            logging.info("DRYRUN ENABLED, NOT PERFORMING FILE ACTIONS")
+            return None
+
+        targets = [] if skip else [dest_file]
+        targets.extend(f for f, status in backups if status is None)
+
+        # Create destination folders
+        for target in targets:
+            target.path.parent.mkdir(exist_ok=True, parents=True)
+
+        # Move or clone the file without copying any data
+        if self._clone and not backups:
+            result = self.clone_file(source_file, dest_file)
+            if result is not None:
+                return result
+
+        # Copy and verify, a paused transfer is resumed where it stopped
+        def remove_partial_copies():
+            for target in targets:
+                target.path.unlink(missing_ok=True)
+
+        def cancelled():
+            logging.warning(
+                f"Cancelled transferring {source_file.filename}, removing the partial copies"
             )
-            dest_file = File(dest_folder / source_file.filename, prefix=self._prefix)
-
-            # Change filename
-            if self._filename:
-                logging.debug(f"New user given filename is {self._filename}")
-                new_name = source_file.exifdata.get(
-                    utils.Preset.filename(self._filename), "unknown"
-                ).lower()
-                logging.debug(new_name)
-                dest_file.name = new_name
-
-            # Add prefix to filename
-            dest_file.set_prefix(self._prefix, custom_date=source_file.mdate)
-
-            # Add destination folder to list of destination folders
-            if dest_folder not in self.destination_folders:
-                self.destination_folders.append(dest_folder)
-
-            # Write to report
-            if not self._running:
-                self.report.write(source_file, dest_file, "Not started", checksum=False)
-                continue
+            remove_partial_copies()
+            return TransferResult("Cancelled")
 
-            # Print meta
-            logging.info(f"File modification date: {source_file.mdate}")
-            logging.info(f"Source path: {source_file.path}")
-            logging.info(f"Destination path: {dest_file.path}")
-
-            # Check for existing files and update filename
-            while True:
-                # Check if destination file exists
-                if dest_file.is_file:
-                    # Send signal to GUI
-                    self._signal["action"] = (
-                        f"Processing file {file_id + 1}/{len(self.source_files.files)} [verifying]"
+        resume = False
+        state = None
+        while True:
+            try:
+                source_checksum, statuses, errors = self._copy_file(
+                    source_file, targets, action=action, resume=resume, state=state
+                )
+                break
+            except utils.TransferPaused as e:
+                # The files are closed while paused, so the source can be ejected
+                logging.info(f"Paused transferring {source_file.filename}")
+                identity = (source_file.size, source_file.mtime_ns)
+                self._control.wait()
+                if self._control.cancelled:
+                    return cancelled()
+                if source_file.refresh() is None:
+                    logging.error(f"{source_file.path} is gone, removing the partial copies")
+                    remove_partial_copies()
+                    return TransferResult(
+                        "Failed", (None, None), [status or "Failed" for _, status in backups]
                     )
-                    self._progress_signal.emit(self._signal)
+                # A copy to a single target continues where it stopped if the source is the same
+                resume = len(targets) == 1 and identity == (source_file.size, source_file.mtime_ns)
+                state = e.state if resume else None
+                if state is None:
+                    # The file is copied or hashed again from the start
+                    self._progress.file(source_file, len(targets)).reset()
+            except utils.TransferCancelled:
+                return cancelled()
+
+        # Failed copies are left in place as well, so they're in the index for later files
+        for target in targets:
+            if target in errors:
+                target.refresh()
+            self._index.add(target)
+
+        if skip:
+            # Only a full hash comparison proved the existing file has the same checksum
+            checksums = None
+            if self._skip_policy == "full_hash":
+                checksums = (source_checksum, source_checksum)
+            return TransferResult(
+                "Skipped", checksums, [status or statuses[f] for f, status in backups]
+            )
+        return TransferResult(
+            statuses[dest_file],
+            (source_checksum, dest_file.checksum),
+            [status or statuses[f] for f, status in backups],
+        )
 
-                    # Add increment
-                    if dest_file.inc < 1:
-                        logging.info(
-                            "File with the same name exists in destination, comparing attributes"
-                        )
-                    else:
-                        logging.debug(
-                            f"File with incremented name {dest_file.filename} exists, comparing checksums"
-                        )
+    def _copy_file(self, source_file: File, targets, action=None, resume=False, state=None):
+        """Copy a file to its targets and verify the copies
+
+        Args:
+            source_file: the file to transfer
+            targets: the destination files to write
+            action: progress text to send to the GUI, None to not send any progress
+            resume: keep what was copied to a single target before the transfer was paused
+            state: the CopyState of the paused copy to a single target, if it was paused while
+                copying
+
+        Returns:
+            tuple: the source checksum, the status of each target and the write errors
+
+        Raises:
+            TransferPaused: if the offload was paused, copying can be resumed
+            TransferCancelled: if the offload was cancelled
+        """
+        progress = self._progress.file(source_file, len(targets))
+
+        def copied(size):
+            progress.copied(size)
+            self._control.check()
+
+        def verified(size):
+            progress.verified(size)
+            self._control.check()
+
+        # Send signal to GUI
+        if action:
+            self._progress.set_action(f"{action} [copying]")
+
+        # Copy file and hash the source while it's being read
+        errors = {}
+        if len(targets) == 1:
+            target = targets[0]
+            if not resume:
+                resume = self._resume_offset(source_file, target)
+            checkpoint = None
+            if self._journal is not None:
+                journal = self._journal
+
+                def checkpoint(offset):
+                    journal.copied(source_file, target, offset)
+
+            source_checksum = utils.checksum_copy(
+                source_file.path,
+                target.path,
+                progress=copied,
+                resume=resume,
+                checkpoint=checkpoint,
+                state=state,
+            )
+        else:
+            # Read the source once and write it to all destinations at the same time
+            source_checksum, results = utils.checksum_copy_multi(
+                source_file.path,
+                [target.path for target in targets],
+                progress=copied,
+                verify_progress=verified,
+            )
+            for target, (checksum, error) in zip(targets, results, strict=True):
+                if isinstance(error, utils.TransferInterrupted):
+                    raise error
+                if error is None:
+                    target.set_checksum(checksum)
+                else:
+                    logging.error(f"Could not write {target.path}: {error}")
+                    errors[target] = error
+        source_file.set_checksum(source_checksum)
+
+        # Send signal to GUI
+        if action:
+            self._progress.set_action(f"{action} [verifying]")
+
+        # Verify file transfer
+        if len(targets) == 1:
+            targets[0].set_checksum(utils.file_checksum(targets[0].path, progress=verified))
+        statuses = {}
+        for target in targets:
+            self._log_detail("Verifying transferred file %s", target.path)
+            if target not in errors and utils.compare_checksums(source_checksum, target.checksum):
+                self._log_detail("File %s transferred successfully", target.filename)
+                statuses[target] = "Successful"
+                # Only verified copies get the source timestamps, so a broken copy is never
+                # mistaken for the source by its size and modification time
+                self.copy_metadata(source_file, target)
+            else:
+                logging.error(
+                    f"File {target.path} NOT transferred successfully, mismatching checksums"
+                )
+                statuses[target] = "Failed"
+        return source_checksum, statuses, errors
+
+    def _resume_offset(self, source_file: File, dest_file: File):
+        """Cut a copy that was interrupted by a crash back to its last checkpoint in the journal
+
+        Args:
+            source_file: the file to transfer
+            dest_file: the destination file
+
+        Returns:
+            bool: True if the copy can be continued from the checkpoint
+        """
+        checkpoint = self._offsets.pop(str(source_file.path), None)
+        if checkpoint is None:
+            return False
+        destination, offset = checkpoint
+        st = utils.regular_file_stat(dest_file.path)
+        if destination != str(dest_file.path) or st is None or st.st_size < offset:
+            return False
+        os.truncate(dest_file.path, offset)
+        logging.info(f"Continuing {dest_file.filename} from {utils.convert_size(offset)}")
+        return True
 
-                    # If checksums are matching
-                    # if utils.compare_checksums(source_file.checksum, dest_file.checksum):
-                    if utils.compare_files(source_file, dest_file):
-                        logging.warning(
-                            f"File ({dest_file.filename}) already exists in destination, skipping"
-                        )
-                        # Write to report
-                        self.report.write(source_file, dest_file, "Skipped")
+    def clone_file(self, source_file: File, dest_file: File):
+        """Rename or clone a file if source and destination are on the same filesystem
 
-                        self.skipped_files.append(source_file.path)
+        Renaming is used in move mode and a copy-on-write clone in copy mode. The destination
+        shares its data with the source, so it's verified by size instead of checksums. Folders
+        on the same filesystem can still refuse a rename, e.g. across bind mounts, and the file
+        is copied instead.
 
-                        skip = True
-                        break
-                    else:
-                        logging.warning(
-                            f"File ({dest_file.filename}) with the same name already exists in destination,"
-                            f" adding incremental"
-                        )
-                        dest_file.increment_filename()
-                        logging.debug(f"Incremented filename is {dest_file.filename}")
-                        continue
-                else:
-                    break
+        Args:
+            source_file: the file to transfer
+            dest_file: the destination file
 
-            # Perform file actions
-            if not skip:
-                if source_file.path.is_file():
-                    if self._dryrun:
-                        logging.info("DRYRUN ENABLED, NOT PERFORMING FILE ACTIONS")
-                    else:
-                        # Create destination folder
-                        dest_file.path.parent.mkdir(exist_ok=True, parents=True)
+        Returns:
+            TransferResult: the status and empty checksums, or None if the file needs to be
+                copied
+        """
+        if source_file.stat.st_dev != os.stat(dest_file.path.parent).st_dev:
+            return None
 
-                        # Send signal to GUI
-                        self._signal["action"] = (
-                            f"Processing file {file_id + 1}/{len(self.source_files.files)} [copying]"
-                        )
-                        self._progress_signal.emit(self._signal)
+        if self._mode == "move":
+            try:
+                os.rename(source_file.path, dest_file.path)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM):
+                    raise
+                logging.debug("Could not rename %s, copying it instead: %s", source_file.path, e)
+                return None
+            method = "Moved"
+        elif utils.clone_file(source_file.path, dest_file.path):
+            utils.copy_metadata(
+                source_file.path,
+                dest_file.path,
+                permissions=self._preserve_permissions,
+                xattrs=self._preserve_xattrs,
+            )
+            method = "Cloned"
+        else:
+            return None
+
+        dest_file.refresh()
+        self._index.add(dest_file)
+        if dest_file.is_file and dest_file.size == source_file.size:
+            logging.info(f"{method} {source_file.filename} to {dest_file.path}")
+            return TransferResult("Successful", (None, None))
+
+        logging.error(f"File {dest_file.filename} NOT transferred successfully, mismatching size")
+        return TransferResult("Failed", (None, None))
+
+    def copy_metadata(self, source_file: File, dest_file: File):
+        """Copy the timestamps, and permissions and extended attributes if enabled, of the source
+        to the destination while keeping the cached checksum of the destination"""
+        checksum = dest_file.checksum
+        utils.copy_metadata(
+            source_file.path,
+            dest_file.path,
+            permissions=self._preserve_permissions,
+            xattrs=self._preserve_xattrs,
+        )
+        dest_file.set_checksum(checksum)
 
-                        # Copy file
-                        utils.pathlib_copy(source_file.path, dest_file.path)
+    def _resolve_destination(self, source_file: File, dest_file: File):
+        """Check for existing and planned files in the destination and update the filename
 
-                        # Send signal to GUI
-                        self._signal["action"] = (
-                            f"Processing file {file_id + 1}/{len(self.source_files.files)} [verifying]"
-                        )
-                        self._progress_signal.emit(self._signal)
+        Args:
+            source_file: the file to transfer
+            dest_file: the destination file, incremented if the name is taken
 
-                        # Verify file transfer
-                        logging.info("Verifying transferred file")
+        Returns:
+            bool: True if the file already exists in the destination and should be skipped
+        """
+        while True:
+            # Check if destination file exists or is going to be written
+            existing = self._index.get(dest_file.path)
+            if existing is None:
+                return False
+
+            # Add increment
+            if dest_file.inc < 1:
+                self._log_detail(
+                    "File with the same name exists in destination, comparing attributes"
+                )
+            else:
+                logging.debug(
+                    "File with incremented name %s exists, comparing checksums", dest_file.filename
+                )
+
+            # If checksums are matching
+            if utils.compare_files(source_file, existing, policy=self._skip_policy, refresh=False):
+                self._log_detail(
+                    "File (%s) already exists in destination, skipping",
+                    dest_file.filename,
+                    level=logging.WARNING,
+                )
+                if self._skip_policy == "full_hash":
+                    # Keep the checksum for the report
+                    dest_file.set_checksum(existing.checksum)
+                return True
+
+            self._log_detail(
+                "File (%s) with the same name already exists in destination, adding incremental",
+                dest_file.filename,
+                level=logging.WARNING,
+            )
+            dest_file.increment_filename()
+            logging.debug("Incremented filename is %s", dest_file.filename)
+
+    def _resolve_backups(self, source_file: File, dest_file: File):
+        """Check the backup destinations for files already at the same path as dest_file
+
+        Backups mirror the main destination. A different file at the same path in a backup is
+        never overwritten and reported as a conflict.
+
+        Args:
+            source_file: the file to transfer
+            dest_file: the resolved main destination file
+
+        Returns:
+            list: (File, status) pairs, status is None if the file needs to be written
+        """
+        backups = []
+        relative_path = os.path.relpath(dest_file.path, self._destination)
+        for backup in self._backups:
+            backup_file = File(backup / relative_path, lazy=True)
+            status = None
+            existing = self._index.get(backup_file.path)
+            if existing is not None:
+                if utils.compare_files(
+                    source_file, existing, policy=self._skip_policy, refresh=False
+                ):
+                    self._log_detail(
+                        "File (%s) already exists in backup, skipping",
+                        backup_file.path,
+                        level=logging.WARNING,
+                    )
+                    status = "Skipped"
+                else:
+                    logging.error("A different file already exists at %s", backup_file.path)
+                    status = "Conflict"
+            backups.append((backup_file, status))
+        return backups
+
+    def _finish_file(self, source_file: File, dest_file: File, file_size, result):
+        """Write the result of a file to the report and update the totals
+
+        Args:
+            source_file: the transferred file
+            dest_file: the destination file
+            file_size: size of the source file before it was transferred
+            result: the TransferResult returned by transfer_file
+        """
+        if result is not None:
+            status = result.status
+            if status in ("Not started", "Cancelled"):
+                self.report.write(source_file, dest_file, status, size=file_size)
+                return
+
+            # Write to report, files skipped on their metadata alone have no checksums
+            self.report.write(
+                source_file,
+                dest_file,
+                status,
+                checksums=result.checksums,
+                backups=result.backups,
+                size=file_size,
+            )
+            # Before the source is deleted, files finished before a resume are already in it
+            if self._journal is not None and (
+                self._resume is None or str(source_file.path) not in self._resume.finished
+            ):
+                self._journal.finished(source_file, dest_file, result)
+
+            backups_ok = all(x in ("Successful", "Skipped") for x in result.backups)
+            if status == "Failed" or not backups_ok:
+                self.errored_files.append({source_file.path: "Mismatching checksum after transfer"})
+            elif status == "Skipped":
+                self.skipped_files.append(source_file.path)
+
+            if self._catalog is not None and status in ("Successful", "Skipped") and backups_ok:
+                checksum = result.checksums[0] if result.checksums else None
+                self.catalog_file(source_file, dest_file, checksum)
+
+            if self._library is not None and status == "Successful" and result.checksums[0]:
+                # New files in the library
+                self._library_rows.append(
+                    (dest_file.path, dest_file.size, dest_file.mtime_ns, result.checksums[0])
+                )
+
+            if status == "Successful" and backups_ok and self._mode == "move":
+                # Delete source file
+                source_file.delete()
+
+        # Add file size to total
+        self.ol_bytes_transferred += file_size
+        self._progress.finish_file(source_file, file_size)
+
+        # Add file to processed files
+        self.processed_files.append(source_file.filename)
+
+        if self._log_summary:
+            logging.info(
+                "%s | %s | %s/s | %s remaining",
+                source_file.filename,
+                result.status if result is not None else "Not transferred",
+                utils.convert_size(self.ol_speed),
+                utils.time_to_string(self.ol_time_remaining),
+            )
+            return
 
-                        # File transfer successful
-                        if utils.compare_checksums(source_file.checksum, dest_file.checksum):
-                            logging.info("File transferred successfully")
+        # Calculate remaining time
+        logging.info(f"Elapsed time: {utils.time_to_string(self.ol_time_elapsed)}")
 
-                            # Write to report
-                            self.report.write(source_file, dest_file, "Successful")
+        # Log transfer speed
+        logging.info(f"Transfer speed: {utils.convert_size(self.ol_speed)}/s")
 
-                            # Delete source file
-                            if self._mode == "move":
-                                source_file.delete()
+        logging.info(f"Size remaining: {utils.convert_size(self.ol_bytes_remaining)}")
+        logging.info(f"Approx. time remaining: {utils.time_to_string(self.ol_time_remaining)}")
+        logging.info("---\n")
 
-                        # File transfer unsuccessful
-                        else:
-                            logging.error(
-                                "File NOT transferred successfully, mismatching checksums"
-                            )
+    def _log_detail(self, msg, *args, level=logging.INFO):
+        """Log a step of a file transfer, left out when only a summary line is logged per file
 
-                            # Write to report
-                            self.report.write(source_file, dest_file, "Failed")
+        The message is formatted by the thread that writes the log, and not at all when it's
+        left out.
+        """
+        if not self._log_summary:
+            logging.log(level, msg, *args)
 
-                            self.errored_files.append(
-                                {source_file.path: "Mismatching checksum after transfer"}
-                            )
+    def offload(self, plan=None):
+        """Offload files
 
-            # Add file size to total
-            self.ol_bytes_transferred += source_file.size
+        Args:
+            plan: a TransferPlan to run, by default the offload is planned first, or while
+                transferring in pipeline mode
+        """
+        # Offload start time
+        self.ol_time_started = time.time()
+        self._progress = ProgressReporter(
+            self._progress_signal.emit,
+            self.source_files.size,
+            self.source_files.count,
+            interval=self._progress_interval,
+            targets=1 + len(self._backups),
+        )
 
-            # Add file to processed files
-            self.processed_files.append(source_file.filename)
+        if plan is None:
+            plan = self._plan
+        if plan is not None:
+            self.use_plan(plan)
 
-            # Calculate remaining time
-            logging.info(f"Elapsed time: {utils.time_to_string(self.ol_time_elapsed)}")
+        # Get list of files in source folder
+        if not self._pipeline or plan is not None:
+            logging.info(f"Total file size: {self.source_files.hsize}")
+            logging.info(
+                f"Average file size: {utils.convert_size(self.source_files.avg_file_size)}"
+            )
+            logging.info("---\n")
 
-            # Log transfer speed
-            logging.info(f"Avg. transfer speed: {utils.convert_size(self.ol_speed)}/s")
+        # Files are transferred by the worker pool and finished in the order they were planned
+        executor = None
+        if self._workers > 1:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._workers, thread_name_prefix="offload-transfer"
+            )
+        pending = collections.deque()
+
+        def finish_next():
+            source_file, dest_file, file_size, future = pending.popleft()
+            self._finish_file(source_file, dest_file, file_size, future.result())
+
+        def add_result(source_file, dest_file, file_size, result):
+            future = concurrent.futures.Future()
+            future.set_result(result)
+            pending.append((source_file, dest_file, file_size, future))
+
+        self._start()
+        if self._resume is not None and not self._dryrun:
+            self._journal = SessionJournal(self.journal_path)
+        elif not self._dryrun:
+            self._journal = SessionJournal.create(REPORTS_PATH)
+            self.journal_path = self._journal.path
+            self._journal.session(self._source, self._destination)
+        try:
+            stale = set()
+            if plan is not None:
+                # Keep the planned paths from being given to files that are planned again
+                for file_id, planned in enumerate(plan):
+                    if planned.destination is None:
+                        continue
+                    # A file written to a planned path since the plan was made is never
+                    # overwritten, the transfer is planned again. A resumed offload owns the
+                    # partial copies at its planned paths.
+                    if self._resume is None and any(
+                        self._index.get(target.path) is not None for target in planned.targets
+                    ):
+                        logging.warning(
+                            f"A file was written where {planned.source.filename} is planned to "
+                            f"go since the plan was made, planning it again"
+                        )
+                        stale.add(file_id)
+                        continue
+                    for target in planned.targets:
+                        self._index.reserve(target.path, planned.source)
+            elif not self._pipeline or self._dryrun:
+                plan = TransferPlan(self._source, self._destination, self.planned_transfers())
+                logging.info(
+                    f"Planned {plan.count} files, {utils.convert_size(plan.size)} to write"
+                )
+                if self._dryrun:
+                    plan.save(self.report.plan_path)
+            if plan is not None and self._journal is not None and self._resume is None:
+                for planned in plan:
+                    if planned.destination is not None:
+                        self._journal.planned(planned)
+
+            # Iterate over all the files
+            transfers = self.planned_transfers() if plan is None else plan
+            for file_id, planned in enumerate(transfers):
+                # Nothing is kept open between files while paused
+                self._control.wait()
+                replanned = planned.destination is None or file_id in stale
+                if replanned:
+                    # The source file or the destination has changed since the plan was made
+                    planned = self.plan_transfer(planned.source, self.plan_file(planned.source))
+                if self._journal is not None and (plan is None or replanned):
+                    self._journal.planned(planned)
+                source_file = planned.source
+                dest_file = planned.destination
+                file_size = source_file.size
+                dest_folder = dest_file.path.parent
+                action = f"Processing file {file_id + 1}/{self.source_files.count}"
+
+                # Display how far along the transfer we are
+                self._log_detail(
+                    "%s (~%s%%) | %s", action, self.ol_percentage, source_file.filename
+                )
+
+                # Send signal to GUI
+                self._progress.bytes_total = self.source_files.size
+                self._progress.files_total = self.source_files.count
+                self._progress.set_action(action)
+
+                # Add destination folder to list of destination folders
+                if dest_folder not in self.destination_folders:
+                    self.destination_folders.append(dest_folder)
+
+                # Write to report
+                if not self._running:
+                    add_result(source_file, dest_file, file_size, TransferResult("Not started"))
+                    continue
+
+                # Print meta
+                self._log_detail("File modification date: %s", source_file.mdate)
+                self._log_detail("Source path: %s", source_file.path)
+                self._log_detail("Destination path: %s", dest_file.path)
+
+                if planned.action == "skip":
+                    checksums = None
+                    if planned.checksum:
+                        checksums = (planned.checksum, planned.checksum)
+                    statuses = [status for _, status in planned.backups]
+                    add_result(
+                        source_file,
+                        dest_file,
+                        file_size,
+                        TransferResult("Skipped", checksums, statuses),
+                    )
 
-            logging.info(f"Size remaining: {utils.convert_size(self.ol_bytes_remaining)}")
-            logging.info(f"Approx. time remaining: {self.ol_time_remaining}")
-            logging.info("---\n")
+                # Link duplicates that are already in the library
+                elif (
+                    planned.action == "link"
+                    and (result := self.link_file(source_file, dest_file, planned.origin))
+                    is not None
+                ):
+                    add_result(source_file, dest_file, file_size, result)
+
+                # Perform file actions
+                elif executor is None or file_size >= self._small_file_size:
+                    # Large files are transferred on their own
+                    while pending:
+                        finish_next()
+                    result = self.transfer_file(
+                        source_file,
+                        dest_file,
+                        action=action,
+                        backups=planned.backups,
+                        skip=planned.action == "backup",
+                    )
+                    add_result(source_file, dest_file, file_size, result)
+                else:
+                    future = executor.submit(
+                        self.transfer_file,
+                        source_file,
+                        dest_file,
+                        backups=planned.backups,
+                        skip=planned.action == "backup",
+                    )
+                    pending.append((source_file, dest_file, file_size, future))
+
+                # Keep at most one file per worker in flight
+                while pending and (len(pending) > self._workers or pending[0][3].done()):
+                    finish_next()
+
+            while pending:
+                finish_next()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+            self._stop()
+            self.report.close()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
 
         # Print created destination folders
         if self.destination_folders:
@@ -321,24 +1664,23 @@ class Offloader(QThread):
             logging.info(
                 f"Created the following folders {', '.join([str(x.name) for x in self.destination_folders])}"
             )
-            logging.debug([str(x.resolve()) for x in self.destination_folders])
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug([str(x.resolve()) for x in self.destination_folders])
 
         logging.info(f"{len(self.processed_files)} files processed")
-        logging.debug(f"Processed files: {self.processed_files}")
+        logging.debug("Processed files: %s", self.processed_files)
 
         logging.info(f"{len(self.destination_folders)} destination folders")
-        logging.debug(f"Destination folders: {self.destination_folders}")
+        logging.debug("Destination folders: %s", self.destination_folders)
 
         logging.info(f"{len(self.skipped_files)} files skipped")
-        logging.debug(f"Skipped files: {self.skipped_files}")
+        logging.debug("Skipped files: %s", self.skipped_files)
 
         # Save report to desktop
         print(self._running)
         self.report.save()
         self.report.write_html()
-        self._signal["time"] = 0
-        self._signal["is_finished"] = True
-        self._progress_signal.emit(self._signal)
+        self._progress.finish()
         return True
 
     def run(self):
@@ -347,12 +1689,33 @@ class Offloader(QThread):
 
 
 class Report:
-    def __init__(self, report_format="csv"):
+    """CSV report of an offload
+
+    The report is kept open and rows are written in batches, when enough rows are buffered, when
+    the last batch is old enough and when the report is closed.
+    """
+
+    def __init__(self, report_format="csv", backups=0, buffer_size=500, flush_interval=5.0):
+        """
+        Args:
+            report_format: format of the report
+            backups: number of backup destinations
+            buffer_size: number of rows to buffer before they're written
+            flush_interval: seconds after which buffered rows are written
+        """
         self._date = datetime.now()
         self.format = report_format
         self.path = REPORTS_PATH / f"{self._date.strftime('%y%m%d%H%M')}_report.csv"
         self.html_path = self.path.parent / f"{self.path.stem}.html"
+        self.html_pages_path = self.path.parent / self.path.stem
+        self.plan_path = self.path.parent / f"{self._date.strftime('%y%m%d%H%M')}_plan.json"
         self.html_template_path = APP_DATA_PATH / "data" / "report_template.html"
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._rows = []
+        self._flushed = time.monotonic()
+        self._file = None
+        self._writer = None
 
         if not self.path.parent.is_dir():
             self.path.parent.mkdir(exist_ok=True, parents=True)
@@ -367,79 +1730,192 @@ class Report:
             "Size",
             "Modification Date",
         ]
+        columns.extend(f"Backup {n} Status" for n in range(1, backups + 1))
 
         if not self.path.is_file():
-            with self.path.open("w") as report:
-                writer = csv.writer(report, delimiter=",", quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                writer.writerow(columns)
+            self._rows.append(columns)
+            self.flush()
+
+    def __enter__(self):
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
         self.write_html()
 
-    def write_html(self):
-        """Create html file from csv"""
-        with self.path.open("r") as report:
+    def write_html(self, page_size=1000):
+        """Create html pages from the csv and a summary page with links to them
+
+        The csv is read one page at a time, so the memory used doesn't grow with the report.
+
+        Args:
+            page_size: number of rows per page
+
+        Returns:
+            Path: the summary page
+        """
+        self.flush()
+        template = self.html_template_path.read_text()
+        date = self._date.strftime("%Y-%m-%d %H:%M")
+        self.html_pages_path.mkdir(exist_ok=True, parents=True)
+
+        pages = 0
+        count = 0
+        with self.path.open("r", newline="") as report:
             csv_reader = csv.reader(report, delimiter=",")
-            line_count = 0
-            table_columns = ""
-            table_rows = []
-            for row in csv_reader:
-                if line_count == 0:
-                    table_columns = "\n".join([f'<th scope="col">{x}</th>' for x in row])
-                    line_count += 1
-                else:
-                    cols = []
-                    for col in row:
-                        if col == "Successful":
-                            cols.append(f'\t<td><span class="text-success">{col}</span></td>')
-                        elif col == "Skipped":
-                            cols.append(f'\t<td><span class="text-info">{col}</span></td>')
-                        elif col == "Failed":
-                            cols.append(f'\t<td><span class="text-failed">{col}</span></td>')
-                        else:
-                            cols.append(f"\t<td>{col}</td>")
-                    td = "\n".join(cols)
-                    table_rows.append(td)
-                    line_count += 1
-            table_rows = "\n".join([f"<tr>\n{x}\n</tr>" for x in table_rows])
-
-        html_report = self.html_template_path.read_text()
-        html_report = html_report.format(
-            date=self._date.strftime("%Y-%m-%d %H:%M"),
-            table_columns=table_columns,
-            table_rows=table_rows,
+            columns = next(csv_reader, [])
+            table_columns = "\n".join(f'<th scope="col">{html.escape(x)}</th>' for x in columns)
+            status_columns = [i for i, x in enumerate(columns) if x.endswith("Status")]
+            totals = {i: collections.Counter() for i in status_columns}
+
+            # A page is written when the next one is read, so the last page has no next link
+            page = None
+            for rows in iter(lambda: list(itertools.islice(csv_reader, page_size)), []):
+                count += len(rows)
+                for row in rows:
+                    for i in status_columns:
+                        totals[i][row[i] if i < len(row) else ""] += 1
+                if page is not None:
+                    self._write_html_page(template, date, table_columns, page, pages, True)
+                page = rows
+                pages += 1
+            if page is not None:
+                self._write_html_page(template, date, table_columns, page, pages, False)
+
+        # Pages left over from an earlier, longer report
+        for path in self.html_pages_path.glob("*.html"):
+            if not path.stem.isdigit() or int(path.stem) > pages:
+                path.unlink()
+
+        statuses = sorted({status for counter in totals.values() for status in counter})
+        summary_columns = "\n".join(
+            f'<th scope="col">{html.escape(x)}</th>'
+            for x in ["", *(columns[i] for i in status_columns)]
+        )
+        summary_rows = "\n".join(
+            f"<tr>\n\t<td>{self._html_status(status)}</td>\n"
+            + "\n".join(f"\t<td>{totals[i][status]}</td>" for i in status_columns)
+            + "\n</tr>"
+            for status in statuses
+        )
+        links = " ".join(
+            f'<a href="{self.html_pages_path.name}/{n:05}.html">{n}</a>'
+            for n in range(1, pages + 1)
         )
-        self.html_path.write_text(html_report)
+        content = (
+            f'<div class="row"><p>{count} files</p></div>\n'
+            f"{self._html_table(summary_columns, summary_rows)}\n"
+            f'<div class="row"><p>Pages: {links}</p></div>'
+        )
+        self.html_path.write_text(template.format(date=date, content=content))
         return self.html_path
 
-    def write(self, source: File, destination: File, status, checksum=True):
-        with self.path.open("a") as report:
-            writer = csv.writer(report, delimiter=",", quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            if checksum:
-                columns = [
-                    source.filename,
-                    destination.filename,
-                    status,
-                    source.checksum,
-                    destination.checksum,
-                    source.path,
-                    destination.path,
-                    utils.convert_size(source.size),
-                    source.mdate,
-                ]
-            else:
-                columns = [
-                    source.filename,
-                    destination.filename,
-                    status,
-                    None,
-                    None,
-                    source.path,
-                    destination.path,
-                    utils.convert_size(source.size),
-                    source.mdate,
-                ]
-            writer.writerow(columns)
+    def _write_html_page(self, template, date, table_columns, rows, number, has_next):
+        """Write one page of the html report
+
+        Args:
+            template: the html template
+            date: date of the report
+            table_columns: the table header
+            rows: csv rows on the page
+            number: page number, starting at 1
+            has_next: True if there is another page after this one
+        """
+        table_rows = "\n".join(
+            "<tr>\n" + "\n".join(f"\t<td>{self._html_status(x)}</td>" for x in row) + "\n</tr>"
+            for row in rows
+        )
+        navigation = [f'<a href="../{self.html_path.name}">Summary</a>']
+        if number > 1:
+            navigation.append(f'<a href="{number - 1:05}.html">Previous</a>')
+        if has_next:
+            navigation.append(f'<a href="{number + 1:05}.html">Next</a>')
+        content = (
+            f'<div class="row"><p>Page {number} | {" | ".join(navigation)}</p></div>\n'
+            f"{self._html_table(table_columns, table_rows)}"
+        )
+        path = self.html_pages_path / f"{number:05}.html"
+        path.write_text(template.format(date=date, content=content))
+
+    @staticmethod
+    def _html_table(table_columns, table_rows):
+        """Return an html table"""
+        return (
+            '<div class="row">\n<table class="table table-striped">\n'
+            f"<thead>\n<tr>\n{table_columns}\n</tr>\n</thead>\n"
+            f"<tbody>\n{table_rows}\n</tbody>\n"
+            "</table>\n</div>"
+        )
+
+    @staticmethod
+    def _html_status(value):
+        """Return a table cell value, statuses are colored"""
+        value = html.escape(value)
+        if value == "Successful":
+            return f'<span class="text-success">{value}</span>'
+        if value == "Skipped":
+            return f'<span class="text-info">{value}</span>'
+        if value == "Failed":
+            return f'<span class="text-failed">{value}</span>'
+        return value
+
+    def write(self, source: File, destination: File, status, checksums=None, backups=(), size=None):
+        """Add a row to the report, the row is buffered and written later
+
+        Nothing is hashed for the report, the checksums and size are the ones the transfer
+        already has.
+
+        Args:
+            source: the source file
+            destination: the destination file
+            status: status of the file transfer
+            checksums: (source, destination) checksums, None to leave them out of the report
+            backups: status of the file transfer for each backup destination
+            size: size of the source file, read from the file if None
+        """
+        if size is None:
+            size = source.size
+        self._rows.append(
+            [
+                source.filename,
+                destination.filename,
+                status,
+                *(checksums or (None, None)),
+                source.path,
+                destination.path,
+                utils.convert_size(size),
+                source.mdate,
+                *backups,
+            ]
+        )
+        if (
+            len(self._rows) >= self.buffer_size
+            or time.monotonic() - self._flushed >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows to the report"""
+        self._flushed = time.monotonic()
+        if not self._rows:
+            return
+        if self._file is None:
+            self._file = self.path.open("a", newline="")
+            self._writer = csv.writer(
+                self._file, delimiter=",", quotechar='"', quoting=csv.QUOTE_MINIMAL
+            )
+        self._writer.writerows(self._rows)
+        self._file.flush()
+        logging.debug(f"Wrote {len(self._rows)} rows to {self.path}")
+        self._rows.clear()
+
+    def close(self):
+        """Write the buffered rows and close the report, it's opened again by the next write"""
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
 
     def save(self, path=None):
         if path is None:
@@ -448,6 +1924,7 @@ class Report:
                 / "Desktop"
                 / f"Offload_Report_{self._date.strftime('%Y-%m-%d_%H%M')}.csv"
             )
+        self.flush()
         utils.pathlib_copy(self.path, path)
 
 
@@ -463,33 +1940,135 @@ def cli():
         "-d", "--destination", type=str, help="The destination folder", action="store"
     )
 
+    parser.add_argument(
+        "-b",
+        "--backup",
+        type=str,
+        dest="backups",
+        help="A backup folder to also write every file to. Can be used more than once",
+        action="append",
+    )
+
     parser.add_argument(
         "-f",
         "--folder-structure",
-        choices=["original", "taken_date", "offload_date", "year", "year_month", "flat"],
         dest="structure",
         default="taken_date",
-        help="Set the folder structure.\nDefault: taken_date",
+        help='Set the folder structure. "taken_date", "offload_date", "year", "year_month" or '
+        '"flat", or a template like "{date.year}/{model}".\nDefault: taken_date',
         action="store",
     )
 
-    parser.add_argument("-n", "--name", type=str, help="Set a new filename", action="store")
+    parser.add_argument(
+        "-n",
+        "--name",
+        type=str,
+        help='Set a new filename. "camera_make", "camera_model" or a template like '
+        '"{model}_{seq:04}"',
+        action="store",
+    )
 
     parser.add_argument(
         "-p",
         "--prefix",
         help='Set the filename prefix. Enter a custom prefix, "taken_date", "taken_date_time" or '
-        '"offload_date" for templates. "none" for no prefix.\nDefault: taken_date',
+        '"offload_date" for templates, or a template like "{date:%%Y%%m%%d}_{make}". "none" for no '
+        "prefix.\nDefault: taken_date",
         default="taken_date",
         action="store",
     )
 
     parser.add_argument("-m", "--move", help="Move files instead of copy", action="store_true")
 
+    parser.add_argument(
+        "--clone",
+        help="Clone files instead of copying them, or rename them when moving, if the source "
+        "and destination are on the same filesystem",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--skip-policy",
+        choices=["size_mtime", "partial_hash", "full_hash"],
+        default="size_mtime",
+        help="How to decide that a file already in the destination is the same as the source "
+        "file.\nDefault: size_mtime",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--preserve-permissions",
+        help="Copy file permissions along with the timestamps",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--preserve-xattrs",
+        help="Copy extended attributes along with the timestamps",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--catalog",
+        help="Skip files that have already been offloaded to the destination, according to the "
+        "ingest catalog, and add the offloaded files to it",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--dedupe",
+        choices=["skip", "hardlink"],
+        help="Skip files that already exist anywhere in the destination, or hardlink them "
+        "to the existing file",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--plan",
+        help="Plan the offload and save the plan to a JSON file without transferring anything",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--execute",
+        help="Run a plan saved with --plan",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--resume",
+        nargs="?",
+        const="latest",
+        help="Resume an interrupted offload from its session journal, by default the latest "
+        "one in the reports folder",
+        action="store",
+    )
+
     parser.add_argument(
         "--dryrun", help="Run the script without actually changing any files", action="store_true"
     )
 
+    parser.add_argument(
+        "--pipeline",
+        help="Start transferring files while the source is still being scanned. Files are "
+        "transferred in the order they are found instead of by modification date",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of small files to transfer at the same time.\nDefault: 1",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--log-summary",
+        help="Log one line per file instead of every step of the transfer",
+        action="store_true",
+    )
+
     parser.add_argument(
         "--debug-log",
         dest="log_level",
@@ -500,6 +2079,14 @@ def cli():
     # Execute the parse_args() method
     args = parser.parse_args()
 
+    # Report a typo in a naming template before anything else is asked for
+    try:
+        utils.Template(utils.structure_template(args.structure))
+        utils.Template(utils.PREFIX_TEMPLATES.get(args.prefix, args.prefix))
+        utils.Template(utils.FILENAME_TEMPLATES.get(args.name, args.name))
+    except ValueError as e:
+        parser.error(str(e))
+
     # Print the title
     print("================")
     print("CAMERA OFFLOADER")
@@ -508,6 +2095,23 @@ def cli():
 
     confirmation = False
 
+    # Source and destination of a saved plan
+    plan = None
+    if args.execute:
+        plan = TransferPlan.load(args.execute)
+        args.source = str(plan.source)
+        args.destination = str(plan.destination)
+
+    # Source and destination of an interrupted offload
+    resume = None
+    if args.resume:
+        journal = SessionJournal.latest() if args.resume == "latest" else args.resume
+        if journal is None:
+            parser.error("No session journal to resume")
+        resume = SessionJournal.load(journal)
+        args.source = str(resume.plan.source)
+        args.destination = str(resume.plan.destination)
+
     if args.source is None:
         confirmation = True
         volumes = {}
@@ -594,6 +2198,8 @@ def cli():
         print("\nPre-transfer summary\n")
         print(f"Source path: {source}")
         print(f"Destination path: {destination}")
+        for backup in args.backups or []:
+            print(f"Backup path: {backup}")
         print("")
         print(f"Mode: {mode}")
         print(f"Folder structure: {folder_structure}")
@@ -620,8 +2226,23 @@ def cli():
         mode=mode,
         dryrun=args.dryrun,
         log_level=log_level,
+        pipeline=args.pipeline,
+        workers=args.workers,
+        clone=args.clone,
+        backups=args.backups,
+        skip_policy=args.skip_policy,
+        preserve_permissions=args.preserve_permissions,
+        preserve_xattrs=args.preserve_xattrs,
+        catalog=CATALOG_PATH if args.catalog else None,
+        dedupe=args.dedupe,
+        plan=plan,
+        log_summary=args.log_summary,
+        resume=resume,
     )
-    ol.offload()
+    if args.plan:
+        ol.plan().save(args.plan)
+    else:
+        ol.offload()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+"""
+catalog.py
+History of offloaded files, used to skip files that were already ingested from a card.
+"""
+
+import contextlib
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from offload import utils
+
+
+def mount_point(path: Path):
+    """Return the mount point of the filesystem a path is on"""
+    path = Path(os.path.abspath(path))
+    while not os.path.ismount(path) and path.parent != path:
+        path = path.parent
+    return path
+
+
+def volume_fingerprint(path: Path):
+    """Identify the volume a path is on across mounts
+
+    Device numbers change every time a card is inserted, so the volume is identified by the name
+    of its mount point and its capacity instead.
+
+    Args:
+        path: a path on the volume
+
+    Returns:
+        tuple: the fingerprint and the mount point of the volume
+    """
+    mount = mount_point(path)
+    total = utils.disk_usage(mount).total
+    return f"{mount.name or mount}:{total}", mount
+
+
+class Catalog:
+    """SQLite database of the files that have been offloaded
+
+    Each file is identified by the volume it was offloaded from, its path relative to the root
+    of that volume, its size and its modification time, and is recorded once per destination
+    folder it was offloaded to.
+    """
+
+    def __init__(self, path: Path, batch_size=500):
+        """Open the catalog, the database is created if it doesn't exist
+
+        Args:
+            path: path to the database file
+            batch_size: number of records to keep in memory before writing them
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._batch_size = batch_size
+        self._records = []
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "volume TEXT NOT NULL, "
+            "path TEXT NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "mtime_ns INTEGER NOT NULL, "
+            "root TEXT NOT NULL, "
+            "destination TEXT NOT NULL, "
+            "checksum TEXT, "
+            "ingested REAL NOT NULL, "
+            "PRIMARY KEY (volume, root, path, size, mtime_ns))"
+        )
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def ingested(self, volume, root: Path):
+        """Get all files offloaded from a volume to a destination folder in one query
+
+        Args:
+            volume: volume fingerprint
+            root: the destination folder
+
+        Returns:
+            dict: (path, size, mtime_ns) mapped to (destination path, checksum)
+        """
+        self.flush()
+        rows = self._connection.execute(
+            "SELECT path, size, mtime_ns, destination, checksum FROM files "
+            "WHERE volume = ? AND root = ?",
+            (volume, os.path.abspath(root)),
+        )
+        return {
+            (path, size, mtime_ns): (dest, checksum)
+            for path, size, mtime_ns, dest, checksum in rows
+        }
+
+    def add(self, volume, path, size, mtime_ns, root: Path, destination: Path, checksum=None):
+        """Record an offloaded file, records are written in batches
+
+        Args:
+            volume: volume fingerprint
+            path: path of the source file relative to the root of the volume
+            size: size of the source file
+            mtime_ns: modification time of the source file in nanoseconds
+            root: the destination folder
+            destination: path of the offloaded file
+            checksum: checksum of the file if known
+        """
+        self._records.append(
+            (
+                volume,
+                str(path),
+                size,
+                mtime_ns,
+                os.path.abspath(root),
+                os.path.abspath(destination),
+                checksum,
+                time.time(),
+            )
+        )
+        if len(self._records) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write the pending records in one transaction"""
+        if not self._records:
+            return
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._records
+            )
+        logging.debug(f"Wrote {len(self._records)} records to {self.path}")
+        self._records.clear()
+
+    def close(self):
+        """Write the pending records and close the database"""
+        self.flush()
+        self._connection.close()
+
+
+class LibraryIndex:
+    """SQLite index of the size and checksum of every file in a destination library
+
+    Used to find files that already exist somewhere in the library, whatever their path. The
+    index is updated incrementally, only files that are new or have changed since the last
+    update are hashed. Every call uses its own connection, so the index can be updated in a
+    background thread while it's queried from another.
+    """
+
+    def __init__(self, path: Path, root: Path, batch_size=500):
+        """Open the index of a library, the database is created if it doesn't exist
+
+        Args:
+            path: path to the database file
+            root: the library folder
+            batch_size: number of files to hash before the index is written
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.root = os.path.abspath(root)
+        self._batch_size = batch_size
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS library ("
+                "root TEXT NOT NULL, "
+                "path TEXT PRIMARY KEY, "
+                "size INTEGER NOT NULL, "
+                "mtime_ns INTEGER NOT NULL, "
+                "checksum TEXT NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS library_content ON library (root, size, checksum)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Open a connection and commit when done"""
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def update(self, exclude=None):
+        """Walk the library and index the files that are new or have changed
+
+        Args:
+            exclude: list of file and folder names or glob patterns to leave out
+
+        Returns:
+            int: the number of files that were hashed
+        """
+        with self._connect() as connection:
+            known = {
+                path: (size, mtime_ns)
+                for path, size, mtime_ns in connection.execute(
+                    "SELECT path, size, mtime_ns FROM library WHERE root = ?", (self.root,)
+                )
+            }
+
+        hashed = 0
+        rows = []
+        for entry in utils.scan_files(self.root, exclude=exclude):
+            path = os.path.abspath(entry.path)
+            try:
+                st = entry.stat()
+                identity = known.pop(path, None)
+                if identity == (st.st_size, st.st_mtime_ns):
+                    continue
+                rows.append((path, st.st_size, st.st_mtime_ns, utils.file_checksum(path)))
+            except OSError as e:
+                logging.warning(f"Could not index {path}: {e}")
+                continue
+            hashed += 1
+            if len(rows) >= self._batch_size:
+                self.add(rows)
+                rows.clear()
+        self.add(rows)
+
+        # Files that are gone from the library
+        if known:
+            with self._connect() as connection:
+                connection.executemany("DELETE FROM library WHERE path = ?", [(p,) for p in known])
+        logging.info(f"Indexed {hashed} files in {self.root}, removed {len(known)} files")
+        return hashed
+
+    def add(self, rows):
+        """Add or update files in the index in one transaction
+
+        Args:
+            rows: (path, size, mtime_ns, checksum) tuples
+        """
+        if not rows:
+            return
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO library VALUES (?, ?, ?, ?, ?)",
+                [(self.root, os.path.abspath(path), *row) for path, *row in rows],
+            )
+
+    def sizes(self):
+        """Return the set of file sizes in the library"""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT DISTINCT size FROM library WHERE root = ?", (self.root,)
+            )
+            return {size for (size,) in rows}
+
+    def find(self, contents, batch_size=400):
+        """Find files in the library by content
+
+        Args:
+            contents: (size, checksum) pairs to look up
+            batch_size: number of pairs to look up per query
+
+        Returns:
+            dict: (size, checksum) mapped to the path of a file in the library
+        """
+        contents = list(set(contents))
+        found = {}
+        with self._connect() as connection:
+            for i in range(0, len(contents), batch_size):
+                batch = contents[i : i + batch_size]
+                values = ", ".join(["(?, ?)"] * len(batch))
+                rows = connection.execute(
+                    "SELECT size, checksum, path FROM library "
+                    f"WHERE root = ? AND (size, checksum) IN (VALUES {values})",
+                    [self.root, *(x for pair in batch for x in pair)],
+                )
+                for size, checksum, path in rows:
+                    found.setdefault((size, checksum), path)
+        return found
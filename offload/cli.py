@@ -8,8 +8,8 @@ import argparse
 import os
 from pathlib import Path
 
-from offload import utils
-from offload.app import Offloader
+from offload import CATALOG_PATH, utils
+from offload.app import Offloader, SessionJournal, TransferPlan
 from offload.utils import Settings
 
 
@@ -25,33 +25,135 @@ def cli():
         "-d", "--destination", type=str, help="The destination folder", action="store"
     )
 
+    parser.add_argument(
+        "-b",
+        "--backup",
+        type=str,
+        dest="backups",
+        help="A backup folder to also write every file to. Can be used more than once",
+        action="append",
+    )
+
     parser.add_argument(
         "-f",
         "--folder-structure",
-        choices=["original", "taken_date", "offload_date", "year", "year_month", "flat"],
         dest="structure",
         default="taken_date",
-        help="Set the folder structure.\nDefault: taken_date",
+        help='Set the folder structure. "taken_date", "offload_date", "year", "year_month" or '
+        '"flat", or a template like "{date.year}/{model}".\nDefault: taken_date',
         action="store",
     )
 
-    parser.add_argument("-n", "--name", type=str, help="Set a new filename", action="store")
+    parser.add_argument(
+        "-n",
+        "--name",
+        type=str,
+        help='Set a new filename. "camera_make", "camera_model" or a template like '
+        '"{model}_{seq:04}"',
+        action="store",
+    )
 
     parser.add_argument(
         "-p",
         "--prefix",
         help='Set the filename prefix. Enter a custom prefix, "taken_date", "taken_date_time" or '
-        '"offload_date" for templates. "none" for no prefix.\nDefault: taken_date',
+        '"offload_date" for templates, or a template like "{date:%%Y%%m%%d}_{make}". "none" for no '
+        "prefix.\nDefault: taken_date",
         default="taken_date",
         action="store",
     )
 
     parser.add_argument("-m", "--move", help="Move files instead of copy", action="store_true")
 
+    parser.add_argument(
+        "--clone",
+        help="Clone files instead of copying them, or rename them when moving, if the source "
+        "and destination are on the same filesystem",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--skip-policy",
+        choices=["size_mtime", "partial_hash", "full_hash"],
+        default="size_mtime",
+        help="How to decide that a file already in the destination is the same as the source "
+        "file.\nDefault: size_mtime",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--preserve-permissions",
+        help="Copy file permissions along with the timestamps",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--preserve-xattrs",
+        help="Copy extended attributes along with the timestamps",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--catalog",
+        help="Skip files that have already been offloaded to the destination, according to the "
+        "ingest catalog, and add the offloaded files to it",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--dedupe",
+        choices=["skip", "hardlink"],
+        help="Skip files that already exist anywhere in the destination, or hardlink them "
+        "to the existing file",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--plan",
+        help="Plan the offload and save the plan to a JSON file without transferring anything",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--execute",
+        help="Run a plan saved with --plan",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--resume",
+        nargs="?",
+        const="latest",
+        help="Resume an interrupted offload from its session journal, by default the latest "
+        "one in the reports folder",
+        action="store",
+    )
+
     parser.add_argument(
         "--dryrun", help="Run the script without actually changing any files", action="store_true"
     )
 
+    parser.add_argument(
+        "--pipeline",
+        help="Start transferring files while the source is still being scanned. Files are "
+        "transferred in the order they are found instead of by modification date",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of small files to transfer at the same time.\nDefault: 1",
+        action="store",
+    )
+
+    parser.add_argument(
+        "--log-summary",
+        help="Log one line per file instead of every step of the transfer",
+        action="store_true",
+    )
+
     parser.add_argument(
         "--debug-log",
         dest="log_level",
@@ -62,6 +164,14 @@ def cli():
     # Execute the parse_args() method
     args = parser.parse_args()
 
+    # Report a typo in a naming template before anything else is asked for
+    try:
+        utils.Template(utils.structure_template(args.structure))
+        utils.Template(utils.PREFIX_TEMPLATES.get(args.prefix, args.prefix))
+        utils.Template(utils.FILENAME_TEMPLATES.get(args.name, args.name))
+    except ValueError as e:
+        parser.error(str(e))
+
     # Print the title
     print("================")
     print("CAMERA OFFLOADER")
@@ -70,6 +180,23 @@ def cli():
 
     confirmation = False
 
+    # Source and destination of a saved plan
+    plan = None
+    if args.execute:
+        plan = TransferPlan.load(args.execute)
+        args.source = str(plan.source)
+        args.destination = str(plan.destination)
+
+    # Source and destination of an interrupted offload
+    resume = None
+    if args.resume:
+        journal = SessionJournal.latest() if args.resume == "latest" else args.resume
+        if journal is None:
+            parser.error("No session journal to resume")
+        resume = SessionJournal.load(journal)
+        args.source = str(resume.plan.source)
+        args.destination = str(resume.plan.destination)
+
     if args.source is None:
         confirmation = True
         volumes = {}
@@ -156,6 +283,8 @@ def cli():
         print("\nPre-transfer summary\n")
         print(f"Source path: {source}")
         print(f"Destination path: {destination}")
+        for backup in args.backups or []:
+            print(f"Backup path: {backup}")
         print("")
         print(f"Mode: {mode}")
         print(f"Folder structure: {folder_structure}")
@@ -182,8 +311,23 @@ def cli():
         mode=mode,
         dryrun=args.dryrun,
         log_level=log_level,
+        pipeline=args.pipeline,
+        workers=args.workers,
+        clone=args.clone,
+        backups=args.backups,
+        skip_policy=args.skip_policy,
+        preserve_permissions=args.preserve_permissions,
+        preserve_xattrs=args.preserve_xattrs,
+        catalog=CATALOG_PATH if args.catalog else None,
+        dedupe=args.dedupe,
+        plan=plan,
+        log_summary=args.log_summary,
+        resume=resume,
     )
-    ol.offload()
+    if args.plan:
+        ol.plan().save(args.plan)
+    else:
+        ol.offload()
 
 
 def main():
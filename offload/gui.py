@@ -30,10 +30,10 @@ from PyQt5.QtWidgets import (
     QWidget,
 )
 
-from offload import APP_DATA_PATH, VERSION, utils
+from offload import APP_DATA_PATH, EXCLUDE_FILES, VERSION, utils
 from offload.app import Offloader
 from offload.styles import COLORS, STYLES
-from offload.utils import File, Settings, disk_usage, setup_logger
+from offload.utils import File, FileList, Settings, disk_usage, setup_logger
 
 setup_logger("debug")
 
@@ -80,28 +80,39 @@ class QHLine(QFrame):
         self.setFrameShadow(QFrame.Sunken)
 
 
-class Timer(QThread):
-    _time_signal = pyqtSignal(float)
+class SourceScanner(QThread):
+    """Scan a source folder in the background and send the running totals"""
 
-    def __init__(self):
-        super().__init__()
-        self.start_time = time.time()
-        self.time_left = 1
-        self.running = True
+    _progress_signal = pyqtSignal(int, object)
+    _finished_signal = pyqtSignal(object)
 
-    @property
-    def running_time(self):
-        return time.time() - self.start_time
+    def __init__(self, path, exclude=None, interval=0.1, parent=None):
+        """
+        Args:
+            path: the folder to scan
+            exclude: list of file and folder names or glob patterns to leave out
+            interval: minimum number of seconds between progress signals
+            parent: the owner of the thread
+        """
+        super().__init__(parent)
+        self.path = Path(path)
+        self.exclude = exclude
+        self.interval = interval
+        self._running = True
 
     def run(self):
-        print(self.time_left)
-        while True:
-            self._time_signal.emit(self.time_left)
-            if self.time_left > 0:
-                self.time_left -= 1
-            time.sleep(1)
-            if not self.running:
-                break
+        source_files = FileList(self.path, exclude=self.exclude, scan=False)
+        emitted = time.monotonic()
+        for _ in source_files.scan():
+            if not self._running:
+                logging.info(f"Stopped scanning {self.path}")
+                return
+            now = time.monotonic()
+            if now - emitted >= self.interval:
+                self._progress_signal.emit(source_files.count, source_files.size)
+                emitted = now
+        self._progress_signal.emit(source_files.count, source_files.size)
+        self._finished_signal.emit(source_files)
 
 
 class SettingsDialog(QDialog):
@@ -262,6 +273,7 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(self._centralWidget)
 
         self.offloader = None
+        self.scanner = None
         self.settings = Settings()
 
         # Paths
@@ -307,9 +319,9 @@ class MainWindow(QMainWindow):
         # Show UI
         self.show()
 
-        # Init offload
+        # Scan the source, the offloader is set up when the scan is done
         if self.sourcePath:
-            self.initOffloader()
+            self.scanSource()
 
     def initUI(self):
         mainLayout = QVBoxLayout()
@@ -396,6 +408,12 @@ class MainWindow(QMainWindow):
         self.offloadButton.setObjectName("offload-btn")
         self.offloadButton.clicked.connect(self.offload)
         mainLayout.addWidget(self.offloadButton, 0, QtCore.Qt.AlignCenter)
+
+        # Pause button, only shown while offloading
+        self.pauseButton = QPushButton("Pause")
+        self.pauseButton.clicked.connect(self.pauseOffload)
+        self.pauseButton.hide()
+        mainLayout.addWidget(self.pauseButton, 0, QtCore.Qt.AlignCenter)
         # mainLayout.addSpacing(5)
         # mainLayout.addWidget(QTextBrowser())
 
@@ -412,18 +430,19 @@ class MainWindow(QMainWindow):
         # self.offloader.update_from_settings()
 
     def updateProgressBar(self, progress):
-        self.progressBar.setValue(int(progress.get("percentage", 0)))
-        self.progressFiles.setText(progress.get("action", ""))
-        self.progressPercent.setText(f"{int(progress.get('percentage', ''))}%")
-        self.timer.time_left = progress.get("time")
-        if progress["is_finished"] and self.offloader._running:
+        self.progressBar.setValue(int(progress.percentage))
+        self.progressFiles.setText(progress.action)
+        self.progressPercent.setText(f"{int(progress.percentage)}%")
+        if progress.time_remaining:
+            self.updateTime(progress.time_remaining)
+        if progress.is_finished and self.offloader._running:
             self.finished()
-        elif progress["is_finished"] and not self.offloader._running:
+        elif progress.is_finished and not self.offloader._running:
             self.canceled()
         self.updateDestInfo()
 
     def canceled(self):
-        self.timer.running = False
+        self.pauseButton.hide()
         self.progressFiles.setText("Writing report")
         self.progressTime.setText("Offload canceled")
         self.offloadButton.setText("Canceled")
@@ -434,13 +453,13 @@ class MainWindow(QMainWindow):
         self.offloadButton.clicked.connect(self.close)
 
     def finished(self):
+        self.pauseButton.hide()
         self.progressBar.setValue(100)
         self.progressBar.setStyleSheet(
             f"QProgressBar::chunk {{background: {COLORS['green']}; border-radius: 5px;}}"
         )
         self.progressPercent.setText("100%")
         self.progressTime.setText("Finished")
-        self.timer.running = False
         self.offloadButton.setText("Done")
         self.offloadButton.setStyleSheet(
             f"#offload-btn {{background:{self.colors['green']};color:{self.colors['bg']};}}"
@@ -453,8 +472,8 @@ class MainWindow(QMainWindow):
 
     def offload(self):
         if self.sourcePath:
-            self.timer.start()
             self.offloader.start()
+            self.pauseButton.show()
             self.offloadButton.setText("Offloading")
             self.offloadButton.setStyleSheet(self.styleOffloadBtnActive)
             self.offloadButton.clicked.disconnect()
@@ -462,9 +481,18 @@ class MainWindow(QMainWindow):
 
     def stopOffload(self):
         """Cancel the running offload"""
-        self.offloader._running = False
+        self.offloader.cancel()
+
+    def pauseOffload(self):
+        """Pause the running offload or resume it"""
+        if self.offloader.paused:
+            self.offloader.resume()
+            self.pauseButton.setText("Pause")
+        else:
+            self.offloader.pause()
+            self.pauseButton.setText("Resume")
 
-    def initOffloader(self):
+    def initOffloader(self, source_files):
         self.offloader = Offloader(
             source=self.sourcePath,
             dest=self.destPath,
@@ -474,13 +502,39 @@ class MainWindow(QMainWindow):
             mode="copy",
             dryrun=False,
             log_level="debug",
+            source_files=source_files,
         )
         self.offloader._progress_signal.connect(self.updateProgressBar)
-        self.timer = Timer()
-        self.timer._time_signal.connect(self.updateTime)
         self.updateSourceInfo()
         self.updateDestInfo()
 
+    def scanSource(self):
+        """Scan the source in the background, a scan that is still running is stopped"""
+        if self.scanner is not None:
+            self.scanner._running = False
+        self.offloadButton.setEnabled(False)
+        self.sourceInfoLabel.setText("Scanning...")
+        self.scanner = SourceScanner(self.sourcePath, exclude=EXCLUDE_FILES, parent=self)
+        self.scanner._progress_signal.connect(self.updateScanProgress)
+        self.scanner._finished_signal.connect(self.scanFinished)
+        self.scanner.start()
+
+    def updateScanProgress(self, count, size):
+        if self.sender() is self.scanner:
+            self.sourceInfoLabel.setText(f"{count} files, {utils.convert_size(size)}")
+
+    def scanFinished(self, source_files):
+        """Hand the scanned files to the offloader"""
+        if self.sender() is not self.scanner:
+            # The source has changed since this scan started
+            return
+        if self.offloader is None:
+            self.initOffloader(source_files)
+        else:
+            self.offloader.use_source_files(source_files)
+            self.updateSourceInfo()
+        self.offloadButton.setEnabled(True)
+
     def updateSourceInfo(self):
         self.sourceInfoLabel.setText(
             f"{self.offloader.source_files.count} files, {self.offloader.source_files.hsize}"
@@ -556,8 +610,6 @@ class MainWindow(QMainWindow):
 
         if path:
             self.sourcePath = path
-            if not self.offloader:
-                self.initOffloader()
             self.updateSource()
 
     def browseDest(self):
@@ -568,7 +620,8 @@ class MainWindow(QMainWindow):
             self.settings.latest_destination = self.destPath
             self.updateDest()
             # Update offload
-            self.offloader.destination = self.destPath
+            if self.offloader is not None:
+                self.offloader.destination = self.destPath
 
     def updateSource(self):
         # Update ui
@@ -576,8 +629,7 @@ class MainWindow(QMainWindow):
         self.sourcePathLabel.setText(self.pathLabelText(self.sourcePath))
 
         # Update offload
-        self.offloader.source = self.sourcePath
-        self.updateSourceInfo()
+        self.scanSource()
 
     def updateDest(self):
         self.destTitleLabel.setText(self.destPath.name)
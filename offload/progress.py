@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+"""
+progress.py
+Progress of an offload, counted in bytes while files are copied and verified.
+"""
+
+import collections
+import threading
+import time
+
+# Phases of a file transfer that are timed separately
+PHASES = ("copy", "verify")
+
+_ProgressSnapshot = collections.namedtuple(
+    "ProgressSnapshot",
+    "action files_done files_total bytes_done bytes_total bytes_copied bytes_verified elapsed "
+    "time_remaining is_finished copy_rate verify_rate",
+    defaults=(0.0, 0.0),
+)
+
+
+class ProgressSnapshot(_ProgressSnapshot):
+    """Progress of an offload at one point in time
+
+    bytes_done counts the files that are finished in full and the files in flight by how far
+    they have been copied and verified. bytes_copied and bytes_verified are the bytes that have
+    actually been read from the sources and read back from the destinations.
+    """
+
+    __slots__ = ()
+
+    @property
+    def percentage(self):
+        """Return how far along the offload is in percent"""
+        if not self.bytes_total:
+            return 100.0 if self.is_finished else 0.0
+        return min(round(self.bytes_done / self.bytes_total * 100, 2), 100.0)
+
+
+class ThroughputEstimator:
+    """Smoothed rates of the copy and verify phases, used to estimate the time remaining
+
+    Every chunk is timed by the thread that processed it. Chunks after the first one of a phase
+    give the streaming rate of the phase. The first chunk also includes opening the files, the
+    time it took on top of the streaming rate is counted as time per file. So a card with
+    thousands of small files and a few large ones is estimated by both its bytes and its files.
+
+    All averages are exponentially weighted by time, a sample counts for less the older it is.
+    """
+
+    def __init__(self, half_life=5.0):
+        """
+        Args:
+            half_life: seconds after which a sample counts for half as much
+        """
+        self.half_life = half_life
+        # Bytes per second after the first chunk, and of first chunks before that is known
+        self.rates = dict.fromkeys(PHASES)
+        self._first_rates = dict.fromkeys(PHASES)
+        # Seconds per file on top of the streaming rate
+        self.file_times = dict.fromkeys(PHASES)
+        # Seconds spent in chunks per second of wall time, higher with several workers
+        self.concurrency = None
+
+    def _average(self, average, value, seconds):
+        """Return the average updated with a value that took a number of seconds"""
+        if average is None:
+            return value
+        weight = 1 - 0.5 ** (seconds / self.half_life)
+        return average + weight * (value - average)
+
+    def chunk(self, phase, size, seconds, first=False):
+        """Add a timed chunk
+
+        Args:
+            phase: copy or verify
+            size: size of the chunk in bytes
+            seconds: time it took to process the chunk
+            first: the chunk is the first of the phase for its file
+        """
+        if seconds <= 0:
+            return
+        rate = self.rates[phase]
+        if not first:
+            self.rates[phase] = self._average(rate, size / seconds, seconds)
+        elif rate:
+            setup = max(seconds - size / rate, 0.0)
+            self.file_times[phase] = self._average(self.file_times[phase], setup, seconds)
+        else:
+            self._first_rates[phase] = self._average(
+                self._first_rates[phase], size / seconds, seconds
+            )
+
+    def busy(self, wall, busy):
+        """Add the time spent in chunks during a period of wall time"""
+        if wall > 0 and busy > 0:
+            self.concurrency = self._average(self.concurrency, busy / wall, wall)
+
+    def rate(self, phase):
+        """Return the bytes per second of a phase, or None if nothing has been timed yet"""
+        return (
+            self.rates[phase]
+            or self._first_rates[phase]
+            or self.rates["copy"]
+            or self._first_rates["copy"]
+        )
+
+    def remaining(self, copy_bytes, verify_bytes, files):
+        """Estimate the time it takes to process what is left
+
+        Args:
+            copy_bytes: bytes left to copy
+            verify_bytes: bytes left to verify
+            files: number of files left
+
+        Returns:
+            float: seconds remaining, None if nothing has been timed yet
+        """
+        seconds = 0.0
+        for phase, size in zip(PHASES, (copy_bytes, verify_bytes), strict=True):
+            rate = self.rate(phase)
+            if not rate:
+                return None
+            seconds += size / rate + files * (self.file_times[phase] or 0.0)
+        # Time spent outside the chunks, like planning and finishing files, counts as well
+        return seconds / max(self.concurrency or 1.0, 0.1)
+
+
+class FileProgress:
+    """Progress of a single file, fed by the copy and verify loops"""
+
+    __slots__ = ("_reporter", "_targets", "_last", "_phases", "copied_bytes", "verified_bytes")
+
+    def __init__(self, reporter, targets=1):
+        """
+        Args:
+            reporter: the ProgressReporter of the offload
+            targets: number of destinations the file is copied to and verified at
+        """
+        self._reporter = reporter
+        self._targets = max(1, targets)
+        self._last = time.monotonic()
+        self._phases = set()
+        self.copied_bytes = 0
+        self.verified_bytes = 0
+
+    @property
+    def done(self):
+        """Bytes of the file counted as done, copying is half the work and verifying the other"""
+        return self.copied_bytes / 2 + self.verified_bytes / 2 / self._targets
+
+    def copied(self, size):
+        """Add bytes read from the source and written to the destinations"""
+        self._reporter._add(self, "copy", size)
+
+    def verified(self, size):
+        """Add bytes read back from one of the destinations"""
+        self._reporter._add(self, "verify", size)
+
+    def reset(self):
+        """Start the file over, when it's copied again from the start"""
+        self._reporter._reset(self)
+
+
+class ProgressReporter:
+    """Collect the progress of an offload from any thread and pass on snapshots of it
+
+    Updates are coalesced, the callback gets at most one snapshot per interval however many
+    chunks and files are processed.
+    """
+
+    def __init__(self, callback=None, bytes_total=0, files_total=0, interval=0.1, targets=1):
+        """
+        Args:
+            callback: called with a ProgressSnapshot
+            bytes_total: size of all files in the offload
+            files_total: number of files in the offload
+            interval: minimum number of seconds between snapshots
+            targets: number of destinations every file is copied to and verified at
+        """
+        self.callback = callback
+        self.bytes_total = bytes_total
+        self.files_total = files_total
+        self.interval = interval
+        self.targets = max(1, targets)
+        self.estimator = ThroughputEstimator()
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._emitted = float("-inf")
+        self._sampled = self._started
+        self._busy = 0.0
+        self._action = ""
+        self._files = {}
+        self._files_done = 0
+        self._bytes_finished = 0
+        self._bytes_in_flight = 0.0
+        self._copied_in_flight = 0
+        self._verified_in_flight = 0
+        self._bytes_copied = 0
+        self._bytes_verified = 0
+
+    def file(self, key, targets=1):
+        """Return the progress of a file in flight, created the first time it's asked for
+
+        Args:
+            key: the source file
+            targets: number of destinations the file is copied to
+
+        Returns:
+            FileProgress: the progress of the file
+        """
+        with self._lock:
+            progress = self._files.get(key)
+            if progress is None:
+                progress = self._files[key] = FileProgress(self, targets)
+            return progress
+
+    def set_action(self, action, force=False):
+        """Set the text describing what the offload is doing
+
+        Args:
+            action: the text
+            force: pass a snapshot whatever the time since the last one
+        """
+        self._action = action
+        self.update(force=force)
+
+    def finish_file(self, key, size):
+        """Count a file as done, whether it was transferred, skipped or failed
+
+        Args:
+            key: the source file
+            size: size of the source file
+        """
+        with self._lock:
+            progress = self._files.pop(key, None)
+            if progress is not None:
+                self._bytes_in_flight -= progress.done
+                self._copied_in_flight -= progress.copied_bytes
+                self._verified_in_flight -= progress.verified_bytes
+            self._bytes_finished += size
+            self._files_done += 1
+        self.update()
+
+    def _add(self, progress, phase, size):
+        now = time.monotonic()
+        with self._lock:
+            seconds = now - progress._last
+            progress._last = now
+            self._busy += seconds
+            self.estimator.chunk(phase, size, seconds, first=phase not in progress._phases)
+            progress._phases.add(phase)
+
+            done = progress.done
+            if phase == "copy":
+                progress.copied_bytes += size
+                self._bytes_copied += size
+                self._copied_in_flight += size
+            else:
+                progress.verified_bytes += size
+                self._bytes_verified += size
+                self._verified_in_flight += size
+            self._bytes_in_flight += progress.done - done
+        self.update()
+
+    def _reset(self, progress):
+        with self._lock:
+            self._bytes_in_flight -= progress.done
+            self._copied_in_flight -= progress.copied_bytes
+            self._verified_in_flight -= progress.verified_bytes
+            progress.copied_bytes = 0
+            progress.verified_bytes = 0
+            progress._phases.clear()
+            progress._last = time.monotonic()
+        self.update()
+
+    def snapshot(self, is_finished=False):
+        """Return the current progress
+
+        Args:
+            is_finished: mark the snapshot as the last one of the offload
+
+        Returns:
+            ProgressSnapshot: the progress
+        """
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._started
+            self.estimator.busy(now - self._sampled, self._busy)
+            self._sampled = now
+            self._busy = 0.0
+
+            bytes_done = self._bytes_finished + int(self._bytes_in_flight)
+            remaining = 0.0
+            if not is_finished:
+                left = max(self.bytes_total - self._bytes_finished, 0)
+                remaining = self.estimator.remaining(
+                    max(left - self._copied_in_flight, 0),
+                    max(left * self.targets - self._verified_in_flight, 0),
+                    max(self.files_total - self._files_done, 0),
+                )
+                if remaining is None:
+                    # Nothing has been timed yet
+                    remaining = 0.0
+            return ProgressSnapshot(
+                self._action,
+                self._files_done,
+                self.files_total,
+                bytes_done,
+                self.bytes_total,
+                self._bytes_copied,
+                self._bytes_verified,
+                elapsed,
+                remaining,
+                is_finished,
+                self.estimator.rate("copy") or 0.0,
+                self.estimator.rate("verify") or 0.0,
+            )
+
+    def update(self, force=False):
+        """Pass a snapshot to the callback if the last one is older than the interval
+
+        Args:
+            force: pass a snapshot whatever the time since the last one
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._emitted < self.interval:
+                return
+            self._emitted = now
+        if self.callback is not None:
+            self.callback(self.snapshot())
+
+    def finish(self):
+        """Pass the last snapshot to the callback"""
+        if self.callback is not None:
+            self.callback(self.snapshot(is_finished=True))
@@ -4,15 +4,25 @@ script_name.py
 Description of script_name.py.
 """
 
+import atexit
+import errno
+import fnmatch
+import functools
 import hashlib
 import json
 import logging
+import logging.handlers
 import math
 import os
+import queue
 import random
+import re
 import shutil
+import stat
 import string
 import subprocess
+import sys
+import threading
 import time
 from collections import namedtuple
 from datetime import datetime
@@ -24,49 +34,229 @@ from PIL.ExifTags import TAGS
 
 from offload import APP_DATA_PATH, LOGS_PATH
 
+# Copy file data inside the kernel instead of through Python where the platform supports it
+KERNEL_COPY = sys.platform.startswith("linux") and (
+    hasattr(os, "copy_file_range") or hasattr(os, "sendfile")
+)
+# Errors meaning the kernel can't copy between the two files and a regular copy should be used
+KERNEL_COPY_ERRORS = {
+    errno.ENOSYS,
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.EBADF,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+}
+# ioctl request for creating a copy-on-write clone of a file on Linux (btrfs, XFS)
+FICLONE = 0x40049409
+# How to decide that a file already in the destination is the same as the source
+SKIP_POLICIES = ("size_mtime", "partial_hash", "full_hash")
+# Number of bytes hashed at the start, middle and end of a file for a partial checksum
+PARTIAL_BLOCK_SIZE = 1048576
+
+
+# Naming presets as templates, see Template for the fields
+STRUCTURE_TEMPLATES = {
+    "taken_date": "{date.year}/{date:%Y-%m-%d}",
+    "offload_date": "{today.year}/{today:%Y-%m-%d}",
+    "year_month": "{date.year}/{date:%m}",
+    "year": "{date.year}",
+    "flat": "",
+}
+PREFIX_TEMPLATES = {
+    "None": None,
+    "": None,
+    "empty": None,
+    "taken_date": "{date:%y%m%d}",
+    "taken_date_time": "{date:%y%m%d_%H%M%S}",
+    "offload_date": "{today:%y%m%d}",
+}
+FILENAME_TEMPLATES = {"original": None, "camera_make": "{make}", "camera_model": "{model}"}
+# Exif tags of the filename presets and template fields
+FILENAME_EXIF_TAGS = {"camera_make": "Make", "camera_model": "Model"}
+TEMPLATE_EXIF_TAGS = {"make": "Make", "model": "Model"}
+
 
 class Preset:
     @staticmethod
     def structure(preset):
-        presets = {
-            "taken_date": "{date.year}/{date:%Y-%m-%d}",
+        if preset == "offload_date":
             # The datetime needs to be formatted here to prevent KeyError
-            "offload_date": f"{datetime.now().strftime('%Y')}/{datetime.now().strftime('%Y-%m-%d')}",
-            "year_month": "{date.year}/{date:%m}",
-            "year": "{date.year}",
-            "flat": "",
-        }
-        return presets.get(preset)
+            return STRUCTURE_TEMPLATES[preset].format(today=datetime.now())
+        return STRUCTURE_TEMPLATES.get(preset)
 
     @staticmethod
     def filename(preset):
-        presets = {"original": None, "camera_make": "Make", "camera_model": "Model"}
-        return presets.get(preset)
+        return FILENAME_EXIF_TAGS.get(preset)
 
     @staticmethod
     def prefix(preset):
-        presets = {
-            "None": None,
-            "": None,
-            "empty": None,
-            "taken_date": "{date:%y%m%d}",
-            "taken_date_time": "{date:%y%m%d_%H%M%S}",
+        if preset == "offload_date":
             # The datetime needs to be formatted here to prevent KeyError
-            "offload_date": f"{datetime.now().strftime('%y%m%d')}",
-        }
-        return presets.get(preset)
+            return PREFIX_TEMPLATES[preset].format(today=datetime.now())
+        return PREFIX_TEMPLATES.get(preset)
+
+
+class Template:
+    """A naming template that is parsed once and formatted many times
+
+    Templates use the str.format syntax with these fields:
+        - date: the date the file was taken, e.g. {date:%Y-%m-%d} or {date.year}
+        - today: the date of the offload
+        - make and model: the camera make and model from the exif data
+        - name: the original filename without extension
+        - ext: the file extension
+        - seq: the number of the file in the offload, e.g. {seq:04}
+
+    Values that aren't given or are None are filled in from DEFAULTS, "unknown" for the text
+    fields and 1 for seq.
+
+    Date fields are formatted once per unique date, per day if the template only uses the
+    date and per timestamp otherwise, and the other values are made safe for all filesystems
+    like validate_string does, once per unique value.
+    """
+
+    FIELDS = ("date", "today", "make", "model", "name", "ext", "seq")
+    DEFAULTS = {
+        "make": "unknown",
+        "model": "unknown",
+        "name": "unknown",
+        "ext": "unknown",
+        "seq": 1,
+    }
+
+    # Date attributes and strftime directives that don't depend on the time of day
+    _DAY_ATTRIBUTES = {"year", "month", "day"}
+    _DAY_DIRECTIVES = set("aAbBCdDeFgGhjmntuUVwWxyY%")
+    _DIRECTIVE = re.compile(r"%[-_0^#]*(.?)")
+
+    def __init__(self, template, today=None):
+        """Compile a template
+
+        Args:
+            template: the template string, None or empty for an empty result
+            today: the date to use for the today field, defaults to now
+
+        Raises:
+            ValueError: if the template uses a field that isn't known or isn't valid
+        """
+        self.template = template or ""
+        self.today = today or datetime.now()
+        self.fields = set()
+
+        fmt = []
+        date_fmt = []
+        per_day = True
+        try:
+            parsed = list(string.Formatter().parse(self.template))
+        except ValueError as e:
+            raise ValueError(f"Invalid template {self.template!r}: {e}") from None
+        for literal, field, spec, conversion in parsed:
+            fmt.append(literal.replace("{", "{{").replace("}", "}}"))
+            if field is None:
+                continue
+            name = re.split(r"[.\[]", field, maxsplit=1)[0]
+            if name not in self.FIELDS:
+                raise ValueError(
+                    f"Unknown field {{{name}}} in template {self.template!r}, "
+                    f"use {', '.join(self.FIELDS)}"
+                )
+            self.fields.add(name)
+            replacement = "{" + field + (f"!{conversion}" if conversion else "")
+            replacement += f":{spec}}}" if spec else "}"
+            if name not in ("date", "today"):
+                fmt.append(replacement)
+                continue
+
+            # Date fields are formatted ahead and passed as positional arguments
+            fmt.append(f"{{{len(date_fmt)}}}")
+            date_fmt.append(replacement)
+            if name == "date" and not self._is_per_day(field[len(name) :], spec, conversion):
+                per_day = False
+
+        self._format = "".join(fmt).format
+        self._per_day = per_day
+        self._date_format = "\0".join(date_fmt).format if date_fmt else None
+        self._dates = {}
+        self._valid = {}
+        self._values = tuple(self.fields - {"date", "today"})
+
+    def __repr__(self):
+        return f"Template({self.template!r})"
+
+    @classmethod
+    def _is_per_day(cls, attribute, spec, conversion):
+        """Return True if a date field gives the same result for every time of the same day
+
+        Args:
+            attribute: the part of the field after the name, e.g. .year
+            spec: the format spec
+            conversion: the conversion, e.g. r for !r
+        """
+        if conversion:
+            return False
+        if attribute:
+            return attribute[1:] in cls._DAY_ATTRIBUTES and attribute[0] == "."
+        # An empty spec gives the full timestamp
+        return bool(spec) and all(d in cls._DAY_DIRECTIVES for d in cls._DIRECTIVE.findall(spec))
+
+    def format(self, date=None, **values):
+        """Format the template
+
+        Args:
+            date: the date the file was taken
+            **values: make, model, name, ext and seq, see DEFAULTS for missing values
+
+        Returns:
+            str: the formatted template
+        """
+        dates = ()
+        if self._date_format is not None:
+            if date is None:
+                date = self.today
+            # Files from the same day share a cache entry if only the date is used
+            key = date.toordinal() if self._per_day else date
+            dates = self._dates.get(key)
+            if dates is None:
+                if len(self._dates) >= 4096:
+                    self._dates.clear()
+                dates = self._date_format(date=date, today=self.today).split("\0")
+                if not self._values:
+                    # Nothing else to fill in, so the result itself is cached
+                    dates = self._format(*dates)
+                self._dates[key] = dates
+            if not self._values:
+                return dates
+        for key in self._values:
+            value = values.get(key)
+            if value is None:
+                value = values[key] = self.DEFAULTS[key]
+            if value.__class__ is str:
+                valid = self._valid.get(value)
+                if valid is None:
+                    if len(self._valid) >= 4096:
+                        self._valid.clear()
+                    valid = self._valid[value] = value.translate(VALID_CHARACTERS)
+                values[key] = valid
+        return self._format(*dates, **values)
 
 
 class FileList:
-    def __init__(self, path, exclude=None):
+    def __init__(self, path, exclude=None, scan=True):
         """A list of files as File objects
 
+        The total size and file count are kept up to date as files are added and removed, so
+        reading them doesn't touch the files.
+
         Args:
             path: path to the root directory to scan for files
             exclude: list of filenames to ignore when adding files to list
+            scan: scan the path right away, otherwise use update() or scan() later
         """
         self._path = Path(path)
         self.files = []
+        self._sizes = {}
+        self._size = 0
 
         self.exclude = []
         if isinstance(exclude, list):
@@ -75,7 +265,13 @@ class FileList:
             self.exclude.append(exclude)
 
         # Update file list
-        self.update()
+        if scan:
+            self.update()
+
+    @property
+    def path(self) -> Path:
+        """Return the root directory of the list"""
+        return self._path
 
     def sort(self):
         """Sort list by modification date"""
@@ -83,20 +279,39 @@ class FileList:
 
     def update(self):
         """Get list of files in a folder and its subfolders"""
-        # Get all files in path
-        files = [x for x in self._path.rglob("*") if x.is_file() and x.name not in self.exclude]
-        logging.debug(f"All files in source: {files}")
-
-        # Create a dict with all files that aren't in exclude list
-        for n, f in enumerate(files):
-            logging.debug(f.name)
-            self.files.append(File(f))
-            logging.debug(f"Added {f.name} to file list ({n + 1}/{len(files)})")
+        for _ in self.scan():
+            pass
+        logging.debug(f"Added {self.count} files from {self._path} to file list")
+
+    def scan(self):
+        """Scan the folder and its subfolders, yielding each File as soon as it's added"""
+        for entry in scan_files(self._path, exclude=self.exclude):
+            file = File(entry.path, stat_result=entry.stat())
+            self.append(file)
+            yield file
+
+    def append(self, file):
+        """Add a File to the list"""
+        size = file.size
+        self.files.append(file)
+        self._sizes[file] = size
+        self._size += size
+
+    def remove(self, file):
+        """Remove a File from the list"""
+        self.files.remove(file)
+        self._size -= self._sizes.pop(file)
+
+    def filter(self, function):
+        """Only keep the files for which function(file) is true"""
+        self.files = [f for f in self.files if function(f)]
+        self._sizes = {f: self._sizes[f] for f in self.files}
+        self._size = sum(self._sizes.values())
 
     @property
     def size(self) -> int:
         """Return total file size of all files in list"""
-        return sum([x.size for x in self.files])
+        return self._size
 
     @property
     def hsize(self) -> str:
@@ -110,42 +325,220 @@ class FileList:
     @property
     def avg_file_size(self) -> int:
         """Return average file size of files in list"""
+        if not self.count:
+            return 0
         return int(self.size / self.count)
 
 
+class TransferInterrupted(Exception):
+    """A transfer was stopped between two chunks"""
+
+
+# Where a paused copy stopped: the number of bytes written and a hash object of those bytes
+CopyState = namedtuple("CopyState", "offset hasher")
+
+
+class TransferPaused(TransferInterrupted):
+    """A transfer was stopped because the offload is paused
+
+    A copy that was paused by checksum_copy sets state to a CopyState, which can be passed back
+    to continue the copy without hashing what was already written.
+    """
+
+    state = None
+
+
+class TransferCancelled(TransferInterrupted):
+    """A transfer was stopped because the offload is cancelled"""
+
+
+class TransferControl:
+    """Pause or cancel file transfers from another thread
+
+    The copy and hash loops call check() between chunks, which raises when the transfers have
+    to stop, so the files are closed while an offload is paused or cancelled.
+    """
+
+    def __init__(self):
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self.cancelled = False
+
+    @property
+    def paused(self):
+        """Return True if the transfers are paused"""
+        return not self._resumed.is_set()
+
+    def pause(self):
+        """Stop the transfers until resume() is called"""
+        self._resumed.clear()
+
+    def resume(self):
+        """Let paused transfers continue"""
+        self._resumed.set()
+
+    def cancel(self):
+        """Stop the transfers for good, paused transfers are woken up to stop"""
+        self.cancelled = True
+        self._resumed.set()
+
+    def check(self):
+        """Raise TransferCancelled or TransferPaused if the transfers have to stop"""
+        if self.cancelled:
+            raise TransferCancelled()
+        if not self._resumed.is_set():
+            raise TransferPaused()
+
+    def wait(self):
+        """Wait while the transfers are paused"""
+        self._resumed.wait()
+
+
+class DirectoryIndex:
+    """In-memory index of the files in a set of folders
+
+    Each folder is listed once with os.scandir when a path in it is first looked up, so checking
+    whether a file exists doesn't touch the disk. Files are only stat'ed when they are looked up
+    and the File objects are kept, along with their cached checksums. Files written while the
+    index is in use are added with add(), and paths can be reserved for files that are going to
+    be written. The index can be shared between threads.
+    """
+
+    def __init__(self):
+        self._folders = {}
+        self._lock = threading.Lock()
+
+    def _entries(self, folder: Path):
+        """Return the name to File mapping of a folder, listing the folder if needed"""
+        entries = self._folders.get(folder)
+        if entries is None:
+            try:
+                with os.scandir(folder) as it:
+                    entries = {entry.name: None for entry in it if entry.is_file()}
+            except (FileNotFoundError, NotADirectoryError):
+                entries = {}
+            entries = self._folders.setdefault(folder, entries)
+        return entries
+
+    def get(self, path: Path):
+        """Get the File at a path
+
+        Args:
+            path: path to the file
+
+        Returns:
+            File: the existing file or None if there is no file at the path
+        """
+        path = Path(path)
+        with self._lock:
+            entries = self._entries(path.parent)
+            if path.name not in entries:
+                return None
+            file = entries[path.name]
+            if file is None:
+                file = entries[path.name] = File(path)
+        return file if file.is_file else None
+
+    def add(self, file):
+        """Add or update a file that has been written
+
+        Args:
+            file: the File with a current stat snapshot
+        """
+        self.reserve(file.path, file)
+
+    def reserve(self, path: Path, file):
+        """Mark a path as taken by a file that is going to be written there
+
+        Args:
+            path: path to the file that will be written
+            file: a File with the same content, e.g. the source of the transfer
+        """
+        path = Path(path)
+        with self._lock:
+            self._entries(path.parent)[path.name] = file
+
+
 class File:
-    def __init__(self, path, prefix=None, incremental_padding=3):
+    __slots__ = (
+        "_path",
+        "_prefix",
+        "_name",
+        "_checksum",
+        "_checksum_key",
+        "_partial_checksum",
+        "_partial_checksum_key",
+        "_stat",
+        "_stat_path",
+        "inc",
+        "inc_pad",
+        "ext",
+        "relative_path",
+    )
+
+    def __init__(self, path, prefix=None, incremental_padding=3, stat_result=None, lazy=False):
         """File object.
 
         Args:
             path: path to an existing file or a placeholder path for new file
             prefix: custom prefix or based on a template
             incremental_padding: the amount of zero's too put before the incremental number
+            stat_result: an already known stat result for the path, e.g. from os.scandir
+            lazy: don't stat the file until the stat snapshot is needed
         """
         self._path = Path(path)
+        if stat_result is None and not lazy:
+            try:
+                stat_result = self._path.stat()
+            except OSError:
+                stat_result = None
         # Discard object if given path is a directory
-        if self._path.is_dir():
+        if stat_result is not None and stat.S_ISDIR(stat_result.st_mode):
             logging.error(f"{path} is a folder")
             exit()
         # Setup attributes
         self._checksum = ""
-        self._size = 0
+        self._checksum_key = None
+        self._partial_checksum = ""
+        self._partial_checksum_key = None
         self._prefix = prefix
         self._name = self._path.stem
         self.inc = 0
         self.inc_pad = incremental_padding
         self.ext = self._path.suffix.strip(".")
         self.relative_path = None
+        # Stat snapshot of the current path
+        self._stat_path = self.path
+        self._stat = stat_result if self._stat_path == self._path else None
+        if self._stat is not None and not stat.S_ISREG(self._stat.st_mode):
+            self._stat = None
+        if stat_result is None and lazy:
+            self._stat_path = None
+
+    def refresh(self):
+        """Take a new stat snapshot of the file
+
+        Returns: the stat result or None if the file doesn't exist
+        """
+        self._stat_path = self.path
+        self._stat = regular_file_stat(self._stat_path)
+        return self._stat
+
+    @property
+    def stat(self):
+        """Return the stat snapshot of the file, or None if it doesn't exist
+
+        A new snapshot is only taken when the path of the file has changed, call refresh() after
+        the file has been modified on disk.
+        """
+        if self._stat_path != self.path:
+            return self.refresh()
+        return self._stat
 
     @property
     def is_file(self):
         """Check if the file exists"""
-        exists = self.path.is_file()
-        # if exists:
-        #     logging.debug(f'{self.path} exists')
-        # else:
-        #     logging.debug(f'{self.path} does not exist')
-        return exists
+        return self.stat is not None
 
     @property
     def filename(self):
@@ -181,8 +574,9 @@ class File:
         # Set name from exif data based on a preset
         preset = Preset()
         if preset.filename(name):
-            logging.debug(self.exifdata)
-            new_name = self.exifdata.get(preset.filename(name), "unknown").lower()
+            exifdata = self.exifdata
+            logging.debug("Exif data of %s: %s", self.filename, exifdata)
+            new_name = exifdata.get(preset.filename(name), "unknown").lower()
 
         # Validate file name and remove/replace illegal characters
         if validate:
@@ -208,18 +602,72 @@ class File:
     def checksum(self):
         """Return the xxhash checksum of the file
 
+        The checksum is cached and only calculated again if the file has changed on disk.
+
         Returns: file checksum
         """
-        if self.is_file:
+        key = self._checksum_identity()
+        if key is not None and key != self._checksum_key:
             self._checksum = file_checksum(self.path)
+            self._checksum_key = key
+            if key[2] <= PARTIAL_BLOCK_SIZE * 3:
+                # Small files are hashed in full for the partial checksum as well
+                self._partial_checksum = self._checksum
+                self._partial_checksum_key = key
         return self._checksum
 
+    @property
+    def partial_checksum(self):
+        """Return the xxhash checksum of the start, middle and end of the file
+
+        Cached like the checksum of the whole file.
+
+        Returns: partial file checksum
+        """
+        key = self._checksum_identity()
+        if key is not None and key != self._partial_checksum_key:
+            self._partial_checksum = partial_checksum(self.path)
+            self._partial_checksum_key = key
+            if key[2] <= PARTIAL_BLOCK_SIZE * 3:
+                self._checksum = self._partial_checksum
+                self._checksum_key = key
+        return self._partial_checksum
+
+    def set_checksum(self, checksum):
+        """Seed the checksum cache with a checksum calculated elsewhere, e.g. while copying
+
+        Args:
+            checksum: xxhash checksum of the file as it currently is on disk
+        """
+        self._checksum = checksum
+        self._checksum_key = self._checksum_identity()
+
+    def _checksum_identity(self):
+        """Return the (st_dev, st_ino, st_size, st_mtime_ns) identity of the file, or None if
+        the file doesn't exist"""
+        st = self.refresh()
+        if st is None:
+            return None
+        return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _origin_stat(self):
+        """Return the stat snapshot of the file, falling back to the original path"""
+        st = self.stat
+        if st is None and self._path != self._stat_path:
+            st = regular_file_stat(self._path)
+        return st
+
     @property
     def size(self) -> int:
         """Return the size of the file if it exists"""
-        if self.is_file:
-            self._size = self.path.stat().st_size
-        return self._size
+        st = self.stat
+        return st.st_size if st is not None else 0
+
+    @property
+    def mtime_ns(self) -> int:
+        """Modification time of the file in nanoseconds, 0 if it doesn't exist"""
+        st = self.stat
+        return st.st_mtime_ns if st is not None else 0
 
     @property
     def mdate(self):
@@ -229,26 +677,18 @@ class File:
     @property
     def mtime(self):
         """Modification time of the file"""
-        if self.is_file:
-            if self.path.stat().st_mtime:
-                return self.path.stat().st_mtime
-
-        elif self._path.is_file():
-            if self._path.stat().st_mtime:
-                return self._path.stat().st_mtime
+        st = self._origin_stat()
+        if st is not None and st.st_mtime:
+            return st.st_mtime
 
         return datetime.timestamp(datetime.now())
 
     @property
     def ctime(self):
         """Modification time of the file"""
-        if self.is_file:
-            if self.path.stat().st_ctime:
-                return self.path.stat().st_ctime
-
-        elif self._path.is_file():
-            if self._path.stat().st_ctime:
-                return self._path.stat().st_ctime
+        st = self._origin_stat()
+        if st is not None and st.st_ctime:
+            return st.st_ctime
 
         return datetime.timestamp(datetime.now())
 
@@ -296,14 +736,38 @@ class File:
 
         # Get filename prefix presets
         logging.debug(f"Given prefix is {prefix}")
-        if Preset.prefix(prefix) or prefix in ("empty", ""):
-            self._prefix = Preset.prefix(prefix)
-            if self._prefix:
-                logging.debug(f"self._prefix = {self._prefix}")
-                self._prefix = self._prefix.format(date=date)
+        template = PREFIX_TEMPLATES.get(prefix)
+        if template is None and isinstance(prefix, str) and "{" in prefix:
+            # Custom template
+            template = prefix
+        if template or prefix in ("empty", ""):
+            self._prefix = None
+            if template:
+                logging.debug(f"Prefix template is {template}")
+                template = compile_template(template, datetime.now().date())
+                values = self.template_values(template.fields)
+                self._prefix = template.format(date=date, **values) or None
         else:
             self._prefix = prefix
 
+    def template_values(self, fields=(), seq=1):
+        """Return the template values of the file, see Template
+
+        Args:
+            fields: the template fields in use, the exif data is only read for make and model
+            seq: the number of the file in the offload
+
+        Returns:
+            dict: name, ext, seq and the exif fields, "unknown" if the exif data doesn't have them
+        """
+        values = {"name": self.name, "ext": self.ext, "seq": seq}
+        exif_fields = [f for f in fields if f in TEMPLATE_EXIF_TAGS]
+        if exif_fields:
+            exif = self.exifdata
+            for field in exif_fields:
+                values[field] = str(exif.get(TEMPLATE_EXIF_TAGS[field], "unknown")).lower()
+        return values
+
     @property
     def duration(self):
         """Get duration if possible"""
@@ -330,8 +794,9 @@ class File:
 
     def delete(self):
         """Delete the file"""
-        if self.path.is_file():
-            self.path.unlink()
+        if self.is_file:
+            self.path.unlink(missing_ok=True)
+            self.refresh()
 
 
 class Settings:
@@ -493,13 +958,36 @@ class Settings:
         self._write_settings(filename=preset)
 
 
+# Writes the records put on the logging queue in a background thread
+_log_listener = None
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves formatting the records to the listener thread
+
+    QueueHandler formats every record on the logging thread so it can be pickled, which isn't
+    needed for a queue in the same process. The record is queued as it is, with its arguments
+    and exception info, so objects passed as arguments should not be changed after logging.
+    """
+
+    def prepare(self, record):
+        return record
+
+
 def setup_logger(level="info"):
     """Create a logger with file and stream handler
+
+    Records are put on a queue and formatted and written by a background thread, so writing
+    the log never blocks the thread that is transferring files.
+
     :return logger object"""
+    global _log_listener
+
     # Create logger
     logger = logging.getLogger()
     if logger.hasHandlers():
         logger.handlers.clear()
+    stop_logger()
 
     if level == "debug":
         logger.setLevel(logging.DEBUG)
@@ -526,55 +1014,378 @@ def setup_logger(level="info"):
     ch.setFormatter(formatter)
     fh.setFormatter(formatter)
 
-    # Add handlers to logger
-    logger.addHandler(ch)
-    logger.addHandler(fh)
+    # Add queue handler to logger, the listener passes the records on to the other handlers
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    _log_listener = logging.handlers.QueueListener(log_queue, ch, fh, respect_handler_level=True)
+    _log_listener.start()
 
     return logger
 
 
-def file_checksum(filename, hashtype="xxhash", block_size=65536):
-    """Get the checksum for a file"""
+def stop_logger():
+    """Write the records left on the logging queue and stop the background writer"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.close()
+        _log_listener = None
+
+
+atexit.register(stop_logger)
+
+
+def file_checksum(filename, hashtype="xxhash", block_size=65536, progress=None):
+    """Get the checksum for a file
+
+    Args:
+        filename: path to the file
+        hashtype: xxhash, md5 or sha256
+        block_size: size of each read in bytes
+        progress: called with the number of bytes after each read
+    """
     # Choose a hash type
     if hashtype == "xxhash":
-        return checksum_xxhash(filename, block_size=block_size)
+        return checksum_xxhash(filename, block_size=block_size, progress=progress)
     elif hashtype == "md5":
-        return checksum_md5(filename, block_size=block_size)
+        return checksum_md5(filename, block_size=block_size, progress=progress)
     elif hashtype == "sha256":
-        return checksum_sha256(filename, block_size=block_size)
+        return checksum_sha256(filename, block_size=block_size, progress=progress)
 
 
-def checksum_xxhash(file_path, block_size=65536):
-    """Get xxhash checksum for a file"""
-    if xxhash is None:
-        raise Exception("xxhash not available on this platform.  Try 'pip install xxhash'")
-    else:
-        h = xxhash.xxh3_64()
-
+def _checksum(h, file_path, block_size, progress):
+    """Hash a file with a hash object and return the hex digest"""
     with open(file_path, "rb") as f:
         for chunk in iter(lambda: f.read(block_size), b""):
             h.update(chunk)
+            if progress is not None:
+                progress(len(chunk))
         return h.hexdigest()
 
 
-def checksum_md5(file_path, block_size=65536):
-    """Get md5 checksum for a file"""
-    h = hashlib.md5()
+def checksum_xxhash(file_path, block_size=65536, progress=None):
+    """Get xxhash checksum for a file"""
+    if xxhash is None:
+        raise Exception("xxhash not available on this platform.  Try 'pip install xxhash'")
+    return _checksum(xxhash.xxh3_64(), file_path, block_size, progress)
 
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(block_size), b""):
-            h.update(chunk)
-        return h.hexdigest()
+
+def checksum_md5(file_path, block_size=65536, progress=None):
+    """Get md5 checksum for a file"""
+    return _checksum(hashlib.md5(), file_path, block_size, progress)
 
 
-def checksum_sha256(file_path, block_size=65536):
+def checksum_sha256(file_path, block_size=65536, progress=None):
     """Get sha256 checksum for a file"""
-    h = hashlib.sha256()
+    return _checksum(hashlib.sha256(), file_path, block_size, progress)
 
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(block_size), b""):
-            h.update(chunk)
-        return h.hexdigest()
+
+def hash_object(hashtype="xxhash"):
+    """Return a new hash object for the given hash type"""
+    if hashtype == "xxhash":
+        return xxhash.xxh3_64()
+    elif hashtype == "md5":
+        return hashlib.md5()
+    elif hashtype == "sha256":
+        return hashlib.sha256()
+    raise ValueError(f"Unknown hash type {hashtype}")
+
+
+def checksum_copy(
+    source: Path,
+    destination: Path,
+    hashtype="xxhash",
+    chunk_size=1048576,
+    kernel=True,
+    progress=None,
+    resume=False,
+    checkpoint=None,
+    checkpoint_size=67108864,
+    state=None,
+):
+    """Copy a file and hash the source data while it is being written
+
+    The source is only read once, every chunk is added to the hash before it is written to the
+    destination. With kernel copying each chunk is copied by the kernel first and then hashed
+    from the page cache, so the data is never written from Python. Whatever the kernel doesn't
+    copy, e.g. files in /proc that report no size, is read and written through Python.
+
+    Args:
+        source: path to the file to copy
+        destination: path to write the copy to
+        hashtype: xxhash, md5 or sha256
+        chunk_size: size of each read in bytes
+        kernel: copy inside the kernel if possible
+        progress: called with the number of bytes after each chunk is written, it can raise
+            to stop the copy
+        resume: keep what is already in the destination and copy the rest, the start of the
+            source is hashed again but not written unless state is given
+        checkpoint: called with the number of bytes in the destination each time another
+            checkpoint_size bytes have been written and synced to disk
+        checkpoint_size: number of bytes between checkpoints
+        state: the CopyState of a TransferPaused raised by an earlier call, to resume from
+
+    Returns:
+        str: checksum of the source file
+    """
+    h = hash_object(hashtype)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    resume = resume and os.path.isfile(destination)
+    # Bytes in the destination that are hashed
+    position = 0
+    with open(source, "rb") as src, open(destination, "r+b" if resume else "wb") as dest:
+        try:
+            if resume:
+                copied = min(os.fstat(dest.fileno()).st_size, os.fstat(src.fileno()).st_size)
+                if state is not None and state.offset <= copied:
+                    # Continue where the copy was paused, what was written is already hashed
+                    h = state.hasher.copy()
+                    position = state.offset
+                    src.seek(position)
+                else:
+                    # The copied part is verified along with the rest after copying
+                    while position < copied and (
+                        size := src.readinto(view[: min(chunk_size, copied - position)])
+                    ):
+                        h.update(view[:size])
+                        position += size
+                        if progress is not None:
+                            progress(size)
+                dest.truncate(position)
+                dest.seek(position)
+            start = synced = position
+
+            def sync(position):
+                nonlocal synced
+                if checkpoint is not None and position - synced >= checkpoint_size:
+                    dest.flush()
+                    os.fsync(dest.fileno())
+                    checkpoint(position)
+                    synced = position
+
+            if kernel and KERNEL_COPY:
+                src_fd = src.fileno()
+                try:
+                    while copied := kernel_copy(src_fd, dest.fileno(), position, chunk_size):
+                        size = os.preadv(src_fd, [view[:copied]], position)
+                        h.update(view[:size])
+                        position += copied
+                        if progress is not None:
+                            progress(copied)
+                        sync(position)
+                except OSError as e:
+                    if position != start or e.errno not in KERNEL_COPY_ERRORS:
+                        raise
+                    logging.debug(
+                        f"Kernel copy not supported for {source}, using a regular copy: {e}"
+                    )
+                    dest.truncate(start)
+                # The kernel copies by offset, the rest is read from where it stopped
+                src.seek(position)
+                dest.seek(position)
+
+            while size := src.readinto(buffer):
+                h.update(view[:size])
+                dest.write(view[:size])
+                position += size
+                if progress is not None:
+                    progress(size)
+                sync(position)
+        except TransferPaused as e:
+            e.state = CopyState(position, h.copy())
+            raise
+    return h.hexdigest()
+
+
+def checksum_copy_multi(
+    source: Path,
+    destinations,
+    hashtype="xxhash",
+    chunk_size=1048576,
+    progress=None,
+    verify_progress=None,
+):
+    """Copy a file to several destinations while hashing the source data
+
+    The source is only read once. Every chunk is handed to one writer thread per destination so
+    all destinations are written at the same time, after writing each thread verifies its own
+    copy by hashing it. A failing destination doesn't stop the others from being written.
+
+    Args:
+        source: path to the file to copy
+        destinations: list of paths to write copies to
+        hashtype: xxhash, md5 or sha256
+        chunk_size: size of each read in bytes
+        progress: called with the number of bytes after each chunk is read from the source,
+            it can raise to stop the copy
+        verify_progress: called from the writer threads with the number of bytes after each
+            read of a copy, a TransferInterrupted it raises is returned as the error of the copy
+
+    Returns:
+        tuple: the source checksum and a (checksum, error) pair for each destination
+    """
+    h = hash_object(hashtype)
+    chunk_queues = [queue.Queue(maxsize=8) for _ in destinations]
+    results = [(None, None)] * len(destinations)
+
+    def write(n, path, chunks):
+        written = False
+        try:
+            with open(path, "wb") as dest:
+                while (chunk := chunks.get()) is not None:
+                    dest.write(chunk)
+                written = True
+            results[n] = (file_checksum(path, hashtype=hashtype, progress=verify_progress), None)
+        except (OSError, TransferInterrupted) as e:
+            results[n] = (None, e)
+            # Keep taking chunks so the reader isn't blocked
+            while not written and chunks.get() is not None:
+                pass
+
+    threads = [
+        threading.Thread(target=write, args=(n, path, chunks), daemon=True)
+        for n, (path, chunks) in enumerate(zip(destinations, chunk_queues, strict=True))
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        with open(source, "rb") as src:
+            for chunk in iter(lambda: src.read(chunk_size), b""):
+                h.update(chunk)
+                for chunks in chunk_queues:
+                    chunks.put(chunk)
+                if progress is not None:
+                    progress(len(chunk))
+    finally:
+        for chunks in chunk_queues:
+            chunks.put(None)
+        for thread in threads:
+            thread.join()
+
+    return h.hexdigest(), results
+
+
+def partial_checksum(path, hashtype="xxhash", block_size=PARTIAL_BLOCK_SIZE):
+    """Get a checksum of the start, middle and end of a file
+
+    Files smaller than three blocks are hashed in full.
+
+    Args:
+        path: path to the file
+        hashtype: xxhash, md5 or sha256
+        block_size: number of bytes to read at each position
+
+    Returns:
+        str: the checksum
+    """
+    h = hash_object(hashtype)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= block_size * 3:
+            offsets = [0]
+            block_size = size
+        else:
+            offsets = [0, (size - block_size) // 2, size - block_size]
+        for offset in offsets:
+            f.seek(offset)
+            h.update(f.read(block_size))
+    return h.hexdigest()
+
+
+def copy_metadata(source: Path, destination: Path, permissions=False, xattrs=False):
+    """Copy the access and modification times of a file with nanosecond precision
+
+    Args:
+        source: path to the file to copy metadata from
+        destination: path to the file to copy metadata to
+        permissions: also copy the permission bits
+        xattrs: also copy extended attributes, where the platform supports it
+    """
+    st = os.stat(source)
+    if permissions:
+        os.chmod(destination, stat.S_IMODE(st.st_mode))
+    if xattrs and hasattr(os, "listxattr"):
+        for name in os.listxattr(source):
+            try:
+                os.setxattr(destination, name, os.getxattr(source, name))
+            except OSError as e:
+                logging.warning(f"Could not copy extended attribute {name} to {destination}: {e}")
+    # Set times last since changing other metadata can update them
+    os.utime(destination, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def clone_file(source: Path, destination: Path):
+    """Create a copy-on-write clone of a file that shares its data with the source
+
+    Only works on Linux filesystems with reflink support, like btrfs and XFS, when source and
+    destination are on the same filesystem.
+
+    Args:
+        source: path to the file to clone
+        destination: path to create the clone at
+
+    Returns:
+        bool: True if the file was cloned, False if cloning isn't supported
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+
+    import fcntl
+
+    with open(source, "rb") as src, open(destination, "wb") as dest:
+        try:
+            fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+            return True
+        except OSError as e:
+            if e.errno not in KERNEL_COPY_ERRORS | {errno.ENOTTY, errno.EPERM}:
+                raise
+            logging.debug(f"Cloning not supported for {source}: {e}")
+
+    Path(destination).unlink(missing_ok=True)
+    return False
+
+
+def kernel_copy(src_fd, dest_fd, offset, count):
+    """Copy part of a file to the same position in another file inside the kernel
+
+    Uses os.copy_file_range and falls back to os.sendfile.
+
+    Args:
+        src_fd: file descriptor to copy from
+        dest_fd: file descriptor to copy to
+        offset: position in both files to start at
+        count: number of bytes to copy
+
+    Returns:
+        int: number of bytes copied, less than count if the end of the source was reached
+
+    Raises:
+        OSError: if the kernel can't copy between the two files
+    """
+    copied = 0
+    use_sendfile = not hasattr(os, "copy_file_range")
+    while copied < count:
+        position = offset + copied
+        try:
+            if use_sendfile:
+                os.lseek(dest_fd, position, os.SEEK_SET)
+                size = os.sendfile(dest_fd, src_fd, position, count - copied)
+            else:
+                size = os.copy_file_range(src_fd, dest_fd, count - copied, position, position)
+        except OSError as e:
+            if use_sendfile or copied or not hasattr(os, "sendfile"):
+                raise
+            if e.errno not in KERNEL_COPY_ERRORS:
+                raise
+            use_sendfile = True
+            continue
+        if not size:
+            break
+        copied += size
+    return copied
 
 
 def timestamp_to_datetime(timestamp):
@@ -655,14 +1466,41 @@ def copy_file(source: Path, destination: Path):
     return True
 
 
-def pathlib_copy(source: Path, destination: Path, chunk_size=262144):
-    """Use pathlib to copy a file"""
-    if source.stat().st_size >= (1024**2 * 64):
-        with source.open("rb") as src, destination.open("wb") as dest:
-            for chunk in iter(lambda: src.read(chunk_size), b""):
-                dest.write(chunk)
-    else:
-        destination.write_bytes(source.read_bytes())
+def pathlib_copy(source: Path, destination: Path, chunk_size=262144, kernel=True):
+    """Use pathlib to copy a file
+
+    The data is copied inside the kernel when possible. Otherwise, and for whatever the kernel
+    doesn't copy, e.g. files in /proc that report no size, it's read and written through Python.
+    """
+    with source.open("rb") as src, destination.open("wb") as dest:
+        offset = 0
+        if kernel and KERNEL_COPY:
+            size = os.fstat(src.fileno()).st_size
+            try:
+                while copied := kernel_copy(
+                    src.fileno(), dest.fileno(), offset, max(size - offset, chunk_size)
+                ):
+                    offset += copied
+            except OSError as e:
+                if offset or e.errno not in KERNEL_COPY_ERRORS:
+                    raise
+                logging.debug(f"Kernel copy not supported for {source}, using a regular copy: {e}")
+            # The kernel copies by offset, the rest is read from where it stopped
+            src.seek(offset)
+            dest.seek(offset)
+        for chunk in iter(lambda: src.read(chunk_size), b""):
+            dest.write(chunk)
+
+
+def regular_file_stat(path):
+    """Return the stat result for a path if it's a regular file, otherwise None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return st
 
 
 def file_mod_date(file_path):
@@ -714,16 +1552,24 @@ def compare_file_mtime(a, b):
     """
     path_a = Path(a)
     path_b = Path(b)
-    if path_a.stat().st_mtime == path_b.stat().st_mtime:
+    mtime_a = path_a.stat().st_mtime
+    mtime_b = path_b.stat().st_mtime
+    if mtime_a == mtime_b:
         logging.debug(
-            f"{path_a.name}({path_a.stat().st_mtime}) and {path_b.name}({path_b.stat().st_mtime}) "
-            f"have the same modification time"
+            "%s(%s) and %s(%s) have the same modification time",
+            path_a.name,
+            mtime_a,
+            path_b.name,
+            mtime_b,
         )
         return True
 
     logging.debug(
-        f"{path_a.name}({path_a.stat().st_mtime}) and {path_b.name}({path_b.stat().st_mtime}) "
-        f"don't have the same modification time"
+        "%s(%s) and %s(%s) don't have the same modification time",
+        path_a.name,
+        mtime_a,
+        path_b.name,
+        mtime_b,
     )
     return False
 
@@ -753,23 +1599,70 @@ def compare_file_size(a, b):
     return False
 
 
-def compare_files(a: File, b: File):
-    a_path = Path(a.path)
-    b_path = Path(b.path)
-    if a.size == b.size:
-        logging.info(f"Sizes match: {a.size} (source) | {b.size} (destination)")
-        logging.debug(f"ctime - {a.ctime} | {b.ctime}")
-        logging.debug(f"mtime - {a.mtime} | {b.mtime}")
-        if a.mtime == b.mtime:
-            logging.info(f"Modification times match: {a.mtime} (source) | {b.mtime} (destination)")
-            return True
+def compare_files(a: File, b: File, policy="size_mtime", refresh=True):
+    """Check if two files are the same
+
+    Files with different sizes are never the same. Otherwise it depends on the policy:
+        - size_mtime: the same modification time is enough, otherwise compare checksums
+        - partial_hash: the same modification time and checksums of the start, middle and end
+          of the files are enough, otherwise compare checksums
+        - full_hash: always compare checksums
+
+    Checksums of the start, middle and end of the files are compared before the checksums of
+    the whole files, so files that differ are usually told apart without reading them in full.
+
+    Args:
+        a: the source file
+        b: the destination file
+        policy: one of SKIP_POLICIES
+        refresh: take a new stat snapshot of the destination first, not needed if the snapshot
+            is known to be current
+
+    Returns:
+        bool: True if the files are the same
+    """
+    if policy not in SKIP_POLICIES:
+        raise ValueError(f"Unknown skip policy {policy}")
+
+    # The destination may have been written since its snapshot was taken
+    if refresh:
+        b.refresh()
+    if a.size != b.size:
+        logging.debug("Sizes mismatch: %s (source) | %s (destination)", a.size, b.size)
+        return False
+
+    logging.debug("Sizes match: %s (source) | %s (destination)", a.size, b.size)
+    logging.debug("ctime - %s | %s", a.ctime, b.ctime)
+    logging.debug("mtime - %s | %s", a.mtime, b.mtime)
+    same_mtime = False
+    if policy != "full_hash":
+        same_mtime = a.mtime_ns == b.mtime_ns
+        if same_mtime:
+            logging.debug(
+                "Modification times match: %s (source) | %s (destination)", a.mtime, b.mtime
+            )
+            if policy == "size_mtime":
+                return True
         else:
-            logging.info(
-                f"Modification times mismatch: {a.mtime} (source) | {b.mtime} (destination)"
+            logging.debug(
+                "Modification times mismatch: %s (source) | %s (destination)", a.mtime, b.mtime
             )
-    else:
-        logging.info(f"Sizes mismatch: {a.size} (source) | {b.size} (destination)")
 
+    partial_size = min(a.size, PARTIAL_BLOCK_SIZE * 3)
+    if a.partial_checksum != b.partial_checksum:
+        saved = (a.size - partial_size) * 2
+        logging.debug("Partial checksums mismatch, %s not read", convert_size(saved))
+        return False
+
+    if partial_size == a.size:
+        logging.debug("Checksums match")
+        return True
+
+    if same_mtime:
+        logging.debug("Partial checksums match")
+        return True
+
+    logging.debug("Partial checksums match, comparing checksums")
     if compare_checksums(a.checksum, b.checksum):
         return True
 
@@ -832,33 +1725,55 @@ def pad_number(number, padding=3):
     return padded_number
 
 
-def destination_folder(file_date, preset):
-    """Get a destination path depending on the structure setting"""
+def destination_folder(file_date, preset, **values):
+    """Get a destination path depending on the structure setting
+
+    Args:
+        file_date: the date the file was taken
+        preset: a structure preset or a template, see Template
+        **values: the other template values, e.g. from File.template_values
+
+    Returns:
+        str: the destination folder relative to the destination
+
+    Raises:
+        ValueError: if the preset isn't known, see structure_template
+    """
     # TODO original file structure
-    today = datetime.now()
+    if file_date is None:
+        logging.warning("File has no date, using today's date")
+        file_date = datetime.today()
+    template = compile_template(structure_template(preset), datetime.now().date())
+    return template.format(date=file_date, **values)
+
 
-    if preset == "taken_date":
-        # Construct new structure from modification date
-        if file_date is None:
-            logging.warning("File has no date, using today's date")
-            file_date = datetime.today()
-        return f"{file_date.year}/{file_date.strftime('%Y-%m-%d')}"
+def structure_template(preset):
+    """Return the template of a folder structure
+
+    Args:
+        preset: a structure preset or a template, see Template
 
-    elif preset == "offload_date":
-        # Construct new structure from modification date
-        return f"{today.year}/{today.strftime('%Y-%m-%d')}"
+    Returns:
+        str: the template
 
-    elif preset == "year":
-        # Construct new structure from modification date
-        return f"{file_date.year}"
+    Raises:
+        ValueError: if the structure is neither a preset nor a template
+    """
+    template = STRUCTURE_TEMPLATES.get(preset)
+    if template is None:
+        if not isinstance(preset, str) or "{" not in preset:
+            raise ValueError(
+                f"Unknown folder structure {preset!r}, use {', '.join(STRUCTURE_TEMPLATES)} "
+                "or a template"
+            )
+        template = preset
+    return template
 
-    elif preset == "year_month":
-        # Construct new structure from modification date
-        return f"{file_date.year}/{file_date.strftime('%m')}"
 
-    elif preset == "flat":
-        # Put files straight into destination folder
-        return ""
+@functools.lru_cache(maxsize=64)
+def compile_template(template, today=None):
+    """Return a compiled Template, templates are only compiled once per date of the offload"""
+    return Template(template, today=today)
 
 
 def random_string(length=50):
@@ -880,25 +1795,94 @@ def disk_usage(path: Path, human=False):
     return DiskUsage(total, used, free)
 
 
-def validate_string(invalid_string):
-    """Replace or remove invalid characters in a string"""
-    valid_string = str(invalid_string)
-    valid_chars = f"-_.{string.ascii_letters}{string.digits}"
-    char_table = {"å": "a", "ä": "a", "ö": "o", "Å": "A", "Ä": "A", "Ö": "O", " ": "_"}
-    for k, v in char_table.items():
-        valid_string = valid_string.replace(k, v)
+class _ValidCharacters(dict):
+    """Translation table for str.translate that removes all characters it doesn't list"""
+
+    def __missing__(self, key):
+        self[key] = None
+        return None
+
 
-    valid_string = "".join(c for c in valid_string if c in valid_chars)
+VALID_CHARACTERS = _ValidCharacters(
+    {ord(c): c for c in f"-_.{string.ascii_letters}{string.digits}"}
+    | {ord(k): v for k, v in {"å": "a", "ä": "a", "ö": "o", "Å": "A", "Ä": "A", "Ö": "O"}.items()}
+    | {ord(" "): "_"}
+)
 
-    return valid_string
+
+def validate_string(invalid_string):
+    """Replace or remove invalid characters in a string"""
+    return str(invalid_string).translate(VALID_CHARACTERS)
 
 
 def folder_size(path):
-    path = Path(path)
-    size = sum([x.stat().st_size for x in path.rglob("*") if x.is_file()])
+    size = sum(entry.stat().st_size for entry in scan_files(path))
     return size
 
 
+def compile_exclude(exclude=None):
+    """Compile a list of names and glob patterns into a single matcher
+
+    Args:
+        exclude: list of file or folder names, names containing * or [ are used as glob patterns
+
+    Returns:
+        function: returns True if the given name is excluded
+    """
+    names = set()
+    patterns = []
+    for name in exclude or []:
+        if "*" in name or "[" in name:
+            patterns.append(fnmatch.translate(name))
+        else:
+            names.add(name)
+
+    if not patterns:
+        return names.__contains__
+
+    pattern = re.compile("|".join(patterns))
+    return lambda name: name in names or pattern.match(name) is not None
+
+
+def scan_files(path, exclude=None):
+    """Walk a folder and its subfolders and yield a DirEntry for each file
+
+    Folders matching the exclude list are skipped without being entered.
+
+    Args:
+        path: the root folder to scan
+        exclude: list of file and folder names or glob patterns to leave out
+
+    Yields:
+        os.DirEntry: one entry per file
+    """
+    is_excluded = compile_exclude(exclude)
+    folders = [os.fspath(path)]
+    while folders:
+        folder = folders.pop()
+        subfolders = []
+        files = []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if is_excluded(entry.name):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subfolders.append(entry.path)
+                        elif entry.is_file():
+                            files.append(entry)
+                    except OSError as e:
+                        logging.warning(f"Could not read {entry.path}: {e}")
+        except OSError as e:
+            logging.warning(f"Could not scan {folder}: {e}")
+        # The folder is closed before its files are yielded, so nothing is kept open while the
+        # caller waits between files
+        yield from files
+        # Keep a depth first order like a regular walk
+        folders.extend(reversed(subfolders))
+
+
 def get_file_list(folder_path, exclude=None):
     """Get a list of files in a folder and its subfolders"""
     # Start timer
@@ -973,8 +1957,7 @@ def exifdata(path: Path):
     if is_image_file(path):
         with Image.open(path) as img:
             exifdata = {TAGS.get(k, k): v for k, v in img.getexif().items()}
-            logging.debug(f"Exifdata for {path}")
-            logging.debug(exifdata)
+            logging.debug("Exifdata for %s: %s", path, exifdata)
             return exifdata
     return {}
 
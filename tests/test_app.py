@@ -1,14 +1,19 @@
+import csv
+import errno
 import json
 import logging
 import re
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 from random import randint
 from shutil import rmtree
-from unittest import TestCase
+from unittest import TestCase, mock
 
 from offload import utils
-from offload.app import Offloader, Report
+from offload.app import Offloader, Report, SessionJournal, TransferPlan
+from offload.progress import FileProgress
 from offload.utils import FileList, Settings
 
 utils.setup_logger("debug")
@@ -46,6 +51,19 @@ class TestOffloader(TestCase):
         if self.test_destination.exists():
             rmtree(self.test_destination)
 
+    def offloader(self, **kwargs):
+        """Return an Offloader of the test source that copies to a flat destination"""
+        kwargs = {
+            "structure": "flat",
+            "filename": None,
+            "prefix": "empty",
+            "mode": "copy",
+            "dryrun": False,
+            "log_level": "debug",
+            **kwargs,
+        }
+        return Offloader(source=self.test_source, dest=self.test_destination, **kwargs)
+
     def test_offload_offload_date(self):
         ol = Offloader(
             source=self.test_source,
@@ -152,6 +170,506 @@ class TestOffloader(TestCase):
         for file in self.test_destination.rglob("*.*"):
             self.assertIsNotNone(re.search(r"\d{6}_.+[.]\w{3}", file.name))
 
+    def test_offload_pipeline(self):
+        ol = self.offloader(pipeline=True, queue_size=2)
+        self.assertEqual(ol.source_files.count, 0)
+
+        self.assertTrue(ol.offload())
+        self.assertEqual(ol.source_files.count, 20)
+        self.assertEqual(ol.ol_bytes_transferred, ol.source_files.size)
+        self.assertEqual(
+            sorted(x.name for x in self.test_destination.iterdir()),
+            sorted(x.name for x in self.test_source.iterdir()),
+        )
+
+    def test_offload_workers(self):
+        # Same name in two folders on the card
+        (self.test_source / "100MSDCF").mkdir()
+        (self.test_source / "100MSDCF" / "0000.jpg").write_bytes(b"another 0000.jpg")
+        ol = self.offloader(workers=4, small_file_size=1024**2)
+        self.assertTrue(ol.offload())
+
+        destination_names = sorted(x.name for x in self.test_destination.iterdir())
+        self.assertEqual(len(destination_names), 21)
+        self.assertIn("0000_001.jpg", destination_names)
+        self.assertEqual(ol.processed_files, [f.filename for f in ol.source_files.files])
+
+        # Rows are written in the same order as the files were planned
+        with ol.report.path.open() as report:
+            rows = list(csv.reader(report))[-21:]
+        self.assertEqual([r[0] for r in rows], [f.filename for f in ol.source_files.files])
+        self.assertTrue(all(r[2] == "Successful" for r in rows))
+
+    def test_offload_move_clone(self):
+        inodes = {x.name: x.stat().st_ino for x in self.test_source.iterdir()}
+        ol = Offloader(
+            source=self.test_source,
+            dest=self.test_destination,
+            structure="flat",
+            filename=None,
+            prefix="empty",
+            mode="move",
+            dryrun=False,
+            log_level="debug",
+            clone=True,
+        )
+        self.assertTrue(ol.offload())
+
+        # Files on the same filesystem are renamed instead of copied
+        self.assertEqual(list(self.test_source.iterdir()), [])
+        self.assertEqual({x.name: x.stat().st_ino for x in self.test_destination.iterdir()}, inodes)
+        self.assertEqual(ol.errored_files, [])
+
+    def test_offload_move_cross_device(self):
+        # Bind mounts share st_dev but can't be renamed across, the files are copied instead
+        ol = self.offloader(mode="move", clone=True)
+        with mock.patch("offload.app.os.rename", side_effect=OSError(errno.EXDEV, "")) as rename:
+            self.assertTrue(ol.offload())
+        self.assertEqual(rename.call_count, 20)
+        self.assertEqual(ol.errored_files, [])
+        self.assertEqual(list(self.test_source.iterdir()), [])
+        self.assertEqual(len(list(self.test_destination.iterdir())), 20)
+
+    def test_offload_backups(self):
+        backups = [self.test_destination.parent / f"test_backup_{n}" for n in (1, 2)]
+        self.addCleanup(lambda: [rmtree(b) for b in backups if b.exists()])
+
+        ol = self.offloader(backups=backups)
+        self.assertTrue(ol.offload())
+        source_names = sorted(x.name for x in self.test_source.iterdir())
+        for folder in [self.test_destination, *backups]:
+            self.assertEqual(sorted(x.name for x in folder.iterdir()), source_names)
+            for name in source_names:
+                self.assertEqual(
+                    utils.checksum_xxhash(folder / name),
+                    utils.checksum_xxhash(self.test_source / name),
+                )
+        with ol.report.path.open() as report:
+            rows = list(csv.reader(report))[-20:]
+        self.assertTrue(all(r[2:3] + r[-2:] == ["Successful"] * 3 for r in rows))
+
+        # Only the backup that is missing the file is written
+        (backups[1] / "0001.jpg").unlink()
+        ol = self.offloader(backups=backups)
+        self.assertTrue(ol.offload())
+        self.assertTrue((backups[1] / "0001.jpg").is_file())
+        self.assertEqual(len(ol.skipped_files), 20)
+        self.assertEqual(ol.errored_files, [])
+        with ol.report.path.open() as report:
+            rows = {r[0]: r for r in list(csv.reader(report))[-20:]}
+        self.assertEqual(
+            rows["0001.jpg"][2:3] + rows["0001.jpg"][-2:], ["Skipped", "Skipped", "Successful"]
+        )
+
+    def test_offload_collisions(self):
+        # Files with the same name in different folders of the source
+        for folder in ("100MSDCF", "101MSDCF", "102MSDCF"):
+            (self.test_source / folder).mkdir()
+            (self.test_source / folder / "DSC00001.JPG").write_text(folder)
+
+        self.assertTrue(self.offloader(workers=4).offload())
+        names = sorted(x.name for x in self.test_destination.glob("DSC*"))
+        self.assertEqual(names, ["DSC00001.JPG", "DSC00001_001.JPG", "DSC00001_002.JPG"])
+        contents = {(self.test_destination / name).read_text() for name in names}
+        self.assertEqual(contents, {"100MSDCF", "101MSDCF", "102MSDCF"})
+
+        # The same files are found again instead of being copied with new names
+        ol = self.offloader(workers=4)
+        self.assertTrue(ol.offload())
+        self.assertEqual(len(ol.skipped_files), 23)
+        self.assertEqual(len(list(self.test_destination.iterdir())), 23)
+
+    def test_offload_templates(self):
+        ol = Offloader(
+            source=self.test_source,
+            dest=self.test_destination,
+            structure="{model}/{date:%Y}",
+            filename="{name}_{seq:03}",
+            prefix="{date:%y}",
+            mode="copy",
+            dryrun=False,
+            log_level="debug",
+        )
+        plan = ol.plan()
+        for seq, planned in enumerate(plan, 1):
+            date = planned.source.mdate
+            model = "ilce-7m3" if int(planned.source.name) % 2 else "unknown"
+            self.assertEqual(
+                planned.destination.path,
+                self.test_destination
+                / model
+                / f"{date:%Y}"
+                / f"{date:%y}_{planned.source.name}_{seq:03}.jpg",
+            )
+
+    def test_offload_unknown_template_field(self):
+        with self.assertRaises(ValueError):
+            Offloader(source=self.test_source, dest=self.test_destination, filename="{nmae}")
+
+    def test_offload_plan(self):
+        # Files with the same name are planned to different paths
+        (self.test_source / "100MSDCF").mkdir()
+        (self.test_source / "100MSDCF" / "0000.jpg").write_text("other")
+        plan = self.offloader().plan()
+        self.assertEqual(plan.count, 21)
+        self.assertEqual(plan.size, sum(t.source.size for t in plan))
+        self.assertEqual(len({t.destination.path for t in plan}), 21)
+        self.assertFalse(self.test_destination.exists())
+
+        plan_path = plan.save(self.test_destination.parent / "test_plan.json")
+        self.addCleanup(lambda: plan_path.unlink(missing_ok=True))
+        (self.test_source / "0001.jpg").write_bytes(b"changed")
+        loaded = TransferPlan.load(plan_path)
+        self.assertEqual(
+            [t.destination.path if t.destination else None for t in loaded],
+            [t.destination.path if t.source.filename != "0001.jpg" else None for t in plan],
+        )
+
+        # A file written to a planned path since is kept and the source is planned again
+        self.test_destination.mkdir(parents=True)
+        (self.test_destination / "0002.jpg").write_bytes(b"written since")
+
+        ol = self.offloader(plan=plan_path)
+        self.assertEqual(ol.source_files.count, 21)
+        self.assertTrue(ol.offload())
+        self.assertEqual(len(list(self.test_destination.iterdir())), 22)
+        self.assertEqual((self.test_destination / "0001.jpg").read_bytes(), b"changed")
+        self.assertEqual((self.test_destination / "0002.jpg").read_bytes(), b"written since")
+        self.assertEqual(
+            (self.test_destination / "0002_001.jpg").read_bytes(),
+            (self.test_source / "0002.jpg").read_bytes(),
+        )
+
+        # Everything is skipped the next time
+        plan = self.offloader().plan()
+        self.assertEqual({t.action for t in plan}, {"skip"})
+        self.assertEqual(plan.size, 0)
+
+    def test_offload_dryrun(self):
+        ol = Offloader(
+            source=self.test_source,
+            dest=self.test_destination,
+            structure="flat",
+            filename=None,
+            prefix="empty",
+            mode="copy",
+            dryrun=True,
+            log_level="debug",
+        )
+        self.addCleanup(lambda: ol.report.plan_path.unlink(missing_ok=True))
+        self.assertTrue(ol.offload())
+        self.assertFalse(self.test_destination.exists())
+        plan = json.loads(ol.report.plan_path.read_text())
+        self.assertEqual(plan["count"], 20)
+        self.assertEqual({t["action"] for t in plan["transfers"]}, {"transfer"})
+
+    def test_offload_catalog(self):
+        test_catalog = self.test_destination.parent / "test_catalog.db"
+        self.addCleanup(lambda: test_catalog.unlink(missing_ok=True))
+
+        self.assertTrue(self.offloader(catalog=test_catalog).offload())
+
+        # Files in the catalog are skipped without looking at the destination
+        rmtree(self.test_destination)
+        (self.test_source / "0000.jpg").write_bytes(b"new")
+        ol = self.offloader(catalog=test_catalog)
+        self.assertTrue(ol.offload())
+        self.assertEqual(len(ol.skipped_files), 19)
+        self.assertEqual(sorted(x.name for x in self.test_destination.iterdir()), ["0000.jpg"])
+        with ol.report.path.open() as report:
+            rows = {r[0]: r for r in list(csv.reader(report))[-20:]}
+        self.assertEqual(rows["0000.jpg"][2], "Successful")
+        self.assertEqual(rows["0001.jpg"][2], "Skipped")
+        self.assertEqual(rows["0001.jpg"][3], utils.checksum_xxhash(self.test_source / "0001.jpg"))
+
+    def test_offload_dedupe(self):
+        test_library = self.test_destination.parent / "test_library.db"
+        self.addCleanup(lambda: test_library.unlink(missing_ok=True))
+        # The same picture was offloaded before under another name
+        existing = self.test_destination / "2020" / "DSC00001.jpg"
+        existing.parent.mkdir(parents=True)
+        existing.write_bytes(TEST_PIC.read_bytes())
+
+        ol = self.offloader(dedupe="skip", library=test_library)
+        self.assertTrue(ol.offload())
+        self.assertEqual(len(ol.skipped_files), 10)
+        self.assertEqual(len(list(self.test_destination.glob("*.jpg"))), 10)
+
+        rmtree(self.test_destination)
+        existing.parent.mkdir(parents=True)
+        existing.write_bytes(TEST_PIC.read_bytes())
+        ol = self.offloader(dedupe="hardlink", library=test_library)
+        self.assertTrue(ol.offload())
+        self.assertEqual(ol.skipped_files, [])
+        self.assertEqual(len(list(self.test_destination.glob("*.jpg"))), 20)
+        self.assertEqual(existing.stat().st_nlink, 11)
+
+        # In pipeline mode the files scanned while the library is updated are looked up at once
+        rmtree(self.test_destination)
+        existing.parent.mkdir(parents=True)
+        existing.write_bytes(TEST_PIC.read_bytes())
+        ol = self.offloader(dedupe="skip", library=test_library, pipeline=True)
+        find_duplicates = Offloader.find_duplicates
+
+        def slow_library(offloader, files):
+            if offloader._library_sizes is None:
+                time.sleep(0.2)
+            find_duplicates(offloader, files)
+
+        with mock.patch.object(
+            Offloader, "find_duplicates", autospec=True, side_effect=slow_library
+        ) as lookup:
+            self.assertTrue(ol.offload())
+        self.assertLess(lookup.call_count, 5)
+        self.assertEqual(len(ol.skipped_files), 10)
+
+        # Duplicates are still written to backups that don't have them
+        rmtree(self.test_destination)
+        existing.parent.mkdir(parents=True)
+        existing.write_bytes(TEST_PIC.read_bytes())
+        test_backup = self.test_destination.parent / "test_dedupe_backup"
+        self.addCleanup(lambda: rmtree(test_backup, ignore_errors=True))
+        ol = self.offloader(dedupe="skip", library=test_library, backups=[test_backup])
+        self.assertTrue(ol.offload())
+        self.assertEqual(ol.errored_files, [])
+        self.assertEqual(len(list(self.test_destination.glob("*.jpg"))), 10)
+        self.assertEqual(
+            (test_backup / "2020" / "DSC00001.jpg").read_bytes(), TEST_PIC.read_bytes()
+        )
+        self.assertEqual(len(list(test_backup.glob("*.jpg"))), 10)
+
+    def test_offload_preserves_mtime(self):
+        self.assertTrue(self.offloader().offload())
+        for source in self.test_source.iterdir():
+            destination = self.test_destination / source.name
+            self.assertEqual(source.stat().st_mtime_ns, destination.stat().st_mtime_ns)
+
+        # A second run skips on size and modification time without hashing
+        ol = self.offloader()
+        with mock.patch("offload.utils.file_checksum") as file_checksum:
+            self.assertTrue(ol.offload())
+            file_checksum.assert_not_called()
+        self.assertEqual(len(ol.skipped_files), ol.source_files.count)
+
+    def test_offload_progress(self):
+        ol = self.offloader(progress_interval=3600)
+        snapshots = []
+        ol._progress_signal.connect(snapshots.append)
+        self.assertTrue(ol.offload())
+        # The first update and the last one
+        self.assertEqual(len(snapshots), 2)
+        last = snapshots[-1]
+        self.assertTrue(last.is_finished)
+        self.assertEqual(last.percentage, 100)
+        self.assertEqual(last.files_done, ol.source_files.count)
+        self.assertEqual(last.bytes_copied, ol.source_files.size)
+        self.assertEqual(last.bytes_verified, ol.source_files.size)
+
+    def test_offload_source_files(self):
+        source_files = FileList(self.test_source)
+        with mock.patch("offload.utils.scan_files") as scan_files:
+            ol = Offloader(
+                source=self.test_source.parent,
+                dest=self.test_destination,
+                structure="flat",
+                filename=None,
+                prefix="empty",
+                mode="copy",
+                dryrun=False,
+                log_level="debug",
+                pipeline=True,
+                source_files=source_files,
+            )
+            self.assertTrue(ol.offload())
+            scan_files.assert_not_called()
+        self.assertEqual(ol.source, self.test_source)
+        self.assertEqual(len(list(self.test_destination.iterdir())), source_files.count)
+
+    def test_offload_pause(self):
+        ol = self.offloader()
+        copied = FileProgress.copied
+
+        def pause(progress, size):
+            # Pause after the first chunk and resume a moment later
+            if not ol.paused and not timers:
+                ol.pause()
+                timers.append(threading.Timer(0.2, ol.resume))
+                timers[0].start()
+            copied(progress, size)
+
+        timers = []
+        with (
+            mock.patch.object(FileProgress, "copied", autospec=True, side_effect=pause),
+            mock.patch("offload.utils.checksum_copy", wraps=utils.checksum_copy) as copy,
+        ):
+            self.assertTrue(ol.offload())
+        self.assertEqual(len(timers), 1)
+        self.assertFalse(ol.errored_files)
+        for source in self.test_source.iterdir():
+            destination = self.test_destination / source.name
+            self.assertEqual(utils.checksum_xxhash(source), utils.checksum_xxhash(destination))
+        # The paused copy continued where it stopped, nothing was read twice
+        self.assertEqual(copy.call_args_list[1].kwargs["state"].offset, 1024**2)
+        self.assertEqual(ol._progress.snapshot().bytes_copied, ol.source_files.size)
+
+    def test_offload_pipeline_pause(self):
+        ol = self.offloader(pipeline=True, queue_size=2)
+        scan = ol.source_files.scan
+        plan_file = ol.plan_file
+        used_while_paused = []
+
+        def paused_scan():
+            for source_file in scan():
+                used_while_paused.append(ol.paused)
+                yield source_file
+
+        def paused_plan_file(source_file):
+            used_while_paused.append(ol.paused)
+            return plan_file(source_file)
+
+        with (
+            mock.patch.object(ol.source_files, "scan", side_effect=paused_scan),
+            mock.patch.object(ol, "plan_file", side_effect=paused_plan_file),
+        ):
+            # Start paused and resume a moment later
+            ol.pause()
+            threading.Timer(0.2, ol.resume).start()
+            self.assertTrue(ol.offload())
+        self.assertFalse(ol.errored_files)
+        # The scan and plan threads don't touch the source while paused
+        self.assertEqual(len(used_while_paused), 40)
+        self.assertFalse(any(used_while_paused))
+
+    def test_offload_pause_cancel(self):
+        copied = FileProgress.copied
+
+        def pause(then):
+            def pause(progress, size):
+                # Pause after the first chunk and cancel or resume a moment later
+                if not ol.paused and not timers:
+                    ol.pause()
+                    timers.append(threading.Timer(0.2, then))
+                    timers[0].start()
+                copied(progress, size)
+
+            return pause
+
+        # Cancelling while paused doesn't read the source again
+        ol = self.offloader()
+        timers = []
+        with mock.patch.object(FileProgress, "copied", autospec=True, side_effect=pause(ol.cancel)):
+            self.assertTrue(ol.offload())
+        self.assertEqual(ol._progress.snapshot().bytes_copied, 1024**2)
+        with ol.report.path.open() as report:
+            rows = list(csv.reader(report))[-20:]
+        self.assertEqual(rows[0][2], "Cancelled")
+
+        # A source that is gone when resumed is reported as failed
+        first = self.test_source / "0000.jpg"
+
+        def eject():
+            first.unlink()
+            ol.resume()
+
+        ol = self.offloader()
+        timers = []
+        with mock.patch.object(FileProgress, "copied", autospec=True, side_effect=pause(eject)):
+            self.assertTrue(ol.offload())
+        self.assertEqual(len(ol.errored_files), 1)
+        self.assertFalse((self.test_destination / "0000.jpg").exists())
+        with ol.report.path.open() as report:
+            rows = list(csv.reader(report))[-20:]
+        self.assertEqual([row[2] for row in rows], ["Failed"] + ["Successful"] * 19)
+
+    def test_offload_cancel(self):
+        ol = self.offloader()
+        copied = FileProgress.copied
+
+        def cancel(progress, size):
+            ol.cancel()
+            copied(progress, size)
+
+        with mock.patch.object(FileProgress, "copied", autospec=True, side_effect=cancel):
+            self.assertTrue(ol.offload())
+        # The partial copy is removed and the other files aren't started
+        self.assertFalse(list(self.test_destination.rglob("*.jpg")))
+        with ol.report.path.open() as report:
+            rows = list(csv.reader(report))[-20:]
+        self.assertEqual(rows[0][2], "Cancelled")
+        self.assertTrue(all(row[2] == "Not started" for row in rows[1:]))
+
+    def test_offload_resume(self):
+        # Crash while finishing the sixth file
+        ol = self.offloader()
+        finish_file = Offloader._finish_file
+
+        def crash(offloader, *args):
+            if len(offloader.processed_files) == 5:
+                raise RuntimeError("Crash")
+            finish_file(offloader, *args)
+
+        with mock.patch.object(Offloader, "_finish_file", autospec=True, side_effect=crash):
+            self.assertRaises(RuntimeError, ol.offload)
+
+        # The sixth file was copied in full, continue it from a checkpoint halfway
+        journal = ol.journal_path
+        with journal.open() as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([x["event"] for x in records].count("session"), 1)
+        planned = [x for x in records if x["event"] == "planned"]
+        self.assertEqual(len(planned), 20)
+        sixth = planned[5]
+        with journal.open("a") as f:
+            offset = sixth["size"] // 2
+            f.write(json.dumps({**sixth, "event": "copied", "offset": offset}) + "\n")
+            f.write('{"event": "finished", "sour')
+
+        # Offloads started at the same time get journals of their own
+        other = SessionJournal.create(journal.parent)
+        other.close()
+        self.addCleanup(other.path.unlink)
+        self.assertNotEqual(other.path, journal)
+
+        ol = self.offloader(resume=journal)
+        with (
+            mock.patch("offload.utils.file_checksum", wraps=utils.file_checksum) as checksum,
+            mock.patch("offload.utils.checksum_copy", wraps=utils.checksum_copy) as copy,
+        ):
+            self.assertTrue(ol.offload())
+        # Finished files aren't hashed again
+        self.assertEqual(checksum.call_count, 15)
+        self.assertTrue(copy.call_args_list[0].kwargs["resume"])
+        self.assertEqual(
+            utils.checksum_xxhash(sixth["destination"]), utils.checksum_xxhash(sixth["source"])
+        )
+        with ol.report.path.open() as report:
+            rows = list(csv.reader(report))[-20:]
+        self.assertEqual([row[2] for row in rows], ["Skipped"] * 5 + ["Successful"] * 15)
+        self.assertEqual(len(list(self.test_destination.iterdir())), 20)
+
+        # The cut off record is kept apart from the records of the resumed offload
+        self.assertEqual(ol.journal_path, journal)
+        with journal.open() as f:
+            records = f.read().splitlines()
+        cut_off = records.index('{"event": "finished", "sour')
+        self.assertEqual(json.loads(records[cut_off + 1])["event"], "finished")
+        self.assertEqual(len(SessionJournal.load(journal).finished), 20)
+
+    def test_offload_log_summary(self):
+        ol = self.offloader(log_summary=True)
+        with self.assertLogs(level="INFO") as logs:
+            self.assertTrue(ol.offload())
+        summaries = [x for x in logs.output if " | Successful | " in x]
+        self.assertEqual(len(summaries), ol.source_files.count)
+        self.assertFalse([x for x in logs.output if "Source path" in x])
+
+        # Files already in the destination are compared without logging every step
+        ol = self.offloader(log_summary=True)
+        with self.assertLogs(level="INFO") as logs:
+            self.assertTrue(ol.offload())
+        self.assertEqual(len([x for x in logs.output if " | Skipped | " in x]), 20)
+        self.assertFalse([x for x in logs.output if "already exists" in x or "match" in x])
+
     def test_destination(self):
         self.assertEqual(self.test_offloader.destination, self.test_destination)
         new_dest = Path("test_dir")
@@ -198,6 +716,42 @@ class TestReport(TestCase):
         self.reporter.write_html()
         self.assertTrue(Path(self.reporter.html_path).is_file())
 
+    def test_write_html_pages(self):
+        for f in self.source_files.files:
+            self.reporter.write(f, f, "Successful" if f.size % 2 else "Failed")
+        self.reporter.write_html(page_size=10)
+        with self.reporter.path.open() as report:
+            rows = list(csv.reader(report))[1:]
+        pages = sorted(self.reporter.html_pages_path.glob("*.html"))
+        self.assertEqual(len(pages), -(-len(rows) // 10))
+        self.assertIn("Next", pages[0].read_text())
+        self.assertNotIn("Next", pages[-1].read_text())
+
+        summary = self.reporter.html_path.read_text()
+        self.assertIn(f"{len(rows)} files", summary)
+        failed = sum(row[2] == "Failed" for row in rows)
+        self.assertIn(f'<span class="text-failed">Failed</span></td>\n\t<td>{failed}<', summary)
+
+    def test_write_buffered(self):
+        reporter = Report(buffer_size=10, flush_interval=3600)
+        self.addCleanup(reporter.close)
+        with reporter.path.open() as report:
+            existing = len(list(csv.reader(report)))
+        files = self.source_files.files
+        with mock.patch("offload.utils.file_checksum") as file_checksum:
+            for f in files[:15]:
+                reporter.write(f, f, "Successful", checksums=("a", "b"), size=1)
+            file_checksum.assert_not_called()
+        with reporter.path.open() as report:
+            self.assertEqual(len(list(csv.reader(report))), existing + 10)
+
+        reporter.close()
+        with reporter.path.open() as report:
+            rows = list(csv.reader(report))
+        self.assertEqual(len(rows), existing + 15)
+        self.assertEqual(rows[-1][2:5], ["Successful", "a", "b"])
+        self.assertEqual(rows[-1][7], utils.convert_size(1))
+
 
 class TestSettings(TestCase):
     def setUp(self) -> None:
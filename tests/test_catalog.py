@@ -0,0 +1,83 @@
+from pathlib import Path
+from shutil import rmtree
+from unittest import TestCase
+
+from offload import catalog, utils
+
+
+class TestCatalog(TestCase):
+    def setUp(self):
+        self.test_data_path = Path("test_data").resolve()
+        self.test_data_path.mkdir(exist_ok=True, parents=True)
+        self.test_catalog_path = self.test_data_path / "catalog" / "catalog.db"
+
+    def tearDown(self) -> None:
+        if self.test_data_path.exists():
+            rmtree(self.test_data_path)
+
+    def test_mount_point(self):
+        mount = catalog.mount_point(self.test_data_path)
+        self.assertTrue(mount.is_dir())
+        self.assertTrue(self.test_data_path.is_relative_to(mount))
+
+    def test_volume_fingerprint(self):
+        volume, mount = catalog.volume_fingerprint(self.test_data_path)
+        self.assertEqual(
+            catalog.volume_fingerprint(self.test_data_path / "folder"), (volume, mount)
+        )
+
+    def test_ingested(self):
+        root = self.test_data_path / "destination"
+        with catalog.Catalog(self.test_catalog_path, batch_size=2) as cat:
+            self.assertEqual(cat.ingested("card", root), {})
+            cat.add("card", "DCIM/0001.jpg", 10, 100, root, root / "0001.jpg", "abc")
+            cat.add("card", "DCIM/0002.jpg", 20, 200, root, root / "0002.jpg")
+            cat.add("card", "DCIM/0003.jpg", 30, 300, root, root / "0003.jpg")
+            cat.add("other", "DCIM/0001.jpg", 10, 100, root, root / "0001.jpg")
+            cat.add("card", "DCIM/0001.jpg", 10, 100, self.test_data_path, root / "0001.jpg")
+
+        # Records are kept after closing the catalog
+        with catalog.Catalog(self.test_catalog_path) as cat:
+            ingested = cat.ingested("card", root)
+        self.assertEqual(len(ingested), 3)
+        self.assertEqual(ingested["DCIM/0001.jpg", 10, 100], (str(root / "0001.jpg"), "abc"))
+        self.assertEqual(ingested["DCIM/0002.jpg", 20, 200], (str(root / "0002.jpg"), None))
+        self.assertNotIn(("DCIM/0001.jpg", 10, 101), ingested)
+
+
+class TestLibraryIndex(TestCase):
+    def setUp(self):
+        self.test_data_path = Path("test_data").resolve()
+        self.test_library = self.test_data_path / "library"
+        (self.test_library / "2023").mkdir(exist_ok=True, parents=True)
+        (self.test_library / "2023" / "a.jpg").write_text("a")
+        (self.test_library / "2023" / "b.jpg").write_text("bb")
+        self.test_index_path = self.test_data_path / "catalog" / "catalog.db"
+
+    def tearDown(self) -> None:
+        if self.test_data_path.exists():
+            rmtree(self.test_data_path)
+
+    def test_update(self):
+        library = catalog.LibraryIndex(self.test_index_path, self.test_library)
+        self.assertEqual(library.update(), 2)
+        self.assertEqual(library.sizes(), {1, 2})
+
+        # Only new and changed files are hashed again
+        self.assertEqual(library.update(), 0)
+        (self.test_library / "2024").mkdir()
+        (self.test_library / "2024" / "c.jpg").write_text("ccc")
+        (self.test_library / "2023" / "b.jpg").unlink()
+        self.assertEqual(library.update(), 1)
+        self.assertEqual(library.sizes(), {1, 3})
+
+    def test_find(self):
+        library = catalog.LibraryIndex(self.test_index_path, self.test_library)
+        library.update()
+        a = self.test_library / "2023" / "a.jpg"
+        found = library.find([(1, utils.checksum_xxhash(a)), (1, "abc"), (5, "abc")])
+        self.assertEqual(found, {(1, utils.checksum_xxhash(a)): str(a)})
+
+        # Other libraries in the same database are not searched
+        other = catalog.LibraryIndex(self.test_index_path, self.test_data_path / "other")
+        self.assertEqual(other.find([(1, utils.checksum_xxhash(a))]), {})
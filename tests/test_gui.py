@@ -5,6 +5,8 @@ Description of script_name.py.
 """
 
 import sys
+from pathlib import Path
+from shutil import rmtree
 from unittest import TestCase
 
 from offload import gui as ogui
@@ -24,3 +26,34 @@ class TestSettingsDialog(TestCase):
         gui.show()
         gui.close()
         # Do not call app.exec_() so the test process does not block or exit
+
+
+class TestSourceScanner(TestCase):
+    def setUp(self):
+        self.test_source = Path("test_data/memoryCard").resolve()
+        self.test_source.mkdir(exist_ok=True, parents=True)
+        for i in range(20):
+            (self.test_source / f"{i:04}.jpg").write_bytes(b"0" * (i + 1))
+
+    def tearDown(self):
+        if self.test_source.exists():
+            rmtree(self.test_source)
+
+    def test_run(self):
+        scanner = ogui.SourceScanner(self.test_source, interval=0)
+        progress = []
+        finished = []
+        scanner._progress_signal.connect(lambda count, size: progress.append((count, size)))
+        scanner._finished_signal.connect(finished.append)
+        scanner.run()
+        self.assertEqual(progress[0][0], 1)
+        self.assertEqual(progress[-1], (20, 210))
+        self.assertEqual(finished[0].count, 20)
+
+    def test_stop(self):
+        scanner = ogui.SourceScanner(self.test_source)
+        finished = []
+        scanner._finished_signal.connect(finished.append)
+        scanner._running = False
+        scanner.run()
+        self.assertFalse(finished)
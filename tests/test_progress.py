@@ -0,0 +1,100 @@
+from unittest import TestCase, mock
+
+from offload.progress import ProgressReporter, ProgressSnapshot, ThroughputEstimator
+
+
+class TestProgressReporter(TestCase):
+    def setUp(self):
+        self.snapshots = []
+        self.reporter = ProgressReporter(
+            self.snapshots.append, bytes_total=400, files_total=2, interval=3600
+        )
+
+    def test_file_progress(self):
+        progress = self.reporter.file("a", targets=2)
+        self.assertIs(self.reporter.file("a"), progress)
+        progress.copied(100)
+        progress.verified(100)
+        snapshot = self.reporter.snapshot()
+        self.assertIsInstance(snapshot, ProgressSnapshot)
+        self.assertEqual(snapshot.bytes_copied, 100)
+        self.assertEqual(snapshot.bytes_verified, 100)
+        # Half of the copy and a quarter of the verification of a 200 byte file
+        self.assertEqual(snapshot.bytes_done, 75)
+
+        self.reporter.finish_file("a", 200)
+        snapshot = self.reporter.snapshot()
+        self.assertEqual(snapshot.bytes_done, 200)
+        self.assertEqual(snapshot.files_done, 1)
+        self.assertEqual(snapshot.percentage, 50)
+
+        # Snapshots don't change afterwards
+        self.reporter.finish_file("b", 200)
+        self.assertEqual(snapshot.bytes_done, 200)
+        with self.assertRaises(AttributeError):
+            snapshot.bytes_done = 0
+
+    def test_reset(self):
+        progress = self.reporter.file("a", targets=2)
+        progress.copied(100)
+        progress.verified(50)
+        # Copied again from the start
+        progress.reset()
+        progress.copied(200)
+        snapshot = self.reporter.snapshot()
+        self.assertEqual(snapshot.bytes_done, 100)
+        self.assertEqual(snapshot.bytes_copied, 300)
+        self.reporter.finish_file("a", 200)
+        self.assertEqual(self.reporter.snapshot().bytes_done, 200)
+
+    def test_coalesced(self):
+        with mock.patch("offload.progress.time.monotonic", return_value=10000.0):
+            progress = self.reporter.file("a")
+            for _ in range(100):
+                progress.copied(1)
+            self.reporter.set_action("Copying")
+        self.assertEqual(len(self.snapshots), 1)
+
+        with mock.patch("offload.progress.time.monotonic", return_value=20000.0):
+            progress.copied(1)
+        self.assertEqual(len(self.snapshots), 2)
+        self.assertEqual(self.snapshots[-1].bytes_copied, 101)
+        self.assertEqual(self.snapshots[-1].action, "Copying")
+
+        self.reporter.finish()
+        self.assertTrue(self.snapshots[-1].is_finished)
+
+
+class TestThroughputEstimator(TestCase):
+    def setUp(self):
+        self.estimator = ThroughputEstimator(half_life=5.0)
+
+    def test_remaining(self):
+        self.assertIsNone(self.estimator.remaining(100, 100, 1))
+
+        # A large file streams at 100 bytes/s and verifies at 200 bytes/s
+        self.estimator.chunk("copy", 100, 1.0, first=True)
+        for _ in range(10):
+            self.estimator.chunk("copy", 100, 1.0)
+            self.estimator.chunk("verify", 200, 1.0)
+        self.assertAlmostEqual(self.estimator.rate("copy"), 100)
+        self.assertAlmostEqual(self.estimator.rate("verify"), 200)
+        self.assertAlmostEqual(self.estimator.remaining(1000, 1000, 0), 15)
+
+        # Small files take 0.5 s each on top of their bytes
+        for _ in range(50):
+            self.estimator.chunk("copy", 10, 0.6, first=True)
+        self.assertAlmostEqual(self.estimator.file_times["copy"], 0.5)
+        self.assertAlmostEqual(self.estimator.remaining(1000, 1000, 10), 20)
+
+    def test_average(self):
+        self.estimator.chunk("copy", 100, 1.0)
+        # A slow chunk as long as the half life counts for half
+        self.estimator.chunk("copy", 50, 5.0)
+        self.assertAlmostEqual(self.estimator.rate("copy"), 55)
+
+    def test_concurrency(self):
+        self.estimator.chunk("copy", 100, 1.0)
+        self.estimator.chunk("verify", 100, 1.0)
+        self.estimator.busy(1.0, 4.0)
+        self.assertAlmostEqual(self.estimator.remaining(400, 400, 0), 2)
@@ -1,11 +1,14 @@
+import errno
 import logging
+import logging.handlers
 import os
 import shutil
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
 from random import randint
 from shutil import rmtree
-from unittest import TestCase, skipIf
+from unittest import TestCase, mock, skipIf
 
 from offload import utils
 from offload.utils import File, FileList
@@ -31,6 +34,27 @@ class TestFile(TestCase):
         print(test_file.size)
         self.assertGreater(test_file.size, 0)
 
+    def test_stat_snapshot(self):
+        self.test_file_path.write_text("test")
+        test_file = File(self.test_file_path)
+        self.assertTrue(test_file.is_file)
+        mtime = self.test_file_path.stat().st_mtime
+        with mock.patch("offload.utils.os.stat", wraps=os.stat) as stat:
+            self.assertEqual(test_file.size, 4)
+            self.assertEqual(test_file.mtime, mtime)
+            stat.assert_not_called()
+
+        # The snapshot is only updated when refreshed
+        self.test_file_path.write_text("destination")
+        self.assertEqual(test_file.size, 4)
+        test_file.refresh()
+        self.assertEqual(test_file.size, 11)
+
+        # Changing the filename takes a new snapshot
+        test_file.increment_filename()
+        self.assertFalse(test_file.is_file)
+        self.assertEqual(test_file.size, 0)
+
     def test_increment_filename(self):
         test_file = File(self.test_file_name)
         self.assertEqual(test_file.filename, "test_file.txt")
@@ -80,6 +104,10 @@ class TestFile(TestCase):
         test_file.set_prefix("")
         self.assertEqual(test_file.prefix, None)
 
+        # Custom templates get every field from the file
+        test_file.set_prefix("{make}_{name}_{seq:02}")
+        self.assertEqual(test_file.prefix, "sony_test_pic_01")
+
     def test_update_relative_path(self):
         test_file = File(self.test_file_path)
         relative_to = Path(__file__).parent
@@ -97,6 +125,27 @@ class TestFile(TestCase):
         test_file = File(self.test_file_path)
         self.assertEqual("9ec9f7918d7dfc40", test_file.checksum)
 
+    def test_checksum_cache(self):
+        self.test_file_path.write_text("test")
+        test_file = File(self.test_file_path)
+        with mock.patch("offload.utils.file_checksum", wraps=utils.file_checksum) as checksum:
+            self.assertEqual("9ec9f7918d7dfc40", test_file.checksum)
+            self.assertEqual("9ec9f7918d7dfc40", test_file.checksum)
+            self.assertEqual(checksum.call_count, 1)
+
+            # Changing the file invalidates the cached checksum
+            self.test_file_path.write_text("destination")
+            self.assertEqual(utils.checksum_xxhash(self.test_file_path), test_file.checksum)
+            self.assertEqual(checksum.call_count, 2)
+
+    def test_set_checksum(self):
+        self.test_file_path.write_text("test")
+        test_file = File(self.test_file_path)
+        with mock.patch("offload.utils.file_checksum", wraps=utils.file_checksum) as checksum:
+            test_file.set_checksum("9ec9f7918d7dfc40")
+            self.assertEqual("9ec9f7918d7dfc40", test_file.checksum)
+            checksum.assert_not_called()
+
     def test_set_name(self):
         test_file = File(self.test_file_path)
         test_file.name = "jens"
@@ -135,6 +184,25 @@ class TestFileList(TestCase):
         test_list = FileList(self.test_directory)
         self.assertIsInstance(test_list.size, int)
 
+    def test_running_totals(self):
+        test_list = FileList(self.test_directory)
+        total = sum(x.stat().st_size for x in self.test_directory.iterdir())
+        self.assertEqual(test_list.size, total)
+        self.assertEqual(test_list.count, 100)
+        self.assertEqual(test_list.avg_file_size, int(total / 100))
+
+        removed = test_list.files[0]
+        test_list.remove(removed)
+        self.assertEqual(test_list.size, total - removed.size)
+        self.assertEqual(test_list.count, 99)
+
+        test_list.append(removed)
+        self.assertEqual(test_list.size, total)
+
+        test_list.filter(lambda f: f.name.endswith("0"))
+        self.assertEqual(test_list.count, 10)
+        self.assertEqual(test_list.size, sum(f.size for f in test_list.files))
+
     def test_sort(self):
         test_list = FileList(self.test_directory)
         list_sorted = sorted(test_list.files, key=lambda f: f.mtime)
@@ -142,6 +210,41 @@ class TestFileList(TestCase):
         self.assertEqual(list_sorted, test_list.files)
 
 
+class TestDirectoryIndex(TestCase):
+    def setUp(self):
+        self.test_directory = Path(__file__).parent / "test_data" / "test_index"
+        self.test_directory.mkdir(exist_ok=True, parents=True)
+        (self.test_directory / "a.txt").write_text("a")
+        (self.test_directory / "folder").mkdir()
+
+    def tearDown(self):
+        rmtree(self.test_directory)
+
+    def test_get(self):
+        index = utils.DirectoryIndex()
+        self.assertEqual(index.get(self.test_directory / "a.txt").size, 1)
+        self.assertIsNone(index.get(self.test_directory / "b.txt"))
+        self.assertIsNone(index.get(self.test_directory / "folder"))
+        self.assertIsNone(index.get(self.test_directory / "missing" / "a.txt"))
+
+        # The folder is only listed once
+        (self.test_directory / "b.txt").write_text("b")
+        with mock.patch("os.scandir") as scandir, mock.patch("os.stat") as os_stat:
+            self.assertIsNone(index.get(self.test_directory / "b.txt"))
+            self.assertIsNotNone(index.get(self.test_directory / "a.txt"))
+            scandir.assert_not_called()
+            os_stat.assert_not_called()
+
+    def test_add(self):
+        index = utils.DirectoryIndex()
+        self.assertIsNone(index.get(self.test_directory / "b.txt"))
+        (self.test_directory / "b.txt").write_text("bb")
+        file = File(self.test_directory / "b.txt")
+        index.add(file)
+        self.assertIs(index.get(self.test_directory / "b.txt"), file)
+        self.assertEqual(index.get(self.test_directory / "b.txt").size, 2)
+
+
 class TestUtils(TestCase):
     def setUp(self):
         # Set variables
@@ -290,7 +393,7 @@ class TestUtils(TestCase):
     def test_destination_folder(self):
         test_file_date = datetime(2020, 3, 7, 19, 21, 33, 167691)
         today = datetime.now()
-        # self.assertEqual(utils.destination_folder(test_file_date, preset="original"), "")
+        self.assertRaises(ValueError, utils.destination_folder, test_file_date, preset="original")
         self.assertEqual(
             utils.destination_folder(test_file_date, preset="taken_date"), "2020/2020-03-07"
         )
@@ -306,6 +409,11 @@ class TestUtils(TestCase):
             f"{test_file_date.year}/{test_file_date.strftime('%m')}",
         )
         self.assertEqual(utils.destination_folder(test_file_date, preset="flat"), "")
+        self.assertEqual(utils.destination_folder(test_file_date, preset="{model}"), "unknown")
+        self.assertEqual(
+            utils.destination_folder(test_file_date, preset="{date.year}/{model}", model="X-T4"),
+            "2020/X-T4",
+        )
 
     def test_random_string(self):
         random_string = utils.random_string(62)
@@ -318,6 +426,32 @@ class TestUtils(TestCase):
         print(result)
         self.assertIsInstance(result, int)
 
+    def test_compile_exclude(self):
+        is_excluded = utils.compile_exclude([".DS_Store", "*.tmp", "live.[0-9].indexHead"])
+        self.assertTrue(is_excluded(".DS_Store"))
+        self.assertTrue(is_excluded("upload.tmp"))
+        self.assertTrue(is_excluded("live.2.indexHead"))
+        self.assertFalse(is_excluded("DSC00001.JPG"))
+        self.assertFalse(utils.compile_exclude()("DSC00001.JPG"))
+
+    def test_scan_files(self):
+        card = self.test_data_path / "card"
+        (card / "DCIM" / "100MSDCF").mkdir(parents=True)
+        (card / ".Spotlight-V100" / "Store-V2").mkdir(parents=True)
+        (card / "DCIM" / "100MSDCF" / "DSC00001.JPG").write_text("a")
+        (card / "DCIM" / "100MSDCF" / "DSC00002.JPG").write_text("b")
+        (card / ".Spotlight-V100" / "Store-V2" / "0.index").write_text("c")
+        (card / ".DS_Store").write_text("d")
+
+        result = utils.scan_files(card, exclude=[".Spotlight-V100", ".DS_Store"])
+        self.assertFalse(isinstance(result, list))
+        self.assertEqual(sorted(e.name for e in result), ["DSC00001.JPG", "DSC00002.JPG"])
+
+        with mock.patch("offload.utils.os.scandir", wraps=os.scandir) as scandir:
+            list(utils.scan_files(card, exclude=[".Spotlight-V100"]))
+            scanned = [Path(c.args[0]).name for c in scandir.call_args_list]
+        self.assertNotIn(".Spotlight-V100", scanned)
+
     def test_exifdata(self):
         result = utils.exifdata(self.test_pic_path)
         print(result)
@@ -352,6 +486,194 @@ class TestUtils(TestCase):
         self.assertEqual(source.stat().st_size, destination.stat().st_size)
         self.assertEqual(utils.checksum_md5(source), utils.checksum_md5(destination))
 
+    def test_checksum_copy(self):
+        source = self.test_data_path / "test_file.txt"
+        source.write_bytes(bytes("0123" * 1024**2, "utf-8"))
+        destination = source.parent / "test_dest" / "test_file.txt"
+        destination.parent.mkdir()
+        result = utils.checksum_copy(source, destination, chunk_size=65536)
+        self.assertEqual(result, utils.checksum_xxhash(source))
+        self.assertEqual(result, utils.checksum_xxhash(destination))
+
+        result = utils.checksum_copy(self.test_file_source, destination, hashtype="md5")
+        self.assertEqual(result, self.test_source_md5)
+
+        progress = mock.Mock()
+        utils.checksum_copy(source, destination, chunk_size=65536, progress=progress)
+        self.assertEqual(progress.call_count, 64)
+        self.assertEqual(sum(c.args[0] for c in progress.call_args_list), source.stat().st_size)
+
+    @skipIf(not utils.KERNEL_COPY, "kernel copy not supported on this platform")
+    def test_kernel_copy_fallback(self):
+        source = self.test_data_path / "test_file.txt"
+        source.write_bytes(os.urandom(1024**2 * 3))
+        destination = self.test_data_path / "test_file_copy.txt"
+        unsupported = OSError(errno.EXDEV, "Invalid cross-device link")
+        with (
+            mock.patch("offload.utils.os.copy_file_range", side_effect=unsupported),
+            mock.patch("offload.utils.os.sendfile", side_effect=unsupported),
+        ):
+            utils.pathlib_copy(source, destination)
+            self.assertEqual(utils.checksum_md5(source), utils.checksum_md5(destination))
+
+            result = utils.checksum_copy(source, destination, chunk_size=65536)
+            self.assertEqual(result, utils.checksum_xxhash(source))
+            self.assertEqual(result, utils.checksum_xxhash(destination))
+
+        # Copy with sendfile when copy_file_range isn't supported
+        with mock.patch("offload.utils.os.copy_file_range", side_effect=unsupported):
+            result = utils.checksum_copy(source, destination, chunk_size=65536)
+            self.assertEqual(result, utils.checksum_xxhash(destination))
+
+        # Files the kernel copies nothing of, like in /proc, are read through Python
+        with (
+            mock.patch("offload.utils.os.copy_file_range", return_value=0),
+            mock.patch("offload.utils.os.sendfile", return_value=0),
+        ):
+            utils.pathlib_copy(source, destination)
+            self.assertEqual(utils.checksum_md5(source), utils.checksum_md5(destination))
+
+            result = utils.checksum_copy(source, destination, chunk_size=65536)
+            self.assertEqual(result, utils.checksum_xxhash(source))
+            self.assertEqual(result, utils.checksum_xxhash(destination))
+        cpuinfo = Path("/proc/cpuinfo")
+        if cpuinfo.exists():
+            utils.pathlib_copy(cpuinfo, destination)
+            self.assertEqual(destination.read_bytes(), cpuinfo.read_bytes())
+            result = utils.checksum_copy(cpuinfo, destination, chunk_size=65536)
+            self.assertEqual(result, utils.checksum_xxhash(destination))
+            self.assertGreater(destination.stat().st_size, 0)
+
+    def test_checksum_copy_multi(self):
+        source = self.test_data_path / "test_file.txt"
+        source.write_bytes(os.urandom(1024**2 * 3 + 5))
+        destinations = [self.test_data_path / f"test_file_{n}.txt" for n in range(3)]
+        # A destination that can't be written doesn't stop the others
+        destinations.append(self.test_data_path / "missing" / "test_file.txt")
+
+        checksum, results = utils.checksum_copy_multi(source, destinations, chunk_size=65536)
+        self.assertEqual(checksum, utils.checksum_xxhash(source))
+        for destination, (dest_checksum, error) in zip(destinations[:3], results, strict=False):
+            self.assertIsNone(error)
+            self.assertEqual(dest_checksum, checksum)
+            self.assertEqual(utils.checksum_xxhash(destination), checksum)
+        self.assertIsNone(results[3][0])
+        self.assertIsInstance(results[3][1], OSError)
+
+    def test_checksum_copy_resume(self):
+        source = self.test_data_path / "test_file.txt"
+        source.write_bytes(os.urandom(1024**2 * 3))
+        destination = self.test_data_path / "test_file_copy.txt"
+        for kernel in (True, False):
+            control = utils.TransferControl()
+            written = []
+
+            def progress(size, control=control, written=written):
+                written.append(size)
+                control.check()
+                control.pause()
+
+            with self.assertRaises(utils.TransferPaused) as paused:
+                utils.checksum_copy(
+                    source, destination, chunk_size=65536, kernel=kernel, progress=progress
+                )
+            self.assertEqual(destination.stat().st_size, sum(written))
+            self.assertEqual(paused.exception.state.offset, sum(written))
+
+            # The paused copy continues without reading what was written again
+            control.resume()
+            checksum = utils.checksum_copy(
+                source,
+                destination,
+                chunk_size=65536,
+                kernel=kernel,
+                progress=written.append,
+                resume=True,
+                state=paused.exception.state,
+            )
+            self.assertEqual(sum(written), source.stat().st_size)
+            self.assertEqual(checksum, utils.checksum_xxhash(source))
+            self.assertEqual(utils.checksum_xxhash(destination), checksum)
+
+            # Without a state the copied part is hashed again, with progress so it can stop
+            os.truncate(destination, 1024**2)
+            rehashed = []
+
+            def stop(size, rehashed=rehashed):
+                rehashed.append(size)
+                raise utils.TransferCancelled()
+
+            with self.assertRaises(utils.TransferCancelled):
+                utils.checksum_copy(
+                    source, destination, chunk_size=65536, kernel=kernel, progress=stop, resume=True
+                )
+            self.assertEqual(rehashed, [65536])
+            checksum = utils.checksum_copy(
+                source, destination, chunk_size=65536, kernel=kernel, resume=True
+            )
+            self.assertEqual(utils.checksum_xxhash(destination), utils.checksum_xxhash(source))
+
+    def test_checksum_copy_checkpoint(self):
+        source = self.test_data_path / "test_file.txt"
+        source.write_bytes(os.urandom(1024**2 * 3))
+        destination = self.test_data_path / "test_file_copy.txt"
+        for kernel in (True, False):
+            checkpoints = []
+            utils.checksum_copy(
+                source,
+                destination,
+                chunk_size=65536,
+                kernel=kernel,
+                checkpoint=checkpoints.append,
+                checkpoint_size=1024**2,
+            )
+            self.assertEqual(checkpoints, [1024**2, 1024**2 * 2, 1024**2 * 3])
+
+    def test_transfer_control(self):
+        control = utils.TransferControl()
+        control.check()
+        control.pause()
+        self.assertTrue(control.paused)
+        self.assertRaises(utils.TransferPaused, control.check)
+        control.resume()
+        control.check()
+        control.cancel()
+        self.assertFalse(control.paused)
+        self.assertRaises(utils.TransferCancelled, control.check)
+
+    def test_clone_file(self):
+        source = self.test_data_path / "test_file.txt"
+        source.write_bytes(os.urandom(1024**2))
+        destination = self.test_data_path / "test_file_clone.txt"
+        if utils.clone_file(source, destination):
+            self.assertEqual(utils.checksum_md5(source), utils.checksum_md5(destination))
+        else:
+            self.assertFalse(destination.exists())
+
+    @skipIf(
+        not os.environ.get("OFFLOAD_CLONE_TEST_PATH"),
+        "set OFFLOAD_CLONE_TEST_PATH to a folder on a btrfs or XFS (e.g. loopback) filesystem",
+    )
+    def test_clone_file_reflink(self):
+        test_path = Path(os.environ["OFFLOAD_CLONE_TEST_PATH"])
+        source = test_path / "ol_test_clone_source.bin"
+        destination = test_path / "ol_test_clone_destination.bin"
+        try:
+            source.write_bytes(os.urandom(1024**2 * 8))
+            self.assertTrue(utils.clone_file(source, destination))
+            self.assertEqual(utils.checksum_md5(source), utils.checksum_md5(destination))
+        finally:
+            source.unlink(missing_ok=True)
+            destination.unlink(missing_ok=True)
+
+    def test_checksum_copy_user_space(self):
+        source = self.test_data_path / "test_file.txt"
+        source.write_bytes(os.urandom(1024**2 + 7))
+        destination = self.test_data_path / "test_file_copy.txt"
+        result = utils.checksum_copy(source, destination, chunk_size=65536, kernel=False)
+        self.assertEqual(result, utils.checksum_xxhash(source))
+        self.assertEqual(result, utils.checksum_xxhash(destination))
+
     def test_time_to_string(self):
         result = utils.time_to_string(123)
         self.assertEqual(result, "2 minutes and 3 seconds")
@@ -360,6 +682,27 @@ class TestUtils(TestCase):
         result = utils.time_to_string(2.44)
         self.assertEqual(result, "2 seconds")
 
+    def test_setup_logger(self):
+        logger = utils.setup_logger("debug")
+        self.addCleanup(utils.setup_logger, "debug")
+        self.assertEqual(len(logger.handlers), 1)
+        self.assertIsInstance(logger.handlers[0], logging.handlers.QueueHandler)
+
+        # Records are queued unformatted, and formatted and written by the listener thread
+        record = logging.LogRecord("", logging.INFO, "", 0, "Queued %s", ("record",), None)
+        self.assertIs(logger.handlers[0].prepare(record), record)
+        self.assertEqual((record.msg, record.args), ("Queued %s", ("record",)))
+        log_path = Path(utils._log_listener.handlers[1].baseFilename)
+        logging.debug("Queued %s", "record")
+        try:
+            raise ValueError("Queued exception")
+        except ValueError:
+            logging.exception("Failed")
+        utils.stop_logger()
+        log = log_path.read_text()
+        self.assertIn("Queued record", log)
+        self.assertIn("ValueError: Queued exception", log)
+
     def test_compare_file_mtime(self):
         a = self.test_file_source
         b = self.test_file_dest
@@ -390,6 +733,70 @@ class TestUtils(TestCase):
         result = utils.compare_files(a, b)
         self.assertTrue(result)
 
+    def test_compare_files_policy(self):
+        self.test_file_dest.write_text("tset")
+        shutil.copystat(self.test_file_source, self.test_file_dest)
+        a = File(self.test_file_source)
+        b = File(self.test_file_dest)
+        # Same size and modification time
+        self.assertTrue(utils.compare_files(a, b, policy="size_mtime"))
+        self.assertFalse(utils.compare_files(a, b, policy="partial_hash"))
+        self.assertFalse(utils.compare_files(a, b, policy="full_hash"))
+        with self.assertRaises(ValueError):
+            utils.compare_files(a, b, policy="name")
+
+    def test_partial_checksum(self):
+        source = self.test_data_path / "test_file.txt"
+        source.write_bytes(bytes(1024 * 10))
+        self.assertEqual(utils.partial_checksum(source), utils.checksum_xxhash(source))
+        other = self.test_data_path / "test_file_other.txt"
+        other.write_bytes(bytes(2000) + b"1" + bytes(1024 * 10 - 2001))
+        self.assertEqual(
+            utils.partial_checksum(source, block_size=1024),
+            utils.partial_checksum(other, block_size=1024),
+        )
+        self.assertNotEqual(utils.partial_checksum(source), utils.partial_checksum(other))
+
+    def test_compare_files_partial(self):
+        source = self.test_data_path / "test_file_large.txt"
+        source.write_bytes(bytes(utils.PARTIAL_BLOCK_SIZE * 4))
+        dest = self.test_data_path / "test_file_large_dest.txt"
+        dest.write_bytes(bytes(utils.PARTIAL_BLOCK_SIZE * 4 - 1) + b"1")
+        a = File(source)
+        b = File(dest)
+
+        # Files that differ at the end are told apart without hashing them in full
+        with mock.patch("offload.utils.file_checksum") as file_checksum:
+            self.assertFalse(utils.compare_files(a, b, policy="full_hash"))
+            file_checksum.assert_not_called()
+
+        # Files that only differ outside the partial blocks need full checksums
+        middle = utils.PARTIAL_BLOCK_SIZE + utils.PARTIAL_BLOCK_SIZE // 4
+        dest.write_bytes(bytes(middle) + b"1" + bytes(utils.PARTIAL_BLOCK_SIZE * 4 - middle - 1))
+        self.assertEqual(a.partial_checksum, File(dest).partial_checksum)
+        self.assertFalse(utils.compare_files(a, b, policy="full_hash"))
+        shutil.copy2(source, dest)
+        self.assertTrue(utils.compare_files(a, b, policy="full_hash"))
+
+    def test_partial_checksum_cache(self):
+        test_file = File(self.test_file_source)
+        with mock.patch("offload.utils.partial_checksum", return_value="abc") as partial:
+            self.assertEqual(test_file.partial_checksum, "abc")
+            self.assertEqual(test_file.partial_checksum, "abc")
+            partial.assert_called_once()
+        # Small files are hashed in full, so the partial checksum is the checksum
+        with mock.patch("offload.utils.file_checksum") as file_checksum:
+            self.assertEqual(test_file.checksum, "abc")
+            file_checksum.assert_not_called()
+
+    def test_copy_metadata(self):
+        os.utime(self.test_file_source, ns=(1_000_000_123, 1_600_000_000_123_456_789))
+        self.test_file_source.chmod(0o600)
+        utils.copy_metadata(self.test_file_source, self.test_file_dest, permissions=True)
+        self.assertEqual(self.test_file_dest.stat().st_mtime_ns, 1_600_000_000_123_456_789)
+        self.assertEqual(self.test_file_dest.stat().st_atime_ns, 1_000_000_123)
+        self.assertEqual(self.test_file_dest.stat().st_mode & 0o777, 0o600)
+
 
 class TestPreset(TestCase):
     def setUp(self) -> None:
@@ -413,3 +820,69 @@ class TestPreset(TestCase):
         self.assertEqual("{date:%y%m%d}", self.preset.prefix("taken_date"))
         self.assertEqual("{date:%y%m%d_%H%M%S}", self.preset.prefix("taken_date_time"))
         self.assertEqual(f"{datetime.now().strftime('%y%m%d')}", self.preset.prefix("offload_date"))
+
+
+class TestTemplate(TestCase):
+    def test_format(self):
+        test_date = datetime(2020, 3, 7, 19, 21, 33, 167691)
+        template = utils.Template("{date.year}/{date:%Y-%m-%d}")
+        self.assertEqual(template.format(date=test_date), "2020/2020-03-07")
+        self.assertEqual(template.fields, {"date"})
+        template = utils.Template("{date:%y%m%d_%H%M%S}_{model}_{seq:04}")
+        self.assertEqual(
+            template.format(date=test_date, model="Canon EOS R5!", seq=7),
+            "200307_192133_Canon_EOS_R5_0007",
+        )
+        template = utils.Template("{today:%Y}", today=test_date)
+        self.assertEqual(template.format(date=datetime.now()), "2020")
+        self.assertEqual(utils.Template(None).format(date=test_date), "")
+        self.assertEqual(utils.Template("raw").format(date=test_date), "raw")
+        # Missing values are filled in from the defaults
+        template = utils.Template("{make}_{seq:03}")
+        self.assertEqual(template.format(date=test_date), "unknown_001")
+        self.assertEqual(template.format(date=test_date, make=None, seq=2), "unknown_002")
+
+    def test_date_cache(self):
+        template = utils.Template("{date:%Y-%m-%d}")
+        template.format(date=datetime(2020, 3, 7, 10))
+        template.format(date=datetime(2020, 3, 7, 19))
+        self.assertEqual(len(template._dates), 1)
+        template = utils.Template("{date.year}/{date.month:02}/{date:%-d %b}")
+        template.format(date=datetime(2020, 3, 7, 10))
+        self.assertEqual(template.format(date=datetime(2020, 3, 7, 19)), "2020/03/7 Mar")
+        self.assertEqual(len(template._dates), 1)
+        # Templates using the time of day are cached per timestamp
+        for fmt, expected in (
+            ("{date:%H%M%S}", "190000"),
+            ("{date:%-H}", "19"),
+            ("{date}", "2020-03-07 19:00:00"),
+            ("{date!s}", "2020-03-07 19:00:00"),
+            ("{date.hour}", "19"),
+            ("{date.timestamp}", None),
+        ):
+            template = utils.Template(fmt)
+            first = template.format(date=datetime(2020, 3, 7, 10))
+            result = template.format(date=datetime(2020, 3, 7, 19))
+            self.assertNotEqual(result, first, msg=fmt)
+            if expected is not None:
+                self.assertEqual(result, expected, msg=fmt)
+
+    @skipIf(not os.environ.get("OFFLOAD_BENCHMARK"), "set OFFLOAD_BENCHMARK=1 to run")
+    def test_benchmark(self):
+        # Prefixes and folders of a million files taken over a few weeks, with a warm cache
+        dates = [datetime(2020, 3, 7) + timedelta(minutes=37 * i) for i in range(1000)]
+        for preset in ("taken_date", "taken_date_time"):
+            for fmt in (utils.PREFIX_TEMPLATES[preset], utils.STRUCTURE_TEMPLATES["taken_date"]):
+                template = utils.Template(fmt)
+                for date in dates:
+                    template.format(date=date)
+                start = time.perf_counter()
+                for i in range(1000000):
+                    template.format(date=dates[i % 1000])
+                rate = 1000000 / (time.perf_counter() - start)
+                print(f"{fmt}: {rate:,.0f} formats/s")
+                self.assertGreater(rate, 1000000)
+
+    def test_unknown_field(self):
+        self.assertRaises(ValueError, utils.Template, "{date.year}/{camera}")
+        self.assertRaises(ValueError, utils.Template, "{date:%Y")